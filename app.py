@@ -1,15 +1,32 @@
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, Response, g, request, jsonify, send_from_directory, stream_with_context
 from service.image_processor import ImageProcessor
 from service.image_describer import ImageDescriber
 from service.sketch_converter import SketchConverter
 from service.file_handler import FileHandler
+from service.job_queue import JobQueue, QueueFullError
+from service.result_cache import ResultCache
+from service.sketch_index import SketchIndex
+from service.sketch_normalizer import SketchNormalizer
+from service.speculative_converter import SpeculativeConverter
+from service.scoring_client import ScoringClient
+from service import telemetry
 from dotenv import load_dotenv
 import os
-from typing import Tuple, Dict, Any
+import json
+import logging
+import queue
+import threading
+import time
+import uuid
+from typing import Callable, Tuple, Dict, Any, Optional
 
 load_dotenv()
+telemetry.configure_logging()
+logger = logging.getLogger(__name__)
 
 app = Flask(__name__, static_folder="static", template_folder="templates")
+app.config["MAX_CONTENT_LENGTH"] = int(float(os.environ.get("MAX_UPLOAD_MB", 16)) * 1024 * 1024)
+STATIC_MAX_AGE = int(os.environ.get("STATIC_MAX_AGE", 3600))
 
 class ImageProcessingService:
     def __init__(self):
@@ -17,48 +34,363 @@ class ImageProcessingService:
         self.image_describer = ImageDescriber()
         self.sketch_converter = SketchConverter()
         self.file_handler = FileHandler()
+        self.sketch_normalizer = SketchNormalizer()
+        self.result_cache = ResultCache.from_env()
+        self.sketch_index = SketchIndex(os.path.join("storage", "index", "sketch_hashes.jsonl")) \
+            if os.getenv("SKETCH_INDEX_ENABLED", "true").lower() == "true" else None
+        self.match_distance = int(os.getenv("SKETCH_MATCH_DISTANCE", 4))
+        self.reuse_generated = os.getenv("SKETCH_REUSE_GENERATED", "false").lower() == "true"
+        self.speculative_converter = SpeculativeConverter()
+        self.speculative_distance = int(os.getenv("SPECULATIVE_DISTANCE", 12))
+        self.baseline_prompt = os.getenv("SPECULATIVE_BASELINE_PROMPT") or None
+        self.scoring_client = ScoringClient()
+        self.ready = False
+
+    def warm_up(self) -> None:
+        """Build the lazily created clients so the first request does not pay for them."""
+        self.image_processor.warm_up()
+        self.ready = True
 
     def process_image(self, request_data) -> Tuple[Dict[str, Any], int]:
         try:
-            image_data = self.file_handler.get_image_data(request_data)
-            filename = self.image_processor.process_base64_image(image_data)
-            filepath = os.path.join(self.image_processor.upload_dir, filename)
-            
-            description = self.image_describer.get_description(filepath)
-            converted_image_url = self.sketch_converter.convert_sketch(filepath, description)
-            
-            self.image_processor.save_generated_image(filepath, converted_image_url)
-
-            uuid = self.image_processor.save_image_data(filepath, converted_image_url, description)
-            
-            return {
+            image_data = self._get_image_data(request_data)
+        except ValueError as e:
+            return {"error": str(e)}, 400
+        return self.run_pipeline(image_data)
+
+    def submit_image(self, request_data, job_queue: JobQueue,
+                     on_event: Optional[Callable[[str, Dict[str, Any]], None]] = None,
+                     score: bool = True) -> Tuple[Dict[str, Any], int]:
+        """Validate the request and queue the pipeline for background execution, scoring it if `score`."""
+        try:
+            image_data = self._get_image_data(request_data)
+        except ValueError as e:
+            return {"error": str(e)}, 400
+        try:
+            job = job_queue.submit(self.run_pipeline, image_data, on_event, score)
+        except QueueFullError as e:
+            return {"error": str(e)}, 503
+        return job.to_dict(), 202
+
+    def run_pipeline(self, image_data: str | bytes,
+                     on_event: Optional[Callable[[str, Dict[str, Any]], None]] = None,
+                     score: bool = False) -> Tuple[Dict[str, Any], int]:
+        """
+        Run the describe → convert → combine → archive pipeline.
+
+        Args:
+            image_data (str | bytes): Base64 image data or raw image bytes.
+            on_event (Callable, optional): Receives (event, data) as each stage completes:
+                "uploaded", "description_delta", "description", "converted", "composite", "archived"
+                and, when scoring, "scoring".
+            score (bool): Score the generation with the scoring service, if one is configured.
+                Scores are computed in the background: "scored" is emitted and the result's
+                `scores` filled in when they arrive, usually after this method has returned, so
+                only callers that keep the result (a job record or a stream) should ask for them.
+
+        Returns:
+            Tuple[Dict[str, Any], int]: The response body and status code.
+        """
+        emit = on_event or (lambda event, data: None)
+        try:
+            image_bytes = self.image_processor.load_image_data(image_data)
+            phash = self.image_processor.compute_perceptual_hash(image_bytes)
+            filename = self.image_processor.save_uploaded_image(image_bytes)
+            emit("uploaded", {"filename": filename})
+            similar_uuid = self._find_similar(phash)
+            upstream_image = self.sketch_normalizer.normalize(image_bytes)
+
+            on_token = (lambda text: emit("description_delta", {"text": text})) if on_event else None
+            description, converted_image_url, generated_image = self._describe_and_convert(
+                upstream_image, phash, similar_uuid, on_token)
+            emit("description", {"description": description})
+            emit("converted", {"image": converted_image_url})
+
+            generated_filename, uuid = self.image_processor.save_results(image_bytes, generated_image, description)
+            emit("composite", {"filename": generated_filename})
+            if self.sketch_index is not None:
+                self.sketch_index.add(phash, uuid)
+            emit("archived", {"uuid": uuid})
+
+            result = {
                 "message": "Image received and processed",
                 "filename": filename,
                 "description": description,
                 "image": converted_image_url,
                 "uuid": uuid,
-            }, 200
+            }
+            if score and self.scoring_client.enabled:
+                # scores arrive after the response; the key exists up front so filling it in
+                # never resizes a dict that is being serialized
+                result["scores"] = None
+                emit("scoring", {"uuid": uuid})
+
+                def on_scores(scores: Optional[Dict[str, float]]) -> None:
+                    result["scores"] = scores
+                    emit("scored", {"uuid": uuid, "scores": scores})
+
+                self.scoring_client.score_later(uuid, on_scores)
+            return result, 200
         except ValueError as e:
+            logger.warning("Pipeline rejected the image: %s", e)
             return {"error": str(e)}, 400
 
-image_processing_service = ImageProcessingService()
+    def _get_image_data(self, request_data) -> str | bytes:
+        with telemetry.stage("intake"):
+            image_data = self.file_handler.get_image_data(request_data)
+        telemetry.PAYLOAD_BYTES.observe(len(image_data), kind="request")
+        return image_data
+
+    def _find_similar(self, phash: int) -> Optional[str]:
+        """Return the UUID of an archived sketch within SKETCH_MATCH_DISTANCE, if any."""
+        if self.sketch_index is None:
+            return None
+        match = self.sketch_index.nearest(phash, self.match_distance)
+        return match[0] if match else None
+
+    def _describe_and_convert(self, image_bytes: bytes, phash: int, similar_uuid: Optional[str],
+                              on_token: Optional[Callable[[str], None]] = None) -> Tuple[str, str, bytes]:
+        if similar_uuid:
+            description = self._describe(image_bytes, similar_uuid, on_token)
+            if self.reuse_generated:
+                archived = self.image_processor.load_archived_file(similar_uuid, "generated.png")
+                if archived is not None:
+                    return description, self.image_processor.archived_file_url(similar_uuid, "generated.png"), archived
+            converted_image_url, generated_image = self._convert(image_bytes, description)
+        else:
+            description, (converted_image_url, generated_image) = self.speculative_converter.run(
+                lambda: self._describe(image_bytes, None, on_token),
+                lambda prompt: self._convert(image_bytes, prompt),
+                self._draft_prompt(image_bytes, phash),
+            )
+        return description, converted_image_url, generated_image
+
+    def _describe(self, image_bytes: bytes, similar_uuid: Optional[str],
+                  on_token: Optional[Callable[[str], None]] = None) -> str:
+        if similar_uuid:
+            archived = self.image_processor.load_archived_file(similar_uuid, "description.md")
+            if archived is not None:
+                return archived.decode("utf-8")
+        return self.result_cache.get_or_compute(
+            "description", image_bytes,
+            lambda: self.image_describer.get_description(image_bytes, on_token),
+            self.image_describer.cache_version,
+        )
+
+    def _convert(self, image_bytes: bytes, description: str) -> Tuple[str, bytes]:
+        """Return the converted image URL and its bytes; a cached URL that has expired is converted again."""
+        return self.result_cache.get_or_compute(
+            "conversion", image_bytes,
+            lambda: self.sketch_converter.convert_sketch(image_bytes, description),
+            self.sketch_converter.cache_version, description,
+            load=lambda url: (url, self.image_processor.fetch_generated_image(url)),
+        )
+
+    def _draft_prompt(self, image_bytes: bytes, phash: int) -> Optional[str]:
+        """Pick a prompt for a speculative draft: a similar sketch's description or the baseline prompt."""
+        if not self.speculative_converter.enabled:
+            return None
+        if self.result_cache.contains("description", image_bytes, self.image_describer.cache_version):
+            return None
+        if self.sketch_index is not None:
+            match = self.sketch_index.nearest(phash, self.speculative_distance)
+            if match:
+                archived = self.image_processor.load_archived_file(match[0], "description.md")
+                if archived is not None:
+                    return archived.decode("utf-8")
+        return self.baseline_prompt
+
+_service: Optional[ImageProcessingService] = None
+_job_queue: Optional[JobQueue] = None
+_init_lock = threading.Lock()
+JOB_MAX_WAIT = float(os.environ.get("JOB_MAX_WAIT", 30))
+
+def get_image_processing_service() -> ImageProcessingService:
+    """Return this process's ImageProcessingService, creating it on first use."""
+    global _service
+    with _init_lock:
+        if _service is None:
+            _service = ImageProcessingService()
+        return _service
+
+def get_job_queue() -> JobQueue:
+    """Return this process's JobQueue, creating it on first use."""
+    global _job_queue
+    with _init_lock:
+        if _job_queue is None:
+            _job_queue = JobQueue()
+        return _job_queue
+
+def warm_up() -> None:
+    """Create the service and its clients; call once per worker process after forking."""
+    get_image_processing_service().warm_up()
+
+def shutdown(timeout: Optional[float] = None) -> bool:
+    """Stop accepting jobs and drain the queue; returns False if jobs were still running at the timeout."""
+    if _job_queue is None:
+        return True
+    return _job_queue.shutdown(timeout)
+
+telemetry.JOB_QUEUE_DEPTH.set_function(lambda: _job_queue.depth() if _job_queue else 0)
+telemetry.UPLOAD_OUTBOX_PENDING.set_function(lambda: _service.image_processor.uploads.pending() if _service else 0)
+
+def _reset_after_fork() -> None:
+    """Forget the parent's service and queue in a forked child: their threads and sockets did not survive the fork."""
+    global _service, _job_queue, _init_lock
+    _service = None
+    _job_queue = None
+    _init_lock = threading.Lock()
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+@app.before_request
+def start_request():
+    """Tag the request with an ID for logs, taken from X-Request-ID when the caller sends one."""
+    g.request_id = request.headers.get("X-Request-ID") or uuid.uuid4().hex
+    g.started_at = time.perf_counter()
+    telemetry.request_id_var.set(g.request_id)
+
+@app.after_request
+def finish_request(response: Response) -> Response:
+    """Count the response and return the request ID to the caller."""
+    endpoint = request.url_rule.rule if request.url_rule else "unmatched"
+    telemetry.HTTP_REQUESTS.inc(endpoint=endpoint, method=request.method, status=response.status_code)
+    telemetry.HTTP_DURATION.observe(time.perf_counter() - g.started_at, endpoint=endpoint)
+    response.headers["X-Request-ID"] = g.request_id
+    return response
+
+@app.route("/metrics")
+def metrics():
+    """Expose pipeline metrics of this process in the Prometheus text format."""
+    return Response(telemetry.REGISTRY.render(), mimetype="text/plain; version=0.0.4")
+
+@app.route("/healthz")
+def healthz():
+    """Liveness probe: the process is up and serving requests."""
+    return jsonify({"status": "ok"}), 200
+
+@app.route("/readyz")
+def readyz():
+    """Readiness probe: the service is built and warmed up in this process."""
+    try:
+        service = get_image_processing_service()
+        if not service.ready:
+            service.warm_up()
+    except Exception as e:
+        return jsonify({"status": "unavailable", "error": str(e)}), 503
+    return jsonify({"status": "ready", "pid": os.getpid()}), 200
 
 @app.route("/assets/<path:filename>")
 def serve_static(filename: str):
     """Serve static files from their respective directories."""
-    return send_from_directory("static", filename)
+    return send_from_directory("static", filename, max_age=STATIC_MAX_AGE)
 
 @app.route("/")
 def index():
     """Serve the main index.html file."""
-    return send_from_directory("static", "index.html")
+    return send_from_directory("static", "index.html", max_age=0)
+
+@app.errorhandler(413)
+def request_too_large(e):
+    """Reject uploads larger than MAX_UPLOAD_MB."""
+    return jsonify({"error": f"Image is too large, the limit is {app.config['MAX_CONTENT_LENGTH']} bytes"}), 413
 
 @app.route("/magic", methods=["POST"])
 def magic():
     """Process the uploaded image and return the result."""
-    result, status_code = image_processing_service.process_image(request)
+    result, status_code = get_image_processing_service().process_image(request)
+    return jsonify(result), status_code
+
+@app.route("/magic/stream", methods=["POST"])
+def magic_stream():
+    """
+    Process the uploaded image, streaming stage events as Server-Sent Events.
+
+    With `?scores=1` the stream stays open after the result until the "scored" event, or until
+    the client disconnects; otherwise it ends with the result and the generation is not scored.
+    """
+    events: "queue.Queue[Tuple[str, Dict[str, Any]]]" = queue.Queue()
+    service = get_image_processing_service()
+    job_queue = get_job_queue()
+    want_scores = request.args.get("scores", "").lower() in ("1", "true")
+    result, status_code = service.submit_image(request, job_queue, lambda event, data: events.put((event, data)),
+                                               score=want_scores)
+    if status_code != 202:
+        return jsonify(result), status_code
+    job = job_queue.get(result["job_id"])
+
+    # a scoring request may take its timeout plus the time to connect
+    scoring_timeout = service.scoring_client.timeout + service.scoring_client.http.connect_timeout
+
+    def generate():
+        yield _sse("queued", result)
+        scoring = False
+        while True:
+            try:
+                event, data = events.get(timeout=0.1)
+            except queue.Empty:
+                if job.finished and events.empty():
+                    break
+                continue
+            if event in ("scoring", "scored"):
+                scoring = event == "scoring"
+            yield _sse(event, data)
+        yield _sse("result" if job.status_code < 400 else "error", job.result)
+        # the scores follow the result; keep the stream open until they arrive. Comment lines
+        # written while waiting fail once the client has gone, which ends the generator early.
+        deadline = time.monotonic() + scoring_timeout
+        while scoring and time.monotonic() < deadline:
+            try:
+                event, data = events.get(timeout=min(1.0, max(deadline - time.monotonic(), 0)))
+            except queue.Empty:
+                yield ": waiting for scores\n\n"
+                continue
+            scoring = event != "scored"
+            yield _sse(event, data)
+
+    return Response(stream_with_context(generate()), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+def _sse(event: str, data: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.route("/cache/stats")
+def cache_stats():
+    """Return hit/miss counters of the description/conversion cache and speculative drafts."""
+    service = get_image_processing_service()
+    stats = service.result_cache.stats()
+    stats["speculative"] = service.speculative_converter.stats()
+    return jsonify(stats), 200
+
+@app.route("/magic/jobs", methods=["POST"])
+def submit_magic_job():
+    """Queue the uploaded image for processing and return a job ID."""
+    result, status_code = get_image_processing_service().submit_image(request, get_job_queue())
     return jsonify(result), status_code
 
+@app.route("/magic/jobs/<job_id>")
+def magic_job_status(job_id: str):
+    """Return the current status of a queued job."""
+    job = get_job_queue().get(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown job ID"}), 404
+    status = job.to_dict()
+    if job.result and "scores" in job.result:
+        status["scores"] = job.result["scores"]
+    return jsonify(status), 200
+
+@app.route("/magic/jobs/<job_id>/result")
+def magic_job_result(job_id: str):
+    """Return the job result, optionally long-polling up to `wait` seconds."""
+    job = get_job_queue().get(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown job ID"}), 404
+    wait = min(request.args.get("wait", 0, type=float), JOB_MAX_WAIT)
+    if not job.wait(max(wait, 0)):
+        return jsonify(job.to_dict()), 202
+    return jsonify(job.result), job.status_code
+
 if __name__ == "__main__":
     port = int(os.environ.get('PORT', 5050))
-    app.run(host="0.0.0.0", port=port, debug=True)
\ No newline at end of file
+    warm_up()
+    app.run(host="0.0.0.0", port=port, debug=os.environ.get("FLASK_DEBUG", "false").lower() == "true")
\ No newline at end of file
@@ -0,0 +1,65 @@
+"""
+Gunicorn settings for production serving: `gunicorn app:app` picks this file up automatically.
+
+Every setting can be overridden with an environment variable. The pipeline mostly waits on
+WorqHat and S3, so one worker process serves many requests at once with threads. Async jobs
+(`POST /magic/jobs`) live in the memory of the worker that accepted them, so raising
+GUNICORN_WORKERS above 1 needs sticky sessions for `GET /magic/jobs/<job_id>`.
+"""
+import os
+import signal
+import time
+
+bind = os.environ.get("GUNICORN_BIND", f"0.0.0.0:{os.environ.get('PORT', 5050)}")
+workers = int(os.environ.get("GUNICORN_WORKERS", 1))
+worker_class = os.environ.get("GUNICORN_WORKER_CLASS", "gthread")
+threads = int(os.environ.get("GUNICORN_THREADS", 32))
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 180))
+graceful_timeout = int(os.environ.get("GUNICORN_GRACEFUL_TIMEOUT", 120))
+keepalive = int(os.environ.get("GUNICORN_KEEPALIVE", 5))
+max_requests = int(os.environ.get("GUNICORN_MAX_REQUESTS", 0))
+max_requests_jitter = int(os.environ.get("GUNICORN_MAX_REQUESTS_JITTER", 0))
+accesslog = os.environ.get("GUNICORN_ACCESS_LOG", "-")
+errorlog = "-"
+
+
+def post_fork(server, worker):
+    """Build the service and its clients in the new worker before it accepts requests."""
+    from app import warm_up
+    try:
+        warm_up()
+    except Exception as e:
+        worker.log.warning("Warm-up failed, services will be created on first request: %s", e)
+
+
+def post_worker_init(worker):
+    """Note when SIGTERM arrives: the arbiter kills the worker `graceful_timeout` seconds later."""
+    handle_exit = worker.handle_exit
+
+    def on_term(sig, frame):
+        _set_drain_deadline(worker)
+        handle_exit(sig, frame)
+
+    signal.signal(signal.SIGTERM, on_term)
+
+
+def worker_int(worker):
+    _set_drain_deadline(worker)
+
+
+def worker_exit(server, worker):
+    """Let queued and running pipeline jobs finish in what is left of the graceful timeout."""
+    if worker.pid != os.getpid():
+        return  # the arbiter reaping a worker that is already gone
+    from app import shutdown
+    # in-flight requests already used part of the budget; keep a moment for the final log lines
+    deadline = getattr(worker, "drain_deadline", None) or time.monotonic() + graceful_timeout
+    remaining = max(0.0, deadline - time.monotonic() - 1)
+    if not shutdown(remaining):
+        worker.log.warning("Pipeline jobs still running after the %ss graceful timeout, exiting anyway",
+                           graceful_timeout)
+
+
+def _set_drain_deadline(worker):
+    if getattr(worker, "drain_deadline", None) is None:
+        worker.drain_deadline = time.monotonic() + graceful_timeout
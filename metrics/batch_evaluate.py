@@ -0,0 +1,297 @@
+"""
+Score the whole generation archive with every metric model loaded once.
+
+Usage:
+    python -m metrics.batch_evaluate --output storage/metrics/results.csv
+    python -m metrics.batch_evaluate --s3-prefix data --output results.csv --parquet results.parquet
+    python -m metrics.batch_evaluate --metrics ssim,clip --output storage/metrics/ssim_clip.csv
+
+Generations are scored in batches (`--batch-size`): every calculator prepares the whole batch
+at once, so CLIP, YOLO and the NER pipeline run one batched forward pass per batch. Results are
+appended to the CSV one row per UUID, so the CSV doubles as the checkpoint: rerunning the same
+command skips UUIDs that are already in it.
+"""
+
+import argparse
+import csv
+import logging
+import os
+import tempfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple, TypeVar
+
+from tqdm import tqdm
+
+from .metrics_collector import MetricCalculator, MetricsCollector, build_calculators, latency_keys, metric_keys
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_FILES = ("original.png", "generated.png", "description.txt")
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+class LocalSource:
+    """Iterates over UUID folders of a local archive directory."""
+
+    def __init__(self, data_dir: str = os.path.join("storage", "data")):
+        self.data_dir = data_dir
+
+    def uuids(self) -> Iterator[str]:
+        with os.scandir(self.data_dir) as entries:
+            names = sorted(entry.name for entry in entries if entry.is_dir())
+        yield from names
+
+    def fetch(self, uuid: str) -> Tuple[str, Optional[tempfile.TemporaryDirectory]]:
+        """Return the directory holding the UUID folder, and nothing to clean up."""
+        return self.data_dir, None
+
+
+class S3Source:
+    """Iterates over UUID prefixes in S3, downloading each generation to a temporary directory."""
+
+    def __init__(self, prefix: str = "data"):
+        from service.s3_uploader import S3Uploader
+
+        self.prefix = prefix
+        self.s3u = S3Uploader()
+
+    def uuids(self) -> Iterator[str]:
+        yield from self.s3u.list_directories(self.prefix)
+
+    def fetch(self, uuid: str) -> Tuple[str, Optional[tempfile.TemporaryDirectory]]:
+        """Download the archived files and return the directory holding the UUID folder."""
+        tmp = tempfile.TemporaryDirectory(prefix="metrics-")
+        try:
+            os.makedirs(os.path.join(tmp.name, uuid))
+            for filename in ARCHIVE_FILES:
+                content = self.s3u.download(f"{self.prefix.strip('/')}/{uuid}", filename)
+                if content is None:
+                    raise FileNotFoundError(f"{uuid}/{filename} is missing in S3")
+                with open(os.path.join(tmp.name, uuid, filename), "wb") as f:
+                    f.write(content)
+        except BaseException:
+            tmp.cleanup()
+            raise
+        return tmp.name, tmp
+
+
+class BatchEvaluator:
+    """Scores many archived generations with shared metric calculators and a CSV checkpoint."""
+
+    def __init__(self, source, output_path: str,
+                 calculators: Optional[Tuple[Dict[str, MetricCalculator], Dict[str, MetricCalculator]]] = None,
+                 prefetch: int = 4, checkpoint_every: int = 20, batch_size: int = 16):
+        """
+        Initialize the BatchEvaluator.
+
+        Args:
+            source (LocalSource | S3Source): Where to read generations from.
+            output_path (str): CSV file receiving one row per UUID; also used to resume.
+            calculators (Tuple, optional): Shared calculators from `build_calculators`.
+            prefetch (int): Generations fetched ahead of scoring (matters for S3).
+            checkpoint_every (int): Rows between flushes of the CSV to disk.
+            batch_size (int): Generations prepared together by each calculator.
+        """
+        self.source = source
+        self.output_path = output_path
+        self.calculators_im_desc, self.calculators_im_im = calculators or build_calculators()
+        self.columns = ["uuid", "status", "error"] + metric_keys(self.calculators_im_desc, self.calculators_im_im) \
+            + latency_keys(self.calculators_im_desc, self.calculators_im_im)
+        self.prefetch = prefetch
+        self.checkpoint_every = checkpoint_every
+        self.batch_size = max(1, batch_size)
+
+    def completed(self, retry_errors: bool = False) -> Set[str]:
+        """Return the UUIDs already in the output CSV, excluding failed ones if `retry_errors`."""
+        if not os.path.exists(self.output_path):
+            return set()
+        with open(self.output_path, newline="", encoding="utf-8") as f:
+            return {row["uuid"] for row in csv.DictReader(f)
+                    if not (retry_errors and row["status"] != "ok")}
+
+    def run(self, limit: Optional[int] = None, retry_errors: bool = False) -> int:
+        """
+        Score every UUID of the source that is not in the checkpoint yet.
+
+        Args:
+            limit (int, optional): Stop after this many new UUIDs.
+            retry_errors (bool): Score UUIDs that failed in an earlier run again.
+
+        Returns:
+            int: The number of rows written.
+        """
+        self._drop_partial_row()
+        done = self.completed(retry_errors)
+        pending = (uuid for uuid in self.source.uuids() if uuid not in done)
+        if limit is not None:
+            pending = (uuid for _, uuid in zip(range(limit), pending))
+
+        os.makedirs(os.path.dirname(self.output_path) or ".", exist_ok=True)
+        write_header = not os.path.exists(self.output_path) or os.path.getsize(self.output_path) == 0
+        columns = self.columns if write_header else self._existing_columns()
+        written = 0
+        with open(self.output_path, "a", newline="", encoding="utf-8") as f:
+            writer = csv.DictWriter(f, fieldnames=columns, extrasaction="ignore")
+            if write_header:
+                writer.writeheader()
+            fetched = _prefetch(pending, self._fetch, self.prefetch)
+            with tqdm(desc="Scoring", unit="item") as progress:
+                for batch in _batches(fetched, self.batch_size):
+                    for row in self._score_batch(batch):
+                        writer.writerow(row)
+                        written += 1
+                        if written % self.checkpoint_every == 0:
+                            f.flush()
+                            os.fsync(f.fileno())
+                    progress.update(len(batch))
+        return written
+
+    def _drop_partial_row(self) -> None:
+        """Cut off a last row left without its line end by a crash, so appended rows start on a new line."""
+        if not os.path.exists(self.output_path):
+            return
+        with open(self.output_path, "rb+") as f:
+            end = f.seek(0, os.SEEK_END)
+            position = end
+            while position > 0:
+                start = max(0, position - 65536)
+                f.seek(start)
+                newline = f.read(position - start).rfind(b"\n")
+                if newline >= 0:
+                    position = start + newline + 1
+                    break
+                position = start
+            if position < end:
+                logger.warning("Dropping an incomplete last row of %s", self.output_path)
+                f.truncate(position)
+
+    def _existing_columns(self) -> List[str]:
+        """Return the header of the existing CSV, so appended rows line up with earlier ones."""
+        with open(self.output_path, newline="", encoding="utf-8") as f:
+            return next(csv.reader(f))
+
+    def _fetch(self, uuid: str):
+        try:
+            return self.source.fetch(uuid)
+        except Exception as e:
+            return e
+
+    def _score_batch(self, batch: List[Tuple[str, object]]) -> List[Dict[str, object]]:
+        """Prepare every calculator on the whole batch, then collect each generation's metrics."""
+        rows: Dict[str, Dict[str, object]] = {}
+        collectors: Dict[str, MetricsCollector] = {}
+        try:
+            for uuid, fetched in batch:
+                if isinstance(fetched, Exception):
+                    logger.warning("Skipping %s: %s", uuid, fetched)
+                    rows[uuid] = {"uuid": uuid, "status": "error", "error": _one_line(fetched)}
+                    continue
+                data_dir, _ = fetched
+                try:
+                    collectors[uuid] = MetricsCollector(uuid, self.calculators_im_desc, self.calculators_im_im,
+                                                        data_dir=data_dir)
+                except Exception as e:
+                    logger.warning("Failed to score %s: %s", uuid, e)
+                    rows[uuid] = {"uuid": uuid, "status": "error", "error": _one_line(e)}
+
+            items = [(uuid, collector.image_paths, collector.description) for uuid, collector in collectors.items()]
+            for name, calculator in [*self.calculators_im_desc.items(), *self.calculators_im_im.items()]:
+                try:
+                    with calculator.lock:
+                        calculator.prepare_batch(items)
+                except Exception as e:
+                    # each collect() below prepares its own generation again
+                    logger.error("Error preparing metric %s for a batch: %s", name, e)
+
+            for uuid, collector in collectors.items():
+                try:
+                    row = collector.collect().row()
+                    rows[uuid] = {"uuid": uuid, "status": "ok", **row, "error": _one_line(row["error"])}
+                except Exception as e:
+                    logger.warning("Failed to score %s: %s", uuid, e)
+                    rows[uuid] = {"uuid": uuid, "status": "error", "error": _one_line(e)}
+        finally:
+            for _, fetched in batch:
+                if not isinstance(fetched, Exception) and fetched[1] is not None:
+                    fetched[1].cleanup()
+        return [rows[uuid] for uuid, _ in batch]
+
+
+def _one_line(error: object) -> str:
+    """Collapse an error message onto one line, so every CSV row ends at the first line break."""
+    return " ".join(str(error).split())
+
+
+def _batches(items: Iterable[T], size: int) -> Iterator[List[T]]:
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _prefetch(items: Iterable[T], fetch: Callable[[T], R], depth: int) -> Iterator[Tuple[T, R]]:
+    """Yield (item, fetch(item)) in order while up to `depth` later items are fetched in the background."""
+    if depth <= 0:
+        for item in items:
+            yield item, fetch(item)
+        return
+    with ThreadPoolExecutor(max_workers=depth, thread_name_prefix="metrics-fetch") as executor:
+        window = deque()
+        for item in items:
+            window.append((item, executor.submit(fetch, item)))
+            if len(window) > depth:
+                item, future = window.popleft()
+                yield item, future.result()
+        while window:
+            item, future = window.popleft()
+            yield item, future.result()
+
+
+def to_parquet(csv_path: str, parquet_path: str) -> None:
+    """Convert the results CSV to Parquet, keeping the latest row per UUID."""
+    import pandas as pd
+
+    frame = pd.read_csv(csv_path, dtype={"uuid": str, "status": str, "error": str})
+    frame = frame.drop_duplicates("uuid", keep="last")
+    frame.to_parquet(parquet_path, index=False)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Score archived generations with the selected metrics.")
+    parser.add_argument("--data-dir", default=os.path.join("storage", "data"),
+                        help="Local archive with one folder per UUID (default: storage/data).")
+    parser.add_argument("--s3-prefix", help="Read generations from this S3 prefix (e.g. data) instead.")
+    parser.add_argument("--output", default=os.path.join("storage", "metrics", "results.csv"),
+                        help="CSV results file, also used as the checkpoint.")
+    parser.add_argument("--parquet", help="Also write the results to this Parquet file when done.")
+    parser.add_argument("--metrics", help="Comma-separated metrics to compute, e.g. ssim,clip (default: all); "
+                                          "only their models are loaded. Use a separate --output per selection.")
+    parser.add_argument("--limit", type=int, help="Score at most this many new UUIDs.")
+    parser.add_argument("--retry-errors", action="store_true", help="Score UUIDs that failed before again.")
+    parser.add_argument("--prefetch", type=int, default=4, help="Generations fetched ahead (default: 4).")
+    parser.add_argument("--checkpoint-every", type=int, default=20, help="Rows between CSV flushes (default: 20).")
+    parser.add_argument("--batch-size", type=int, default=16,
+                        help="Generations prepared together by each model (default: 16).")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO").upper(),
+                        format="%(asctime)s %(levelname)s %(name)s %(message)s")
+    source = S3Source(args.s3_prefix) if args.s3_prefix else LocalSource(args.data_dir)
+    evaluator = BatchEvaluator(source, args.output, build_calculators(args.metrics), prefetch=args.prefetch,
+                               checkpoint_every=args.checkpoint_every, batch_size=args.batch_size)
+    written = evaluator.run(limit=args.limit, retry_errors=args.retry_errors)
+    logger.info("Scored %d generations into %s", written, args.output)
+    if args.parquet:
+        to_parquet(args.output, args.parquet)
+        logger.info("Wrote %s", args.parquet)
+
+
+if __name__ == "__main__":
+    main()
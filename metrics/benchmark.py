@@ -0,0 +1,384 @@
+"""
+Offline benchmark of the metric calculators on synthetic sketch/generation pairs.
+
+Usage:
+    python -m metrics.benchmark --output storage/metrics/bench.json
+    python -m metrics.benchmark --metrics ssim,clip --resolutions 256,1024 --batch-sizes 1,16 --pairs 32
+    METRICS_BACKEND=onnx-int8 python -m metrics.benchmark --compare storage/metrics/bench.json
+
+Fixtures are generated from a fixed seed: stroke sketches, "generated" images derived from
+them (filled, recolored, blurred and noisy), and template descriptions. Each metric runs in
+a fresh subprocess, so its load time and memory do not depend on models that other metrics
+loaded (CLIP similarity and FID share one encoder within a process). Every timed call starts
+with cold caches, and the persistent embedding store is disabled, so each call pays for
+decoding and inference. Models must already be in the local caches (HuggingFace,
+ultralytics and NLTK data); nothing else needs network access.
+
+For each metric the report holds the model load time and, per mode and resolution, latency
+percentiles, throughput and peak RSS. In "single" mode each call scores one item through
+the metric's public method; in "batch" mode each call prepares a batch with
+`prepare_batch` and then computes every item, as the scoring service does.
+"""
+
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import sys
+import tempfile
+import threading
+import time
+import uuid as uuid_lib
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+Item = Tuple[str, Dict[str, str], str]
+
+OBJECTS = ("cat", "dog", "house", "tree", "car", "bicycle", "person", "boat", "chair", "cup", "bird", "clock")
+COLORS = ("red", "blue", "green", "yellow", "black", "orange")
+PLACES = ("next to", "behind", "in front of", "under", "on top of")
+
+
+def make_fixtures(directory: str, pairs: int, resolution: int, seed: int = 0) -> List[Item]:
+    """
+    Write synthetic generations in the archive layout (<uuid>/original.png, generated.png, description.txt).
+
+    Returns:
+        List[Tuple[str, Dict[str, str], str]]: (uuid, image_paths, description) per generation.
+    """
+    import cv2
+
+    rng = np.random.default_rng(seed * 100003 + resolution)
+    items = []
+    for index in range(pairs):
+        uuid = str(uuid_lib.UUID(int=int(rng.integers(0, 2 ** 63)) << 64 | index))
+        folder = os.path.join(directory, uuid)
+        os.makedirs(folder, exist_ok=True)
+
+        sketch = np.full((resolution, resolution, 3), 255, np.uint8)
+        thickness = max(1, resolution // 200)
+        for _ in range(int(rng.integers(8, 24))):
+            points = rng.integers(0, resolution, (int(rng.integers(2, 6)), 2)).astype(np.int32)
+            cv2.polylines(sketch, [points], bool(rng.integers(0, 2)), (0, 0, 0), thickness, cv2.LINE_AA)
+        for _ in range(int(rng.integers(1, 4))):
+            center = tuple(int(v) for v in rng.integers(0, resolution, 2))
+            cv2.circle(sketch, center, int(rng.integers(resolution // 20, resolution // 5)), (0, 0, 0), thickness)
+
+        generated = cv2.GaussianBlur(sketch, (0, 0), max(1.0, resolution / 256))
+        tint = rng.integers(0, 255, 3).astype(np.float32)
+        generated = (generated.astype(np.float32) * 0.6 + tint * 0.4
+                     + rng.normal(0, 12, generated.shape)).clip(0, 255).astype(np.uint8)
+
+        subject, other = rng.choice(len(OBJECTS), 2, replace=False)
+        description = (f"A {COLORS[int(rng.integers(len(COLORS)))]} {OBJECTS[subject]} "
+                       f"{PLACES[int(rng.integers(len(PLACES)))]} a {OBJECTS[other]}, drawn as a simple sketch.")
+        image_paths = {"original": os.path.join(folder, "original.png"),
+                       "generated": os.path.join(folder, "generated.png")}
+        cv2.imwrite(image_paths["original"], sketch)
+        cv2.imwrite(image_paths["generated"], generated)
+        with open(os.path.join(folder, "description.txt"), "w", encoding="utf-8") as f:
+            f.write(description)
+        items.append((uuid, image_paths, description))
+    return items
+
+
+class PeakRSS:
+    """Samples the resident set size in the background and keeps the peak, in bytes."""
+
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def __enter__(self) -> "PeakRSS":
+        self.peak = current_rss()
+        self._thread = threading.Thread(target=self._sample, name="bench-rss", daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, current_rss())
+
+    def _sample(self) -> None:
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, current_rss())
+
+
+def current_rss() -> int:
+    """Current resident set size in bytes (psutil, or the process peak from getrusage without it)."""
+    try:
+        import psutil
+
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        import resource
+
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == "darwin" else 1024)
+
+
+def clear_caches(calculator) -> None:
+    """Drop every memoized result a calculator could reuse, so the next call runs cold."""
+    from .image_cache import decoded_images
+
+    decoded_images.clear()
+    for owner in ("clip_similarity", "fid_metric"):
+        if hasattr(calculator, owner):
+            getattr(calculator, owner).embedder.clear_cache()
+    if hasattr(calculator, "object_detection"):
+        calculator.object_detection.clear_cache()
+
+
+def summarize(latencies: Sequence[float], items: int, elapsed: float) -> Dict[str, float]:
+    values = np.array(latencies) * 1000
+    return {
+        "calls": len(values),
+        "items": items,
+        "mean_ms": round(float(values.mean()), 3),
+        "p50_ms": round(float(np.percentile(values, 50)), 3),
+        "p90_ms": round(float(np.percentile(values, 90)), 3),
+        "p99_ms": round(float(np.percentile(values, 99)), 3),
+        "max_ms": round(float(values.max()), 3),
+        "throughput_per_s": round(items / elapsed, 3) if elapsed else None,
+    }
+
+
+def bench_single(calculator, image_image: bool, items: List[Item]) -> Tuple[List[float], int]:
+    """Score items one at a time through `compute`: the generated image against the description or the original."""
+    latencies = []
+    for _, image_paths, description in items:
+        clear_caches(calculator)
+        started = time.perf_counter()
+        if image_image:
+            calculator.compute(image_paths["original"], image_paths["generated"])
+        else:
+            calculator.compute(image_paths["generated"], description)
+        latencies.append(time.perf_counter() - started)
+    return latencies, len(items)
+
+
+def bench_batch(calculator, image_image: bool, items: List[Item], batch_size: int) -> Tuple[List[float], int]:
+    """Score items in batches: `prepare_batch`, then `compute` for every item of the batch."""
+    latencies = []
+    for start in range(0, len(items), batch_size):
+        batch = items[start:start + batch_size]
+        clear_caches(calculator)
+        started = time.perf_counter()
+        calculator.prepare_batch(batch)
+        for _, image_paths, description in batch:
+            if image_image:
+                calculator.compute(image_paths["original"], image_paths["generated"])
+            else:
+                calculator.compute(image_paths["generated"], description)
+        latencies.append(time.perf_counter() - started)
+    return latencies, len(items)
+
+
+def run_benchmark(metrics: Optional[str], resolutions: Sequence[int], pairs: int, batch_sizes: Sequence[int],
+                  repeat: int = 1, seed: int = 0, workdir: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Benchmark the selected metrics, each in its own subprocess.
+
+    Args:
+        metrics (str, optional): Comma-separated metric names or aliases; all by default.
+        resolutions (Sequence[int]): Square fixture sizes in pixels.
+        pairs (int): Generations per resolution.
+        batch_sizes (Sequence[int]): Batch sizes for the batch mode.
+        repeat (int): Passes over the fixtures per mode.
+        seed (int): Fixture seed.
+        workdir (str, optional): Where to write fixtures; a temporary directory by default.
+
+    Returns:
+        Dict[str, Any]: The report: environment, config, per-metric load cost and result records.
+    """
+    from .metrics_collector import resolve_metrics
+
+    names = resolve_metrics(metrics)
+    tmp = None if workdir else tempfile.TemporaryDirectory(prefix="metrics-bench-")
+    root = workdir or tmp.name
+    # stored embeddings would turn inference into reads; the subprocesses inherit the setting
+    previous_store = os.environ.get("CLIP_EMBEDDING_STORE")
+    os.environ["CLIP_EMBEDDING_STORE"] = "none"
+    env = environment()
+    try:
+        fixtures = {resolution: make_fixtures(os.path.join(root, str(resolution)), pairs, resolution, seed)
+                    for resolution in resolutions}
+        load, results = {}, []
+        for name in names:
+            with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn"),
+                                     initializer=_init_worker, initargs=(logging.getLogger().level,)) as executor:
+                load[name], metric_results, metric_env = executor.submit(
+                    bench_metric, name, fixtures, batch_sizes, repeat).result()
+            results += metric_results
+            env.update(metric_env)
+    finally:
+        if previous_store is None:
+            os.environ.pop("CLIP_EMBEDDING_STORE", None)
+        else:
+            os.environ["CLIP_EMBEDDING_STORE"] = previous_store
+        if tmp is not None:
+            tmp.cleanup()
+
+    return {
+        "environment": env,
+        "config": {"metrics": names, "resolutions": list(resolutions), "pairs": pairs,
+                   "batch_sizes": list(batch_sizes), "repeat": repeat, "seed": seed},
+        "load": load,
+        "results": results,
+    }
+
+
+def bench_metric(name: str, fixtures: Dict[int, List[Item]], batch_sizes: Sequence[int],
+                 repeat: int = 1) -> Tuple[Dict[str, Any], List[Dict[str, Any]], Dict[str, Any]]:
+    """
+    Load one metric and time it on every fixture set; meant to run in a fresh process.
+
+    Returns:
+        Tuple: The load record, the result records and the torch settings, if torch was loaded.
+    """
+    from .metrics_collector import IMAGE_IMAGE, METRICS
+
+    spec = METRICS[name]
+    image_image = spec.kind == IMAGE_IMAGE
+    with PeakRSS() as rss:
+        rss_before = current_rss()
+        started = time.perf_counter()
+        calculator = spec.factory()
+        load = {"seconds": round(time.perf_counter() - started, 3),
+                "rss_delta_mb": round((current_rss() - rss_before) / 2 ** 20, 1),
+                "peak_rss_mb": None}
+    load["peak_rss_mb"] = round(rss.peak / 2 ** 20, 1)
+    logger.info("Loaded %s in %.2fs", name, load["seconds"])
+
+    # first calls pay one-off costs (lazy layers, allocator growth); keep them out of the numbers
+    first = next(iter(fixtures.values()))[:1]
+    warm_started = time.perf_counter()
+    bench_single(calculator, image_image, first)
+    load["first_call_seconds"] = round(time.perf_counter() - warm_started, 3)
+
+    results = []
+    modes = [("single", 1)] + [("batch", size) for size in batch_sizes]
+    for resolution, items in fixtures.items():
+        for mode, batch_size in modes:
+            latencies, count = [], 0
+            with PeakRSS() as rss:
+                started = time.perf_counter()
+                for _ in range(repeat):
+                    if mode == "single":
+                        run_latencies, run_count = bench_single(calculator, image_image, items)
+                    else:
+                        run_latencies, run_count = bench_batch(calculator, image_image, items, batch_size)
+                    latencies += run_latencies
+                    count += run_count
+                elapsed = time.perf_counter() - started
+            record = {"metric": name, "mode": mode, "batch_size": batch_size, "resolution": resolution,
+                      **summarize(latencies, count, elapsed), "peak_rss_mb": round(rss.peak / 2 ** 20, 1)}
+            results.append(record)
+            logger.info("%s %s/%d @%dpx: p50 %.1fms, %.1f items/s", name, mode, batch_size, resolution,
+                        record["p50_ms"], record["throughput_per_s"])
+    return load, results, _torch_environment()
+
+
+def _init_worker(level: int) -> None:
+    logging.basicConfig(level=level, format="%(asctime)s %(levelname)s %(name)s %(message)s")
+
+
+def environment() -> Dict[str, Any]:
+    env = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "processor": platform.processor() or platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "backend": os.getenv("METRICS_BACKEND", "torch"),
+    }
+    env.update(_torch_environment())
+    return env
+
+
+def _torch_environment() -> Dict[str, Any]:
+    if "torch" not in sys.modules:
+        return {}
+    torch = sys.modules["torch"]
+    return {"torch": torch.__version__, "torch_threads": torch.get_num_threads(), "cuda": torch.cuda.is_available()}
+
+
+def compare(report: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[Dict[str, Any]]:
+    """
+    Compare result records with a baseline report by (metric, mode, batch size, resolution).
+
+    Returns:
+        List[Dict[str, Any]]: One entry per matched record with the p50 latency and throughput
+            ratios (current / baseline) and whether p50 regressed by more than `tolerance`.
+    """
+    def key(record):
+        return record["metric"], record["mode"], record["batch_size"], record["resolution"]
+
+    previous = {key(record): record for record in baseline.get("results", [])}
+    rows = []
+    for record in report["results"]:
+        old = previous.get(key(record))
+        if old is None:
+            continue
+        p50_ratio = record["p50_ms"] / old["p50_ms"] if old["p50_ms"] else None
+        throughput_ratio = record["throughput_per_s"] / old["throughput_per_s"] if old["throughput_per_s"] else None
+        rows.append({"metric": record["metric"], "mode": record["mode"], "batch_size": record["batch_size"],
+                     "resolution": record["resolution"],
+                     "p50_ratio": None if p50_ratio is None else round(p50_ratio, 3),
+                     "throughput_ratio": None if throughput_ratio is None else round(throughput_ratio, 3),
+                     "regressed": p50_ratio is not None and p50_ratio > 1 + tolerance})
+    return rows
+
+
+def _ints(value: str) -> List[int]:
+    return [int(part) for part in value.split(",") if part.strip()]
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Benchmark the metric calculators on synthetic fixtures.")
+    parser.add_argument("--metrics", help="Comma-separated metrics, e.g. ssim,clip (default: all).")
+    parser.add_argument("--resolutions", type=_ints, default=[256, 512, 1024],
+                        help="Square fixture sizes in pixels (default: 256,512,1024).")
+    parser.add_argument("--pairs", type=int, default=16, help="Generations per resolution (default: 16).")
+    parser.add_argument("--batch-sizes", type=_ints, default=[8], help="Batch mode sizes (default: 8).")
+    parser.add_argument("--repeat", type=int, default=1, help="Passes over the fixtures per mode (default: 1).")
+    parser.add_argument("--seed", type=int, default=0, help="Fixture seed (default: 0).")
+    parser.add_argument("--workdir", help="Keep the fixtures in this directory instead of a temporary one.")
+    parser.add_argument("--output", help="Write the JSON report to this file (default: stdout).")
+    parser.add_argument("--compare", help="Baseline JSON report; exit with status 1 if p50 latency regressed.")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="Allowed p50 slowdown against the baseline (default: 0.2 = 20%%).")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO").upper(),
+                        format="%(asctime)s %(levelname)s %(name)s %(message)s")
+    report = run_benchmark(args.metrics, args.resolutions, args.pairs, args.batch_sizes, args.repeat,
+                           args.seed, args.workdir)
+
+    regressed = False
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            report["comparison"] = compare(report, json.load(f), args.tolerance)
+        regressed = any(row["regressed"] for row in report["comparison"])
+
+    payload = json.dumps(report, indent=2)
+    if args.output:
+        os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(payload + "\n")
+        logger.info("Wrote %s", args.output)
+    else:
+        print(payload)
+    sys.exit(1 if regressed else 0)
+
+
+if __name__ == "__main__":
+    main()
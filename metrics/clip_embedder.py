@@ -0,0 +1,252 @@
+import hashlib
+import logging
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import torch
+from PIL import Image
+from transformers import CLIPModel, CLIPProcessor
+
+from .embedding_store import EmbeddingStore, StoreKey
+from .image_cache import decoded_images
+from .onnx_backend import OnnxClipEncoder, export_clip, get_backend
+
+logger = logging.getLogger(__name__)
+
+ImageInput = Union[str, Image.Image]
+
+
+class ClipEmbedder:
+    """
+    One CLIP model shared by every CLIP-based metric.
+
+    Images and texts are encoded in batches and their L2-normalized embeddings are kept in an
+    LRU cache, so scoring the same image or description for several metrics runs the encoder
+    once. Images given as paths are cached by path, size and modification time; PIL images
+    are encoded but not cached. Callers that know which archived generation an input belongs
+    to pass (uuid, kind) keys, and those embeddings are also persisted in an EmbeddingStore,
+    so scoring the archive again needs no forward passes. With an ONNX backend the encoders
+    run in ONNX Runtime on the CPU instead of PyTorch.
+    """
+
+    MODEL_NAME = "openai/clip-vit-base-patch32"
+
+    def __init__(self, model_name: str = MODEL_NAME, batch_size: Optional[int] = None,
+                 cache_size: Optional[int] = None, device: Optional[str] = None,
+                 store: Optional[EmbeddingStore] = None, backend: Optional[str] = None):
+        """
+        Initialize the ClipEmbedder.
+
+        Args:
+            model_name (str): HuggingFace CLIP checkpoint.
+            batch_size (int, optional): Inputs per forward pass (CLIP_BATCH_SIZE, 32).
+            cache_size (int, optional): Embeddings kept in memory (CLIP_CACHE_SIZE, 4096).
+            device (str, optional): Torch device (CLIP_DEVICE, cuda when available, else cpu).
+            store (EmbeddingStore, optional): Persistent store for keyed embeddings. Defaults to
+                one under CLIP_EMBEDDING_STORE (storage/embeddings); "none" disables it.
+            backend (str, optional): "torch", "onnx" or "onnx-int8" (METRICS_BACKEND, torch).
+        """
+        self.model_name = model_name
+        self.batch_size = batch_size or int(os.getenv("CLIP_BATCH_SIZE", 32))
+        self.cache_size = cache_size or int(os.getenv("CLIP_CACHE_SIZE", 4096))
+        self.device = device or os.getenv("CLIP_DEVICE") or ("cuda" if torch.cuda.is_available() else "cpu")
+        self.backend = get_backend(backend)
+        self.processor = CLIPProcessor.from_pretrained(model_name)
+        if self.backend == "torch":
+            self.model = CLIPModel.from_pretrained(model_name).to(self.device).eval()
+            self.onnx = None
+            self.logit_scale = self.model.logit_scale.exp().item()
+            self.projection_dim = self.model.config.projection_dim
+            max_positions = self.model.config.text_config.max_position_embeddings
+        else:
+            self.device = "cpu"
+            self.model = None
+            self.onnx = OnnxClipEncoder(export_clip(model_name, quantize=self.backend == "onnx-int8"))
+            self.logit_scale = self.onnx.meta["logit_scale"]
+            self.projection_dim = self.onnx.meta["projection_dim"]
+            max_positions = self.onnx.meta["max_position_embeddings"]
+        self.max_length = min(self.processor.tokenizer.model_max_length, max_positions)
+        self._cache: "OrderedDict[Tuple[str, ...], np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._encode_lock = threading.Lock()
+        store_dir = os.getenv("CLIP_EMBEDDING_STORE", os.path.join("storage", "embeddings"))
+        self.store = store if store is not None else (
+            EmbeddingStore(store_dir, self.version, self.projection_dim)
+            if store_dir.lower() != "none" else None)
+
+    @property
+    def version(self) -> str:
+        """Identifies the embeddings this instance produces; stored vectors are keyed by it."""
+        return self.model_name if self.backend == "torch" else f"{self.model_name}+{self.backend}"
+
+    def embed_images(self, images: Sequence[ImageInput], keys: Optional[Sequence[StoreKey]] = None) -> np.ndarray:
+        """
+        Encode images, running the vision tower only for those not cached or stored yet.
+
+        Args:
+            images (Sequence[str | Image.Image]): Image paths or PIL images.
+            keys (Sequence[Tuple[str, str]], optional): (uuid, kind) store keys, one per image.
+
+        Returns:
+            np.ndarray: (n, d) float32 array of L2-normalized embeddings, in input order.
+        """
+        cache_keys = [self._image_key(image) for image in images]
+        return self._embed(cache_keys, images, self._encode_images, keys)
+
+    def embed_texts(self, texts: Sequence[str], keys: Optional[Sequence[StoreKey]] = None) -> np.ndarray:
+        """
+        Encode texts (truncated to CLIP's context length), reusing cached or stored embeddings.
+
+        Args:
+            texts (Sequence[str]): Descriptions to encode.
+            keys (Sequence[Tuple[str, str]], optional): (uuid, kind) store keys, one per text.
+
+        Returns:
+            np.ndarray: (n, d) float32 array of L2-normalized embeddings, in input order.
+        """
+        cache_keys = [("text", hashlib.sha1(text.encode("utf-8")).hexdigest()) for text in texts]
+        return self._embed(cache_keys, texts, self._encode_texts, keys)
+
+    def preload(self, uuid: str, image_paths: Dict[str, str], description: str) -> None:
+        """
+        Bring the embeddings of one archived generation into the memory cache.
+
+        They are read from the store when present and computed (and stored) otherwise, so the
+        path- and text-based lookups of the metrics that follow are cache hits.
+
+        Args:
+            uuid (str): The generation's UUID.
+            image_paths (Dict[str, str]): Image paths by kind, e.g. {"original": ..., "generated": ...}.
+            description (str): The generation's description.
+        """
+        self.preload_many([(uuid, image_paths, description)])
+
+    def preload_many(self, items: Sequence[Tuple[str, Dict[str, str], str]]) -> None:
+        """Like `preload` for many (uuid, image_paths, description) items, in one batched pass per tower."""
+        self.embed_images([path for _, image_paths, _ in items for path in image_paths.values()],
+                          [(uuid, kind) for uuid, image_paths, _ in items for kind in image_paths])
+        self.embed_texts([description for _, _, description in items],
+                         [(uuid, "description") for uuid, _, _ in items])
+
+    def embed_image(self, image: ImageInput) -> np.ndarray:
+        return self.embed_images([image])[0]
+
+    def embed_text(self, text: str) -> np.ndarray:
+        return self.embed_texts([text])[0]
+
+    def clear_cache(self) -> None:
+        """Forget the in-memory embeddings (the persistent store is untouched)."""
+        with self._lock:
+            self._cache.clear()
+
+    def similarity(self, image_embeddings: np.ndarray, text_embeddings: np.ndarray) -> np.ndarray:
+        """Return CLIP's logits (logit_scale times cosine similarity) for matching rows."""
+        return self.logit_scale * np.sum(image_embeddings * text_embeddings, axis=-1)
+
+    def _embed(self, cache_keys: List[Optional[Tuple[str, ...]]], inputs: Sequence, encode,
+               store_keys: Optional[Sequence[StoreKey]] = None) -> np.ndarray:
+        results: List[Optional[np.ndarray]] = [None] * len(inputs)
+        missing = []
+        with self._lock:
+            for index, key in enumerate(cache_keys):
+                cached = self._cache.get(key) if key is not None else None
+                if cached is None:
+                    missing.append(index)
+                else:
+                    self._cache.move_to_end(key)
+                    results[index] = cached
+
+        if missing and store_keys is not None and self.store is not None:
+            stored = self.store.get_many([store_keys[index] for index in missing])
+            for index, embedding in zip(missing, stored):
+                if embedding is not None:
+                    results[index] = embedding
+                    self._remember(cache_keys[index], embedding)
+            missing = [index for index in missing if results[index] is None]
+
+        if not missing:
+            return np.stack(results) if results else np.empty((0, self.projection_dim), np.float32)
+        # one encoding at a time: a concurrent caller asking for the same inputs (e.g. CLIP
+        # similarity and FID scoring one generation in parallel) finds them cached afterwards
+        with self._encode_lock:
+            with self._lock:
+                for index in missing:
+                    cached = self._cache.get(cache_keys[index]) if cache_keys[index] is not None else None
+                    if cached is not None:
+                        results[index] = cached
+            missing = [index for index in missing if results[index] is None]
+            for start in range(0, len(missing), self.batch_size):
+                batch = missing[start:start + self.batch_size]
+                embeddings = encode([inputs[index] for index in batch])
+                if store_keys is not None and self.store is not None:
+                    # round like the store does, so first and later runs score identically
+                    embeddings = embeddings.astype(np.float16).astype(np.float32)
+                for index, embedding in zip(batch, embeddings):
+                    results[index] = embedding
+                    self._remember(cache_keys[index], embedding)
+                if store_keys is not None and self.store is not None:
+                    self.store.put_many((store_keys[index], embedding) for index, embedding in zip(batch, embeddings))
+        return np.stack(results) if results else np.empty((0, self.projection_dim), np.float32)
+
+    def _encode_images(self, images: Sequence[ImageInput]) -> np.ndarray:
+        pil_images = [decoded_images.rgb(image) if isinstance(image, str) else image.convert("RGB")
+                      for image in images]
+        if self.onnx is not None:
+            inputs = self.processor(images=pil_images, return_tensors="np")
+            return self._normalize(self.onnx.encode_images(inputs["pixel_values"]))
+        inputs = self.processor(images=pil_images, return_tensors="pt").to(self.device)
+        with torch.inference_mode():
+            pooled = self.model.vision_model(pixel_values=inputs["pixel_values"]).pooler_output
+            features = self.model.visual_projection(pooled)
+        return self._normalize(features)
+
+    def _encode_texts(self, texts: Sequence[str]) -> np.ndarray:
+        if self.onnx is not None:
+            inputs = self.processor(text=list(texts), return_tensors="np", padding=True,
+                                    truncation=True, max_length=self.max_length)
+            return self._normalize(self.onnx.encode_texts(inputs["input_ids"], inputs["attention_mask"]))
+        inputs = self.processor(text=list(texts), return_tensors="pt", padding=True,
+                                truncation=True, max_length=self.max_length).to(self.device)
+        with torch.inference_mode():
+            pooled = self.model.text_model(input_ids=inputs["input_ids"],
+                                           attention_mask=inputs["attention_mask"]).pooler_output
+            features = self.model.text_projection(pooled)
+        return self._normalize(features)
+
+    def _remember(self, cache_key: Optional[Tuple[str, ...]], embedding: np.ndarray) -> None:
+        if cache_key is None:
+            return
+        with self._lock:
+            self._cache[cache_key] = embedding
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    @staticmethod
+    def _normalize(features: Union[torch.Tensor, np.ndarray]) -> np.ndarray:
+        if isinstance(features, torch.Tensor):
+            features = features.float().cpu().numpy()
+        features = features.astype(np.float32, copy=False)
+        return features / np.linalg.norm(features, axis=1, keepdims=True)
+
+    @staticmethod
+    def _image_key(image: ImageInput) -> Optional[Tuple[str, ...]]:
+        if not isinstance(image, str):
+            return None
+        stat = os.stat(image)
+        return ("image", os.path.abspath(image), str(stat.st_size), str(stat.st_mtime_ns))
+
+
+_embedder: Optional[ClipEmbedder] = None
+_embedder_lock = threading.Lock()
+
+
+def get_clip_embedder() -> ClipEmbedder:
+    """Return the process-wide shared ClipEmbedder, loading the model on first use."""
+    global _embedder
+    with _embedder_lock:
+        if _embedder is None:
+            _embedder = ClipEmbedder()
+        return _embedder
@@ -1,11 +1,19 @@
-from PIL import Image
-import torch
-from transformers import CLIPProcessor, CLIPModel
+import logging
+from typing import List, Optional, Sequence
+
+from .clip_embedder import ClipEmbedder, get_clip_embedder
+
+logger = logging.getLogger(__name__)
 
 class CLIPSimilarity:
-    def __init__(self):
-        self.model = CLIPModel.from_pretrained("openai/clip-vit-base-patch32")
-        self.processor = CLIPProcessor.from_pretrained("openai/clip-vit-base-patch32")
+    def __init__(self, embedder: Optional[ClipEmbedder] = None):
+        """
+        Initialize CLIPSimilarity.
+
+        Args:
+            embedder (ClipEmbedder, optional): Shared CLIP encoder. Defaults to the process-wide one.
+        """
+        self.embedder = embedder or get_clip_embedder()
 
     def compute_similarity(self, image_path: str, description: str) -> float:
         """
@@ -19,32 +27,25 @@ class CLIPSimilarity:
             float: Similarity score between 0 and 100.
         """
         try:
-            # Load image
-            image = Image.open(image_path).convert('RGB')
-
-            # Truncate description to fit within CLIP's maximum sequence length
-            max_length = self.processor.tokenizer.model_max_length
-            truncated_description = self.processor.tokenizer.tokenize(description)[:max_length]
-            truncated_description = self.processor.tokenizer.convert_tokens_to_string(truncated_description)
-
-            # Prepare inputs
-            inputs = self.processor(
-                text=[truncated_description],
-                images=image,
-                return_tensors="pt",
-                padding=True,
-                truncation=True,
-                max_length=max_length
-            )
-
-            # Compute similarity
-            with torch.no_grad():
-                outputs = self.model(**inputs)
-
-            # Get the raw similarity score
-            similarity = outputs.logits_per_image.item()
-
-            return similarity
+            # CLIP's logits_per_image: logit scale times the cosine of the two embeddings
+            image_embedding = self.embedder.embed_image(image_path)
+            text_embedding = self.embedder.embed_text(description)
+            return float(self.embedder.similarity(image_embedding, text_embedding))
         except Exception as e:
-            print(f"Error computing CLIP similarity: {str(e)}")
-            return 0.0
\ No newline at end of file
+            logger.error("Error computing CLIP similarity: %s", e)
+            return 0.0
+
+    def compute_similarities(self, image_paths: Sequence[str], descriptions: Sequence[str]) -> List[float]:
+        """
+        Compute CLIP similarity for many image/description pairs with batched encoding.
+
+        Args:
+            image_paths (Sequence[str]): Paths to the image files.
+            descriptions (Sequence[str]): Descriptions, one per image.
+
+        Returns:
+            List[float]: Similarity scores in input order.
+        """
+        image_embeddings = self.embedder.embed_images(image_paths)
+        text_embeddings = self.embedder.embed_texts(descriptions)
+        return [float(score) for score in self.embedder.similarity(image_embeddings, text_embeddings)]
@@ -0,0 +1,284 @@
+"""
+Distribution-level FID between generated images and a reference set, in CLIP embedding space.
+
+Usage:
+    python -m metrics.corpus_fid --state storage/metrics/corpus_fid.npz
+    python -m metrics.corpus_fid --reference-dir path/to/reference_images --state fid_vs_ref.npz
+
+Each run adds the archive generations that the state file has not seen yet to running
+mean/covariance accumulators and saves them, so the score can be updated incrementally as
+new generations arrive. Embeddings come from the shared CLIP embedder and its store, so
+generations that were already scored need no forward passes.
+"""
+
+import argparse
+import io
+import logging
+import os
+from typing import Dict, Iterable, List, Optional, Set
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class RunningMoments:
+    """Streaming mean and covariance of row vectors (Chan et al. parallel update)."""
+
+    def __init__(self, dim: int):
+        self.dim = dim
+        self.count = 0
+        self.mean = np.zeros(dim, dtype=np.float64)
+        self._m2 = np.zeros((dim, dim), dtype=np.float64)
+
+    def update(self, batch: np.ndarray) -> None:
+        """Add a (n, dim) batch of vectors."""
+        batch = np.asarray(batch, dtype=np.float64).reshape(-1, self.dim)
+        if not len(batch):
+            return
+        batch_mean = batch.mean(axis=0)
+        centered = batch - batch_mean
+        self._merge(len(batch), batch_mean, centered.T @ centered)
+
+    def merge(self, other: "RunningMoments") -> None:
+        """Fold the statistics of another accumulator into this one."""
+        if other.count:
+            self._merge(other.count, other.mean, other._m2)
+
+    @property
+    def covariance(self) -> np.ndarray:
+        if self.count < 2:
+            raise ValueError("At least two vectors are needed for a covariance")
+        return self._m2 / (self.count - 1)
+
+    def _merge(self, count: int, mean: np.ndarray, m2: np.ndarray) -> None:
+        total = self.count + count
+        delta = mean - self.mean
+        self._m2 += m2 + np.outer(delta, delta) * (self.count * count / total)
+        self.mean += delta * (count / total)
+        self.count = total
+
+
+def sqrt_trace_product(sigma1: np.ndarray, sigma2: np.ndarray, eps: float = 0.0) -> float:
+    """
+    Compute tr(sqrtm(sigma1 @ sigma2 + eps * I)) for symmetric PSD matrices with two eigendecompositions.
+
+    sigma1 @ sigma2 has the same eigenvalues as sqrt(sigma1) @ sigma2 @ sqrt(sigma1), which is
+    symmetric, so `eigh` replaces the general (and much slower) `scipy.linalg.sqrtm`; adding
+    eps * I shifts every eigenvalue by eps.
+    """
+    eigenvalues, eigenvectors = np.linalg.eigh(sigma1)
+    sqrt_sigma1 = (eigenvectors * np.sqrt(np.clip(eigenvalues, 0, None))) @ eigenvectors.T
+    product = sqrt_sigma1 @ sigma2 @ sqrt_sigma1
+    return float(np.sqrt(np.clip(np.linalg.eigvalsh((product + product.T) / 2) + eps, 0, None)).sum())
+
+
+def frechet_distance(mu1: np.ndarray, sigma1: np.ndarray, mu2: np.ndarray, sigma2: np.ndarray,
+                     eps: float = 0.0) -> float:
+    """
+    Fréchet distance between two Gaussians: |mu1 - mu2|^2 + tr(sigma1 + sigma2 - 2 sqrt(sigma1 sigma2 + eps I)).
+
+    `eps` regularizes the square root the way the per-item `FIDMetric` always has; leave it at
+    zero for a true distance.
+    """
+    diff = mu1 - mu2
+    return float(diff.dot(diff) + np.trace(sigma1) + np.trace(sigma2)
+                 - 2 * sqrt_trace_product(sigma1, sigma2, eps))
+
+
+class CorpusFID:
+    """FID between a stream of generated embeddings and a reference set, updatable incrementally."""
+
+    def __init__(self, dim: int, model_version: Optional[str] = None, reference_source: Optional[str] = None):
+        """
+        Initialize the CorpusFID.
+
+        Args:
+            dim (int): Embedding dimension.
+            model_version (str, optional): The embedder (model and backend) the moments come from.
+            reference_source (str, optional): What the reference set is, e.g. "archive:original"
+                or "dir:/path/to/images".
+        """
+        self.reference = RunningMoments(dim)
+        self.generated = RunningMoments(dim)
+        self.seen: Set[str] = set()
+        self.model_version = model_version
+        self.reference_source = reference_source
+
+    def check_compatible(self, model_version: str, reference_source: Optional[str] = None) -> None:
+        """
+        Make sure new embeddings belong with the accumulated ones, recording the settings on first use.
+
+        Raises:
+            ValueError: If the state was built with another embedder or reference set.
+        """
+        for name, stored, current in (("embedder", self.model_version, model_version),
+                                      ("reference set", self.reference_source, reference_source)):
+            if current is not None and stored is not None and stored != current:
+                raise ValueError(f"The FID state was built with {name} {stored!r}, not {current!r}; "
+                                 f"use another --state file")
+        self.model_version = model_version
+        self.reference_source = reference_source or self.reference_source
+
+    def add_reference(self, embeddings: np.ndarray) -> None:
+        self.reference.update(embeddings)
+
+    def add_generated(self, embeddings: np.ndarray) -> None:
+        self.generated.update(embeddings)
+
+    def score(self) -> float:
+        """
+        Return the FID between the generated and reference distributions.
+
+        Raises:
+            ValueError: If either side has fewer than two embeddings.
+        """
+        return frechet_distance(self.generated.mean, self.generated.covariance,
+                                self.reference.mean, self.reference.covariance)
+
+    def save(self, path: str) -> None:
+        """Write the accumulators and the set of counted UUIDs, replacing the file atomically."""
+        buffer = io.BytesIO()
+        np.savez(buffer, **self._arrays("reference", self.reference), **self._arrays("generated", self.generated),
+                 seen=np.array(sorted(self.seen), dtype=str), model_version=np.array(self.model_version or ""),
+                 reference_source=np.array(self.reference_source or ""))
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(buffer.getvalue())
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "CorpusFID":
+        with np.load(path) as data:
+            corpus = cls(int(data["reference_mean"].shape[0]))
+            for name, moments in (("reference", corpus.reference), ("generated", corpus.generated)):
+                moments.count = int(data[f"{name}_count"])
+                moments.mean = data[f"{name}_mean"].astype(np.float64)
+                moments._m2 = data[f"{name}_m2"].astype(np.float64)
+            corpus.seen = set(data["seen"].tolist())
+            # states written before these were recorded adopt the settings of the next update
+            for name in ("model_version", "reference_source"):
+                if name in data.files and str(data[name]):
+                    setattr(corpus, name, str(data[name]))
+        return corpus
+
+    @staticmethod
+    def _arrays(name: str, moments: RunningMoments):
+        return {f"{name}_count": moments.count, f"{name}_mean": moments.mean, f"{name}_m2": moments._m2}
+
+
+def _batches(items: Iterable[str], size: int) -> Iterable[List[str]]:
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def update_from_archive(corpus: CorpusFID, embedder, data_dir: str, reference_kind: Optional[str],
+                        batch_size: int = 64) -> int:
+    """
+    Add archive generations that the corpus has not seen yet.
+
+    Args:
+        corpus (CorpusFID): The accumulators to update.
+        embedder (ClipEmbedder): Produces (or reads stored) image embeddings.
+        data_dir (str): Archive with one folder per UUID.
+        reference_kind (str, optional): Also add this image of every generation, e.g. "original",
+            to the reference set.
+        batch_size (int): Generations per embedding batch.
+
+    Raises:
+        ValueError: If the corpus was built with another embedder or reference kind.
+
+    Returns:
+        int: The number of generations added. Generations missing one of the images are left
+            out, and those whose images cannot be embedded are logged and skipped.
+    """
+    corpus.check_compatible(embedder.version, f"archive:{reference_kind}" if reference_kind else None)
+    kinds = ["generated"] + ([reference_kind] if reference_kind else [])
+    with os.scandir(data_dir) as entries:
+        uuids = sorted(entry.name for entry in entries
+                       if entry.is_dir() and entry.name not in corpus.seen
+                       and all(os.path.exists(os.path.join(entry.path, f"{kind}.png")) for kind in kinds))
+    added = 0
+    for batch in _batches(uuids, batch_size):
+        try:
+            embeddings = _embed_batch(embedder, data_dir, batch, kinds)
+        except Exception as e:
+            # find the generations that cannot be embedded and add the rest one by one
+            logger.warning("Embedding a batch failed (%s), retrying its generations one by one", e)
+            embeddings, batch = {kind: [] for kind in kinds}, list(batch)
+            for uuid in list(batch):
+                try:
+                    for kind, rows in _embed_batch(embedder, data_dir, [uuid], kinds).items():
+                        embeddings[kind].append(rows)
+                except Exception as e:
+                    logger.error("Skipping generation %s: %s", uuid, e)
+                    batch.remove(uuid)
+            if not batch:
+                continue
+            embeddings = {kind: np.concatenate(rows) for kind, rows in embeddings.items()}
+        corpus.add_generated(embeddings["generated"])
+        if reference_kind:
+            corpus.add_reference(embeddings[reference_kind])
+        corpus.seen.update(batch)
+        added += len(batch)
+    return added
+
+
+def _embed_batch(embedder, data_dir: str, uuids: List[str], kinds: List[str]) -> Dict[str, np.ndarray]:
+    return {kind: embedder.embed_images([os.path.join(data_dir, uuid, f"{kind}.png") for uuid in uuids],
+                                        [(uuid, kind) for uuid in uuids])
+            for kind in kinds}
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Distribution-level FID of archived generations.")
+    parser.add_argument("--data-dir", default=os.path.join("storage", "data"),
+                        help="Local archive with one folder per UUID (default: storage/data).")
+    parser.add_argument("--state", default=os.path.join("storage", "metrics", "corpus_fid.npz"),
+                        help="Accumulator file, updated incrementally on every run.")
+    reference = parser.add_mutually_exclusive_group()
+    reference.add_argument("--reference-kind", default="original",
+                           help="Archive image used as the reference set (default: original).")
+    reference.add_argument("--reference-dir", help="Directory of reference images, embedded once.")
+    parser.add_argument("--batch-size", type=int, default=64, help="Images per embedding batch (default: 64).")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO").upper(),
+                        format="%(asctime)s %(levelname)s %(name)s %(message)s")
+    from .clip_embedder import get_clip_embedder
+
+    embedder = get_clip_embedder()
+    if os.path.exists(args.state):
+        corpus = CorpusFID.load(args.state)
+    else:
+        corpus = CorpusFID(embedder.projection_dim)
+    reference_source = f"dir:{os.path.abspath(args.reference_dir)}" if args.reference_dir \
+        else f"archive:{args.reference_kind}"
+    try:
+        corpus.check_compatible(embedder.version, reference_source)
+    except ValueError as e:
+        parser.error(str(e))
+
+    if args.reference_dir and corpus.reference.count == 0:
+        paths = sorted(os.path.join(args.reference_dir, name) for name in os.listdir(args.reference_dir)
+                       if name.lower().endswith((".png", ".jpg", ".jpeg", ".webp")))
+        for batch in _batches(paths, args.batch_size):
+            corpus.add_reference(embedder.embed_images(batch))
+
+    added = update_from_archive(corpus, embedder, args.data_dir,
+                                None if args.reference_dir else args.reference_kind, args.batch_size)
+    corpus.save(args.state)
+    logger.info("Added %d generations (%d total, %d reference)", added, corpus.generated.count,
+                corpus.reference.count)
+    print(f"FID: {corpus.score():.4f}")
+
+
+if __name__ == "__main__":
+    main()
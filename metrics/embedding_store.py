@@ -0,0 +1,196 @@
+import fcntl
+import json
+import os
+import re
+import threading
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+StoreKey = Tuple[str, str]
+
+
+class EmbeddingStore:
+    """
+    An append-only float16 embedding store, memory-mapped for reads.
+
+    Vectors of one model version live in a single `vectors.f16` file (one row per vector) with
+    an `index.jsonl` that maps (uuid, kind) keys such as ("<uuid>", "generated") to rows.
+    Reads go through `np.memmap`, so scanning millions of vectors does not load them into the
+    heap. Writing the same key again appends a new row that supersedes the old one.
+
+    Several processes may write at once: appends hold an exclusive `flock` on the store's lock
+    file and take their row numbers from the size of `vectors.f16` under that lock, and every
+    read first picks up index lines other processes appended since the last one.
+    """
+
+    SCAN_CHUNK_ROWS = 65536
+
+    def __init__(self, directory: str, model_version: str, dim: int):
+        """
+        Initialize the EmbeddingStore.
+
+        Args:
+            directory (str): Root directory; each model version gets its own subdirectory.
+            model_version (str): Identifies the model and backend that produced the vectors.
+            dim (int): Embedding dimension.
+
+        Raises:
+            ValueError: If the existing store for this model version has a different dimension.
+        """
+        self.model_version = model_version
+        self.dim = dim
+        self.path = os.path.join(directory, re.sub(r"[^A-Za-z0-9_.-]+", "_", model_version))
+        self.vectors_path = os.path.join(self.path, "vectors.f16")
+        self.index_path = os.path.join(self.path, "index.jsonl")
+        self.lock_path = os.path.join(self.path, "lock")
+        self._row_bytes = dim * np.dtype(np.float16).itemsize
+        self._rows: Dict[StoreKey, int] = {}
+        self._count = 0
+        self._index_offset = 0
+        self._mmap: Optional[np.memmap] = None
+        self._lock = threading.Lock()
+        os.makedirs(self.path, exist_ok=True)
+        self._check_meta()
+        self.refresh()
+
+    def __len__(self) -> int:
+        self.refresh()
+        return len(self._rows)
+
+    def __contains__(self, key: StoreKey) -> bool:
+        self.refresh()
+        return key in self._rows
+
+    def get(self, uuid: str, kind: str) -> Optional[np.ndarray]:
+        """Return the vector stored for (uuid, kind) as float32, or None."""
+        return self.get_many([(uuid, kind)])[0]
+
+    def get_many(self, keys: Sequence[StoreKey]) -> List[Optional[np.ndarray]]:
+        """Return the vectors stored for the keys as float32, with None for missing keys."""
+        self.refresh()
+        rows = [self._rows.get(key) for key in keys]
+        if all(row is None for row in rows):
+            return [None] * len(keys)
+        matrix = self.matrix()
+        return [None if row is None else np.asarray(matrix[row], dtype=np.float32) for row in rows]
+
+    def put(self, uuid: str, kind: str, vector: np.ndarray) -> None:
+        self.put_many([((uuid, kind), vector)])
+
+    def put_many(self, items: Iterable[Tuple[StoreKey, np.ndarray]]) -> None:
+        """Append vectors, stored as float16, and index them under their keys."""
+        items = list(items)
+        if not items:
+            return
+        block = np.stack([np.asarray(vector, dtype=np.float16).reshape(self.dim) for _, vector in items])
+        with self._lock, open(self.lock_path, "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                with open(self.vectors_path, "ab") as f:
+                    size = os.fstat(f.fileno()).st_size
+                    if size % self._row_bytes:
+                        # drop a row cut short by a crash so later rows stay aligned
+                        size -= size % self._row_bytes
+                        f.truncate(size)
+                    first_row = size // self._row_bytes
+                    f.write(block.tobytes())
+                with open(self.index_path, "a+b") as f:
+                    lines = [json.dumps([uuid, kind, first_row + offset]) + "\n"
+                             for offset, ((uuid, kind), _) in enumerate(items)]
+                    end = f.seek(0, os.SEEK_END)
+                    if end:
+                        f.seek(end - 1)
+                        if f.read(1) != b"\n":
+                            lines.insert(0, "\n")  # finish a line cut short by a crash
+                    f.write("".join(lines).encode("utf-8"))
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+            self._refresh()
+
+    def keys(self, kind: Optional[str] = None) -> List[StoreKey]:
+        """Return the stored keys, optionally only those of one kind."""
+        self.refresh()
+        return [key for key in self._rows if kind is None or key[1] == kind]
+
+    def matrix(self) -> np.ndarray:
+        """Return a read-only (rows, dim) float16 memory map over every stored row."""
+        with self._lock:
+            if self._mmap is None or self._mmap.shape[0] != self._count:
+                self._mmap = np.memmap(self.vectors_path, dtype=np.float16, mode="r",
+                                       shape=(self._count, self.dim)) if self._count else \
+                    np.empty((0, self.dim), dtype=np.float16)
+            return self._mmap
+
+    def nearest(self, vector: np.ndarray, k: int = 10, kind: Optional[str] = None) -> List[Tuple[str, str, float]]:
+        """
+        Find the stored vectors with the highest dot product with `vector`.
+
+        The memory map is scanned in chunks, so only one chunk is in memory at a time.
+
+        Args:
+            vector (np.ndarray): Query vector (normalized, for cosine similarity).
+            k (int): Number of results.
+            kind (str, optional): Only consider keys of this kind, e.g. "generated".
+
+        Returns:
+            List[Tuple[str, str, float]]: (uuid, kind, score) tuples, best first.
+        """
+        self.refresh()
+        live = {row: key for key, row in self._rows.items() if kind is None or key[1] == kind}
+        if not live:
+            return []
+        query = np.asarray(vector, dtype=np.float32)
+        matrix = self.matrix()
+        rows = np.fromiter(sorted(live), dtype=np.int64)
+        best_rows, best_scores = np.empty(0, np.int64), np.empty(0, np.float32)
+        for start in range(0, len(rows), self.SCAN_CHUNK_ROWS):
+            chunk = rows[start:start + self.SCAN_CHUNK_ROWS]
+            scores = np.asarray(matrix[chunk], dtype=np.float32) @ query
+            best_rows = np.concatenate([best_rows, chunk])
+            best_scores = np.concatenate([best_scores, scores])
+            if len(best_rows) > k:
+                top = np.argpartition(-best_scores, k)[:k]
+                best_rows, best_scores = best_rows[top], best_scores[top]
+        order = np.argsort(-best_scores)
+        return [(*live[int(best_rows[i])], float(best_scores[i])) for i in order]
+
+    def _check_meta(self) -> None:
+        meta_path = os.path.join(self.path, "meta.json")
+        if os.path.exists(meta_path):
+            with open(meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            if meta["dim"] != self.dim:
+                raise ValueError(f"Embedding store {self.path} holds {meta['dim']}-d vectors, not {self.dim}-d")
+            return
+        with open(meta_path, "w", encoding="utf-8") as f:
+            json.dump({"model_version": self.model_version, "dim": self.dim, "dtype": "float16"}, f)
+
+    def refresh(self) -> None:
+        """Pick up rows appended since the last read, by this or any other process."""
+        with self._lock:
+            self._refresh()
+
+    def _refresh(self) -> None:
+        try:
+            index_size = os.path.getsize(self.index_path)
+        except FileNotFoundError:
+            return
+        if index_size == self._index_offset:
+            return
+        with open(self.index_path, "rb") as f:
+            f.seek(self._index_offset)
+            tail = f.read(index_size - self._index_offset)
+        # a line without its newline is still being written (or was cut short by a crash
+        # and will be terminated by the next writer); leave it for a later refresh
+        tail = tail[:tail.rfind(b"\n") + 1]
+        self._index_offset += len(tail)
+        # index lines are written after their vectors, so the file size read afterwards covers them
+        self._count = os.path.getsize(self.vectors_path) // self._row_bytes if os.path.exists(self.vectors_path) else 0
+        for line in tail.splitlines():
+            try:
+                uuid, kind, row = json.loads(line)
+            except ValueError:
+                continue  # a line cut short by a crash
+            if row < self._count:
+                self._rows[(uuid, kind)] = row
@@ -1,34 +1,32 @@
 import numpy as np
-import torch
-from transformers import CLIPProcessor, CLIPModel
-from PIL import Image
-import traceback
-from scipy.linalg import sqrtm  # Correct import
+import logging
+from typing import Optional
+
+from .clip_embedder import ClipEmbedder, get_clip_embedder
+from .corpus_fid import frechet_distance
+
+logger = logging.getLogger(__name__)
 
 
 class FIDMetric:
-    def __init__(self):
-        self.model = CLIPModel.from_pretrained("openai/clip-vit-base-patch32")
-        self.processor = CLIPProcessor.from_pretrained("openai/clip-vit-base-patch32")
+    # added to sigma1 @ sigma2 before the square root; part of every archived fid_score
+    EPS = 1e-6
+
+    def __init__(self, embedder: Optional[ClipEmbedder] = None):
+        """
+        Initialize FIDMetric.
+
+        Args:
+            embedder (ClipEmbedder, optional): Shared CLIP encoder. Defaults to the process-wide one.
+        """
+        self.embedder = embedder or get_clip_embedder()
 
     def extract_features(self, image_path=None, text=None):
-        inputs = None
+        """Return the (1, d) normalized CLIP embedding of an image or a text."""
         if image_path:
-            image = Image.open(image_path).convert("RGB")
-            inputs = self.processor(images=image, return_tensors="pt", padding=True)
+            return self.embedder.embed_images([image_path])
         elif text:
-            inputs = self.processor(text=[text], return_tensors="pt", padding=True, truncation=True)
-
-        if inputs:
-            with torch.no_grad():
-                outputs = (
-                    self.model.get_image_features(**inputs)
-                    if image_path
-                    else self.model.get_text_features(**inputs)
-                )
-            features = outputs.cpu().numpy()
-            features = features / np.linalg.norm(features, axis=1, keepdims=True)  # Normalize
-            return features  # Return full feature array
+            return self.embedder.embed_texts([text])
         else:
             raise ValueError("Either image_path or text must be provided.")
 
@@ -48,29 +46,19 @@ class FIDMetric:
             sigma1 = np.cov(features1, rowvar=False)
             sigma2 = np.cov(features2, rowvar=False)
 
-        # Compute the FID score
-        diff = mu1 - mu2
-        covmean = sqrtm(sigma1 @ sigma2 + np.eye(sigma1.shape[0]) * 1e-6)  # Add small epsilon for stability
-
-        # Handle numerical issues
-        if np.iscomplexobj(covmean):
-            covmean = covmean.real
-
-        fid = diff.dot(diff) + np.trace(sigma1 + sigma2 - 2 * covmean)
-        return fid
+        # Compute the FID score; the matrix square root goes through symmetric eigendecompositions
+        return frechet_distance(mu1, sigma1, mu2, sigma2, eps=self.EPS)
 
     def compute_fid(self, image_path: str, description: str) -> float:
         try:
             image_features = self.extract_features(image_path=image_path)
             text_features = self.extract_features(text=description)
 
-            print(f"Image features shape: {image_features.shape}")
-            print(f"Text features shape: {text_features.shape}")
+            logger.debug("Image features shape: %s", image_features.shape)
+            logger.debug("Text features shape: %s", text_features.shape)
 
             fid_score = self.calculate_fid(image_features, text_features)
             return fid_score
         except Exception as e:
-            print(f"Error computing FID score: {str(e)}")
-            print("Traceback:")
-            print(traceback.format_exc())
+            logger.exception("Error computing FID score: %s", e)
             return float('inf')  # Return infinity for error cases
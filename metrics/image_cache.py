@@ -0,0 +1,82 @@
+import os
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Optional, Tuple
+
+import cv2
+import numpy as np
+from PIL import Image
+
+
+class DecodedImageCache:
+    """
+    Decodes each image file once per view and hands out the views the metrics need.
+
+    CLIP wants an RGB PIL image and YOLO a BGR array, both derived from one `cv2.imread`; SSIM
+    wants grayscale, decoded with `cv2.IMREAD_GRAYSCALE` as it always was, since converting
+    the BGR array rounds differently. Entries are keyed by path, size and modification time and
+    kept in a small LRU. Concurrent requests for the same view wait for a single decode.
+    """
+
+    def __init__(self, max_items: Optional[int] = None):
+        """
+        Initialize the DecodedImageCache.
+
+        Args:
+            max_items (int, optional): Decoded files kept in memory (IMAGE_CACHE_SIZE, 8).
+        """
+        self.max_items = max_items or int(os.getenv("IMAGE_CACHE_SIZE", 8))
+        self._entries: "OrderedDict[Tuple[str, ...], Dict[str, object]]" = OrderedDict()
+        self._loading: Dict[Tuple[str, ...], threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    def bgr(self, path: str) -> np.ndarray:
+        """Return the image as a uint8 BGR array, like `cv2.imread(path)`."""
+        return self._view(path, "bgr", lambda: _imread(path, cv2.IMREAD_COLOR))
+
+    def rgb(self, path: str) -> Image.Image:
+        """Return the image as an RGB PIL image."""
+        return self._view(path, "rgb", lambda: Image.fromarray(np.ascontiguousarray(self.bgr(path)[:, :, ::-1])))
+
+    def gray(self, path: str) -> np.ndarray:
+        """Return the image as a uint8 grayscale array, like `cv2.imread(path, cv2.IMREAD_GRAYSCALE)`."""
+        return self._view(path, "gray", lambda: _imread(path, cv2.IMREAD_GRAYSCALE))
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def _view(self, path: str, name: str, load: Callable[[], object]):
+        stat = os.stat(path)
+        key = (os.path.abspath(path), str(stat.st_size), str(stat.st_mtime_ns))
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and name in entry:
+                self._entries.move_to_end(key)
+                return entry[name]
+            loading = self._loading.setdefault(key + (name,), threading.Lock())
+        with loading:
+            with self._lock:
+                entry = self._entries.get(key)
+                view = entry.get(name) if entry is not None else None
+            if view is None:
+                view = load()
+                with self._lock:
+                    entry = self._entries.setdefault(key, {})
+                    entry[name] = view
+                    self._entries.move_to_end(key)
+                    while len(self._entries) > self.max_items:
+                        self._entries.popitem(last=False)
+        with self._lock:
+            self._loading.pop(key + (name,), None)
+        return view
+
+
+def _imread(path: str, flags: int) -> np.ndarray:
+    image = cv2.imread(path, flags)
+    if image is None:
+        raise FileNotFoundError(f"Cannot read image {path}")
+    return image
+
+
+decoded_images = DecodedImageCache()
@@ -1,100 +1,367 @@
-from typing import Dict, Callable
-from .clip_similarity import CLIPSimilarity
-from .object_detection_matching import ObjectDetectionMatching
-from .fid_metric import FIDMetric
-from .ssim_metric import SSIMMetric
+from typing import TYPE_CHECKING, Dict, Callable, List, Optional, Sequence, Tuple
+import logging
 import os
+import threading
+import time
 from abc import ABC, abstractmethod
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+
+# the metric modules import torch, transformers, ultralytics, nltk and OpenCV; they are
+# imported by the registry factories below, only for the metrics that are selected
+if TYPE_CHECKING:
+    from .clip_similarity import CLIPSimilarity
+    from .fid_metric import FIDMetric
+    from .object_detection_matching import ObjectDetectionMatching
+    from .ssim_metric import SSIMMetric
+
+logger = logging.getLogger(__name__)
+
+IMAGE_TYPES = ("original", "generated")
+IMAGE_DESCRIPTION = "image_description"
+IMAGE_IMAGE = "image_image"
 
 class MetricCalculator(ABC):
+    @property
+    def lock(self) -> threading.Lock:
+        """Serializes use of this calculator's models, which are not safe to drive from two threads."""
+        # dict.setdefault is atomic, so concurrent first calls get the same lock
+        return self.__dict__.setdefault("_lock", threading.Lock())
+
     @abstractmethod
     def compute(self, image_path: str, description: str) -> float:
         pass
 
+    def prepare(self, uuid: str, image_paths: Dict[str, str], description: str) -> None:
+        """Called once per UUID before `compute`, e.g. to load stored embeddings."""
+
+    def prepare_batch(self, items: Sequence[Tuple[str, Dict[str, str], str]]) -> None:
+        """Prepare many (uuid, image_paths, description) items at once; batched models override this."""
+        for uuid, image_paths, description in items:
+            self.prepare(uuid, image_paths, description)
+
 class CLIPSimilarityCalculator(MetricCalculator):
-    def __init__(self, clip_similarity: CLIPSimilarity):
+    def __init__(self, clip_similarity: "CLIPSimilarity"):
         self.clip_similarity = clip_similarity
 
     def compute(self, image_path: str, description: str) -> float:
         return self.clip_similarity.compute_similarity(image_path, description)
 
+    def prepare(self, uuid: str, image_paths: Dict[str, str], description: str) -> None:
+        self.clip_similarity.embedder.preload(uuid, image_paths, description)
+
+    def prepare_batch(self, items: Sequence[Tuple[str, Dict[str, str], str]]) -> None:
+        self.clip_similarity.embedder.preload_many(items)
+
 class ObjectDetectionCalculator(MetricCalculator):
-    def __init__(self, object_detection: ObjectDetectionMatching):
+    def __init__(self, object_detection: "ObjectDetectionMatching"):
         self.object_detection = object_detection
 
     def compute(self, image_path: str, description: str) -> float:
         return self.object_detection.compute_object_match_score(image_path, description)
 
+    def prepare(self, uuid: str, image_paths: Dict[str, str], description: str) -> None:
+        # one YOLO batch for both images, one NER pass for the shared description
+        self.object_detection.detect_objects_in_images(list(image_paths.values()))
+        self.object_detection.extract_objects_from_text(description)
+
+    def prepare_batch(self, items: Sequence[Tuple[str, Dict[str, str], str]]) -> None:
+        self.object_detection.detect_objects_in_images(
+            [path for _, image_paths, _ in items for path in image_paths.values()])
+        self.object_detection.extract_objects_from_texts([description for _, _, description in items])
+
 class FIDCalculator(MetricCalculator):
-    def __init__(self, fid_metric: FIDMetric):
+    def __init__(self, fid_metric: "FIDMetric"):
         self.fid_metric = fid_metric
 
     def compute(self, image_path: str, description: str) -> float:
         return self.fid_metric.compute_fid(image_path, description)
+
+    def prepare(self, uuid: str, image_paths: Dict[str, str], description: str) -> None:
+        self.fid_metric.embedder.preload(uuid, image_paths, description)
+
+    def prepare_batch(self, items: Sequence[Tuple[str, Dict[str, str], str]]) -> None:
+        self.fid_metric.embedder.preload_many(items)
 class SSIMCalculator(MetricCalculator):
-    def __init__(self, ssim_metric: SSIMMetric):
+    def __init__(self, ssim_metric: "SSIMMetric", multiscale: bool = False):
         self.ssim_metric = ssim_metric
+        self.multiscale = multiscale
 
     def compute(self, original_image_path: str, generated_image_path: str) -> float:
+        if self.multiscale:
+            return self.ssim_metric.compute_ms_ssim(original_image_path, generated_image_path)
         return self.ssim_metric.compute_ssim(original_image_path, generated_image_path)
 
+class MetricSpec:
+    """A registered metric: its name, what it compares, and how to build its calculator."""
+
+    def __init__(self, name: str, kind: str, factory: Callable[[], MetricCalculator], aliases: Sequence[str] = ()):
+        self.name = name
+        self.kind = kind
+        self.factory = factory
+        self.aliases = tuple(aliases)
+
+METRICS: Dict[str, MetricSpec] = {}
+
+def register_metric(name: str, kind: str, aliases: Sequence[str] = ()):
+    """
+    Register a calculator factory under a metric name.
+
+    The factory runs only when the metric is selected, so it is the place for heavy imports
+    and model loading.
+
+    Args:
+        name (str): Metric name, used for result keys, e.g. "ssim_metric".
+        kind (str): IMAGE_DESCRIPTION (scored for each image against the description) or
+            IMAGE_IMAGE (scored for the original/generated pair).
+        aliases (Sequence[str]): Short names accepted by `resolve_metrics`, e.g. "ssim".
+    """
+    def decorator(factory: Callable[[], MetricCalculator]) -> Callable[[], MetricCalculator]:
+        METRICS[name] = MetricSpec(name, kind, factory, aliases)
+        return factory
+    return decorator
+
+@register_metric('clip_similarity', IMAGE_DESCRIPTION, aliases=("clip",))
+def _clip_similarity() -> MetricCalculator:
+    from .clip_similarity import CLIPSimilarity
+    return CLIPSimilarityCalculator(CLIPSimilarity())
+
+@register_metric('object_match_score', IMAGE_DESCRIPTION, aliases=("objects", "yolo"))
+def _object_match_score() -> MetricCalculator:
+    from .object_detection_matching import ObjectDetectionMatching
+    return ObjectDetectionCalculator(ObjectDetectionMatching())
+
+@register_metric('fid_score', IMAGE_DESCRIPTION, aliases=("fid",))
+def _fid_score() -> MetricCalculator:
+    from .fid_metric import FIDMetric
+    return FIDCalculator(FIDMetric())
+
+@register_metric('ssim_metric', IMAGE_IMAGE, aliases=("ssim",))
+def _ssim_metric() -> MetricCalculator:
+    from .ssim_metric import SSIMMetric
+    return SSIMCalculator(SSIMMetric())
+
+@register_metric('ms_ssim_metric', IMAGE_IMAGE, aliases=("ms_ssim", "ms-ssim"))
+def _ms_ssim_metric() -> MetricCalculator:
+    from .ssim_metric import SSIMMetric
+    return SSIMCalculator(SSIMMetric(), multiscale=True)
+
+def default_metrics() -> List[str]:
+    """Return the metrics computed when none are selected."""
+    names = ['clip_similarity', 'object_match_score', 'fid_score', 'ssim_metric']
+    if os.getenv("SSIM_MULTISCALE", "").lower() in ("1", "true", "yes"):
+        names.append('ms_ssim_metric')
+    return names
+
+def resolve_metrics(metrics: Optional[Sequence[str]] = None) -> List[str]:
+    """
+    Turn metric names or aliases (a sequence, or a comma-separated string) into registered names.
+
+    Raises:
+        ValueError: If a name is not registered.
+    """
+    if metrics is None:
+        return default_metrics()
+    if isinstance(metrics, str):
+        metrics = [name for name in metrics.split(",") if name.strip()]
+    lookup = {alias: spec.name for spec in METRICS.values() for alias in (spec.name, *spec.aliases)}
+    names = []
+    for requested in metrics:
+        name = lookup.get(requested.strip().lower())
+        if name is None:
+            raise ValueError(f"Unknown metric {requested!r}; available: {', '.join(sorted(lookup))}")
+        if name not in names:
+            names.append(name)
+    return names
+
+def build_calculators(metrics: Optional[Sequence[str]] = None
+                      ) -> Tuple[Dict[str, MetricCalculator], Dict[str, MetricCalculator]]:
+    """
+    Load the models of the selected metrics once.
+
+    Args:
+        metrics (Sequence[str] | str, optional): Metric names or aliases, e.g. "ssim,clip".
+            Defaults to `default_metrics()`.
+
+    Returns:
+        Tuple[Dict[str, MetricCalculator], Dict[str, MetricCalculator]]: The image–description
+            and the image–image calculators, to be shared between MetricsCollector instances.
+    """
+    calculators_im_desc, calculators_im_im = {}, {}
+    for name in resolve_metrics(metrics):
+        spec = METRICS[name]
+        calculators = calculators_im_desc if spec.kind == IMAGE_DESCRIPTION else calculators_im_im
+        calculators[name] = spec.factory()
+    return calculators_im_desc, calculators_im_im
+
+def metric_keys(calculators_im_desc: Dict[str, MetricCalculator],
+                calculators_im_im: Dict[str, MetricCalculator]) -> List[str]:
+    """Return the keys `collect_metrics` produces for the given calculators, in order."""
+    return [f"{image_type}_{name}" for image_type in IMAGE_TYPES for name in calculators_im_desc] \
+        + list(calculators_im_im)
+
+def latency_keys(calculators_im_desc: Dict[str, MetricCalculator],
+                 calculators_im_im: Dict[str, MetricCalculator]) -> List[str]:
+    """Return the per-calculator latency keys of `MetricsResult.row()`, in order."""
+    return [f"latency_{name}" for name in [*calculators_im_desc, *calculators_im_im, "total"]]
+
+class MetricsResult:
+    """The metrics of one UUID, with the seconds each calculator took and what went wrong."""
+
+    def __init__(self, metrics: Dict[str, float], latency: Dict[str, float], errors: List[str]):
+        self.metrics = metrics
+        self.latency = latency
+        self.errors = errors
+
+    def row(self) -> Dict[str, object]:
+        """Flatten into one record: metric values, `latency_<calculator>` seconds and `error`."""
+        return {**self.metrics, **{f"latency_{name}": round(seconds, 4) for name, seconds in self.latency.items()},
+                "error": "; ".join(self.errors)}
+
 class MetricsCollector:
     """A class to collect and manage various metrics for image-text comparison."""
 
-    def __init__(self, uuid: str):
-        """Initialize the MetricsCollector with different metric calculators."""
+    def __init__(self, uuid: str, calculators_im_desc: Optional[Dict[str, MetricCalculator]] = None,
+                 calculators_im_im: Optional[Dict[str, MetricCalculator]] = None,
+                 data_dir: str = os.path.join("storage", "data"), timeout: Optional[float] = None,
+                 workers: Optional[int] = None, metrics: Optional[Sequence[str]] = None):
+        """
+        Initialize the MetricsCollector with different metric calculators.
+
+        Args:
+            uuid (str): The archived generation to score.
+            calculators_im_desc (Dict[str, MetricCalculator], optional): Shared image–description
+                calculators from `build_calculators`. Built for this instance if omitted.
+            calculators_im_im (Dict[str, MetricCalculator], optional): Shared image–image calculators.
+            data_dir (str): Directory holding one folder per UUID.
+            timeout (float, optional): Seconds each calculator may run (METRICS_TIMEOUT, 300); a
+                calculator that takes longer scores 0.0 and is reported in `MetricsResult.errors`.
+            workers (int, optional): Calculators run in parallel (METRICS_WORKERS); defaults to
+                one thread per calculator, at most the CPU count.
+            metrics (Sequence[str] | str, optional): Metrics to build when no calculators are
+                given, e.g. "ssim,clip"; see `build_calculators`.
+        """
         self.uuid = uuid
-        clip_similarity = CLIPSimilarity()
-        object_detection = ObjectDetectionMatching()
-        fid_metric = FIDMetric()
-        ssim_metric = SSIMMetric()
-        
-        self.calculators_im_desc = {
-            'clip_similarity': CLIPSimilarityCalculator(clip_similarity),
-            'object_match_score': ObjectDetectionCalculator(object_detection),
-            'fid_score': FIDCalculator(fid_metric)
-        }
+        if calculators_im_desc is None or calculators_im_im is None:
+            default_im_desc, default_im_im = build_calculators(metrics)
+            calculators_im_desc = default_im_desc if calculators_im_desc is None else calculators_im_desc
+            calculators_im_im = default_im_im if calculators_im_im is None else calculators_im_im
+
+        self.calculators_im_desc = calculators_im_desc
+        self.calculators_im_im = calculators_im_im
+        self.timeout = timeout or float(os.getenv("METRICS_TIMEOUT", 300))
+        self.workers = workers or int(os.getenv("METRICS_WORKERS", 0)) or None
 
-        self.calculators_im_im = {
-            'ssim_metric': SSIMCalculator(ssim_metric)
-        }
-        
         self.image_paths = {
-            'original': os.path.join("storage", "data", uuid, "original.png"),
-            'generated': os.path.join("storage", "data", uuid, "generated.png")
+            image_type: os.path.join(data_dir, uuid, f"{image_type}.png") for image_type in IMAGE_TYPES
         }
-        
-        description_path = os.path.join("storage", "data", uuid, "description.txt")
+
+        description_path = os.path.join(data_dir, uuid, "description.txt")
         with open(description_path, "r") as f:
             self.description = f.read()
 
-    def _compute_metric_im_desc(self, calculator: MetricCalculator, image_path: str) -> float:
+    def _run_calculator(self, name: str, calculator: MetricCalculator, image_image: bool,
+                        started: Dict[str, float]) -> Tuple[Dict[str, float], List[str]]:
+        """Prepare one calculator and compute all of its metrics for this UUID."""
+        started[name] = time.perf_counter()
+        # a call abandoned after a timeout may still be running; wait for it within the budget
+        if not calculator.lock.acquire(timeout=self.timeout):
+            return {}, [f"{name}: still busy with an earlier call after {self.timeout:.0f}s"]
         try:
-            return calculator.compute(image_path, self.description)
-        except Exception as e:
-            print(f"Error computing metric: {str(e)}")
-            return 0.0
+            return self._compute_calculator(name, calculator, image_image)
+        finally:
+            calculator.lock.release()
 
-    def _compute_metric_im_im(self, calculator: MetricCalculator, original_image_path: str, generated_image_path: str) -> float:
+    def _compute_calculator(self, name: str, calculator: MetricCalculator,
+                            image_image: bool) -> Tuple[Dict[str, float], List[str]]:
+        errors = []
         try:
-            return calculator.compute(original_image_path, generated_image_path)
+            calculator.prepare(self.uuid, self.image_paths, self.description)
         except Exception as e:
-            print(f"Error computing metric: {str(e)}")
-            return 0.0
+            logger.error("Error preparing metric %s: %s", name, e)
 
-    def collect_metrics(self) -> Dict[str, float]:
-        """Collect all metrics for the given images and description."""
-        metrics = {}
-        
-        for image_type, image_path in self.image_paths.items():
-            for metric_name, calculator in self.calculators_im_desc.items():
-                metric_key = f"{image_type}_{metric_name}"
-                metrics[metric_key] = self._compute_metric_im_desc(calculator, image_path)
+        if image_image:
+            jobs = {name: (self.image_paths['original'], self.image_paths['generated'])}
+        else:
+            jobs = {f"{image_type}_{name}": (image_path, self.description)
+                    for image_type, image_path in self.image_paths.items()}
+        values = {}
+        for metric_key, args in jobs.items():
+            try:
+                values[metric_key] = calculator.compute(*args)
+            except Exception as e:
+                logger.error("Error computing metric %s: %s", metric_key, e)
+                errors.append(f"{metric_key}: {e}")
+                values[metric_key] = 0.0
+        return values, errors
+
+    def collect(self) -> MetricsResult:
+        """
+        Compute every metric, running the calculators concurrently.
+
+        Both images are decoded once into the shared image cache while the calculators start,
+        so CLIP, YOLO and SSIM reuse the same pixels. Calculators run on a thread pool, which
+        overlaps image decoding, SSIM and the Python-side work with model inference; the torch
+        models each use every core already, so their forward passes gain little from running
+        side by side. Each calculator gets `timeout` seconds from the moment it starts. A
+        calculator that timed out keeps running in the background and holds its `lock`, so the
+        next call on it waits (within its own budget) instead of driving the model from a
+        second thread.
 
-        for metric_name, calculator in self.calculators_im_im.items():
-            metrics[metric_name] = self._compute_metric_im_im(calculator, self.image_paths['original'], self.image_paths['generated'] )
+        Returns:
+            MetricsResult: Metric values keyed like `metric_keys`, latency in seconds per
+                calculator (plus "total"), and error messages.
+        """
+        from .image_cache import decoded_images
 
-        return metrics
+        begin = time.perf_counter()
+        calculators = [(name, calculator, False) for name, calculator in self.calculators_im_desc.items()] \
+            + [(name, calculator, True) for name, calculator in self.calculators_im_im.items()]
+        workers = self.workers or max(1, min(len(calculators), os.cpu_count() or 1))
+        started: Dict[str, float] = {}
+        values: Dict[str, float] = {}
+        latency: Dict[str, float] = {}
+        errors: List[str] = []
+
+        executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="metrics")
+        try:
+            for image_path in self.image_paths.values():
+                # failures surface in the calculators that need the image
+                executor.submit(decoded_images.bgr, image_path)
+            futures: Dict[Future, str] = {
+                executor.submit(self._run_calculator, name, calculator, image_image, started): name
+                for name, calculator, image_image in calculators
+            }
+            pending = set(futures)
+            while pending:
+                budgets = [started[futures[future]] + self.timeout - time.perf_counter()
+                           for future in pending if futures[future] in started]
+                # poll briefly until some calculator has started and has a budget
+                done, pending = wait(pending, timeout=max(min(budgets, default=0.1), 0), return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = futures[future]
+                    latency[name] = time.perf_counter() - started[name]
+                    calculator_values, calculator_errors = future.result()
+                    values.update(calculator_values)
+                    errors.extend(calculator_errors)
+                for future in list(pending):
+                    name = futures[future]
+                    if name in started and time.perf_counter() - started[name] >= self.timeout:
+                        logger.error("Metric %s timed out after %.0fs", name, self.timeout)
+                        errors.append(f"{name}: timed out after {self.timeout:.0f}s")
+                        latency[name] = time.perf_counter() - started[name]
+                        pending.discard(future)
+        finally:
+            # a timed-out calculator keeps its thread until it returns; do not wait for it
+            executor.shutdown(wait=False, cancel_futures=True)
+
+        metrics = {key: values.get(key, 0.0) for key in metric_keys(self.calculators_im_desc, self.calculators_im_im)}
+        latency = {name: latency[name] for name, _, _ in calculators if name in latency}
+        latency["total"] = time.perf_counter() - begin
+        return MetricsResult(metrics, latency, errors)
+
+    def collect_metrics(self) -> Dict[str, float]:
+        """Collect all metrics for the given images and description."""
+        return self.collect().metrics
 
     def print_metrics(self, metrics: Dict[str, float]):
         """Print the collected metrics in a formatted manner."""
@@ -105,5 +372,6 @@ class MetricsCollector:
 
     def analyze(self):
         """Analyze the images and description, collect metrics, and print the results."""
-        metrics = self.collect_metrics()
-        self.print_metrics(metrics)
\ No newline at end of file
+        result = self.collect()
+        self.print_metrics(result.metrics)
+        logger.info("Metric latency: %s", ", ".join(f"{name} {seconds:.2f}s" for name, seconds in result.latency.items()))
\ No newline at end of file
@@ -1,23 +1,87 @@
-from typing import Set
-from transformers import pipeline
+import hashlib
+import logging
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Sequence, Set, Tuple
+import torch
 from nltk import pos_tag, word_tokenize
 from nltk.corpus import stopwords
 from nltk.stem import WordNetLemmatizer
 import nltk
 from ultralytics import YOLO
 
+from .image_cache import decoded_images
+from .onnx_backend import build_ner_pipeline, export_yolo, get_backend
+
+logger = logging.getLogger(__name__)
+
+# NLTK resources and where nltk.data.find looks for them
+NLTK_RESOURCES = {
+    'punkt': 'tokenizers/punkt',
+    'punkt_tab': 'tokenizers/punkt_tab',
+    'averaged_perceptron_tagger': 'taggers/averaged_perceptron_tagger',
+    'averaged_perceptron_tagger_eng': 'taggers/averaged_perceptron_tagger_eng',
+    'stopwords': 'corpora/stopwords',
+    'wordnet': 'corpora/wordnet',
+}
+_nltk_checked = False
+_nltk_lock = threading.Lock()
+
+def ensure_nltk_data() -> None:
+    """Download missing NLTK resources; probes only once per process."""
+    global _nltk_checked
+    with _nltk_lock:
+        if _nltk_checked:
+            return
+        for data, resource in NLTK_RESOURCES.items():
+            try:
+                nltk.data.find(resource)
+            except LookupError:
+                logger.info("Downloading NLTK data %s", data)
+                nltk.download(data, quiet=True)
+        _nltk_checked = True
+
 class ObjectDetectionMatching:
     """A class for matching objects detected in images with objects mentioned in text."""
 
-    def __init__(self, model_path: str = "yolov8s.pt"):
+    def __init__(self, model_path: str = "yolov8s.pt", imgsz: Optional[int] = None, conf: Optional[float] = None,
+                 batch_size: Optional[int] = None, threads: Optional[int] = None, device: Optional[str] = None,
+                 cache_size: Optional[int] = None, backend: Optional[str] = None):
         """
         Initialize the ObjectDetectionMatching class.
 
         Args:
             model_path (str): Path to the YOLO model file. Defaults to "yolov8s.pt".
+            imgsz (int, optional): Inference image size (YOLO_IMGSZ, 640); smaller is faster on CPU.
+            conf (float, optional): Minimum detection confidence (YOLO_CONF, 0.25).
+            batch_size (int, optional): Images per YOLO forward pass (YOLO_BATCH_SIZE, 16).
+            threads (int, optional): Torch intra-op threads for CPU inference (YOLO_THREADS);
+                left to torch when unset.
+            device (str, optional): Inference device (YOLO_DEVICE), e.g. "cpu"; chosen by YOLO when unset.
+            cache_size (int, optional): Detections and text extractions memoized (OBJECT_MATCH_CACHE_SIZE, 1024).
+            backend (str, optional): "torch", "onnx" or "onnx-int8" (METRICS_BACKEND, torch); the ONNX
+                variants export YOLO and the NER model on first use and run them in ONNX Runtime.
         """
-        self.detector = YOLO(model_path)
-        self.nlp = pipeline("ner")
+        self.imgsz = imgsz or int(os.getenv("YOLO_IMGSZ", 640))
+        self.conf = conf or float(os.getenv("YOLO_CONF", 0.25))
+        self.batch_size = batch_size or int(os.getenv("YOLO_BATCH_SIZE", 16))
+        self.device = device or os.getenv("YOLO_DEVICE") or None
+        self.cache_size = cache_size or int(os.getenv("OBJECT_MATCH_CACHE_SIZE", 1024))
+        threads = threads or int(os.getenv("YOLO_THREADS", 0))
+        if threads:
+            torch.set_num_threads(threads)
+        self._image_objects: "OrderedDict[Tuple[str, ...], Set[str]]" = OrderedDict()
+        self._text_objects: "OrderedDict[str, Set[str]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.backend = get_backend(backend)
+        if self.backend == "torch":
+            self.detector = YOLO(model_path)
+        else:
+            self.detector = YOLO(export_yolo(model_path, self.imgsz, quantize=self.backend == "onnx-int8"),
+                                 task="detect")
+        self.nlp = build_ner_pipeline(self.backend)
 
         # Download required NLTK data
         self._download_nltk_data()
@@ -27,30 +91,53 @@ class ObjectDetectionMatching:
 
     def _download_nltk_data(self):
         """Download required NLTK data."""
-        required_data = ['punkt', 'punkt_tab', 'averaged_perceptron_tagger', 'averaged_perceptron_tagger_eng', 'stopwords', 'wordnet']
-        for data in required_data:
-            try:
-                nltk.data.find(f'tokenizers/{data}')
-            except LookupError:
-                print(f"Downloading {data}...")
-                nltk.download(data, quiet=True)
+        ensure_nltk_data()
 
     def extract_objects_from_text(self, description: str) -> Set[str]:
         """
         Extract objects from the given text description using NER and noun phrase extraction.
 
+        Results are memoized per description, so scoring the original and the generated image
+        against the same description parses it once.
+
         Args:
             description (str): Text description to extract objects from.
 
         Returns:
             Set[str]: Set of extracted objects.
         """
+        return self.extract_objects_from_texts([description])[0]
+
+    def extract_objects_from_texts(self, descriptions: Sequence[str]) -> List[Set[str]]:
+        """
+        Extract objects from many descriptions, running the NER pipeline once over the uncached ones.
+
+        Args:
+            descriptions (Sequence[str]): Text descriptions.
+
+        Returns:
+            List[Set[str]]: Extracted objects per description, in input order.
+        """
+        keys = [hashlib.sha1(description.encode("utf-8")).hexdigest() for description in descriptions]
+        results = [self._cached(self._text_objects, key) for key in keys]
+        missing = {key: description for key, description, result in zip(keys, descriptions, results)
+                   if result is None}
+        if missing:
+            entities = self.nlp(list(missing.values()), batch_size=self.batch_size)
+            parsed = {}
+            for (key, description), ner_entities in zip(missing.items(), entities):
+                parsed[key] = self._parse_text(description, ner_entities)
+                self._remember(self._text_objects, key, parsed[key])
+            results = [parsed[key] if result is None else result for key, result in zip(keys, results)]
+        return [set(result) for result in results]
+
+    def _parse_text(self, description: str, ner_entities: List[Dict]) -> Set[str]:
+        """Combine NER entities with noun phrases from NLTK POS tags."""
         # Tokenize and POS tag the description
         tokens = word_tokenize(description.lower())
         pos_tags = pos_tag(tokens)
 
         # Extract named entities
-        ner_entities = self.nlp(description)
         named_entities = {entity['word'].lower() for entity in ner_entities}
 
         # Extract noun phrases and single nouns
@@ -84,12 +171,33 @@ class ObjectDetectionMatching:
         Returns:
             Set[str]: Set of detected objects.
         """
-        results = self.detector(image_path)
-        return {
-            result.names[int(box.cls)].lower()
-            for result in results
-            for box in result.boxes
-        }
+        return self.detect_objects_in_images([image_path])[0]
+
+    def detect_objects_in_images(self, image_paths: Sequence[str]) -> List[Set[str]]:
+        """
+        Detect objects in many images, `batch_size` images per forward pass.
+
+        Images are decoded through the shared image cache, and detections are memoized by
+        path, size and modification time.
+
+        Args:
+            image_paths (Sequence[str]): Paths to the image files.
+
+        Returns:
+            List[Set[str]]: Detected object names per image, in input order.
+        """
+        keys = [self._image_key(path) for path in image_paths]
+        results = [self._cached(self._image_objects, key) for key in keys]
+        missing = [index for index, result in enumerate(results) if result is None]
+        for start in range(0, len(missing), self.batch_size):
+            batch = missing[start:start + self.batch_size]
+            predictions = self.detector.predict([decoded_images.bgr(image_paths[index]) for index in batch],
+                                                imgsz=self.imgsz, conf=self.conf, device=self.device,
+                                                batch=len(batch), verbose=False)
+            for index, result in zip(batch, predictions):
+                results[index] = {result.names[int(box.cls)].lower() for box in result.boxes}
+                self._remember(self._image_objects, keys[index], results[index])
+        return [set(result) for result in results]
 
     def compute_object_match_score(self, image_path: str, description: str) -> float:
         """
@@ -106,8 +214,8 @@ class ObjectDetectionMatching:
             text_objects = self.extract_objects_from_text(description)
             image_objects = self.detect_objects_in_image(image_path)
 
-            print(f"Text objects: {text_objects}")
-            print(f"Image objects: {image_objects}")
+            logger.debug("Text objects: %s", text_objects)
+            logger.debug("Image objects: %s", image_objects)
 
             if not text_objects or not image_objects:
                 return 0.0
@@ -115,5 +223,45 @@ class ObjectDetectionMatching:
             matches = len(text_objects & image_objects)
             return (matches / len(text_objects)) * 100
         except Exception as e:
-            print(f"Error computing object match score: {str(e)}")
-            return 0.0
\ No newline at end of file
+            logger.error("Error computing object match score: %s", e)
+            return 0.0
+
+    def compute_object_match_scores(self, image_paths: Sequence[str], descriptions: Sequence[str]) -> List[float]:
+        """
+        Compute match scores for many image/description pairs with batched detection and NER.
+
+        Args:
+            image_paths (Sequence[str]): Paths to the image files.
+            descriptions (Sequence[str]): Text descriptions, one per image.
+
+        Returns:
+            List[float]: Match scores as percentages, in input order.
+        """
+        self.detect_objects_in_images(image_paths)
+        self.extract_objects_from_texts(descriptions)
+        return [self.compute_object_match_score(path, description)
+                for path, description in zip(image_paths, descriptions)]
+
+    def clear_cache(self) -> None:
+        """Forget memoized detections and text extractions."""
+        with self._lock:
+            self._image_objects.clear()
+            self._text_objects.clear()
+
+    def _cached(self, cache: OrderedDict, key):
+        with self._lock:
+            value = cache.get(key)
+            if value is not None:
+                cache.move_to_end(key)
+            return value
+
+    def _remember(self, cache: OrderedDict, key, value) -> None:
+        with self._lock:
+            cache[key] = value
+            while len(cache) > self.cache_size:
+                cache.popitem(last=False)
+
+    @staticmethod
+    def _image_key(image_path: str) -> Tuple[str, ...]:
+        stat = os.stat(image_path)
+        return (os.path.abspath(image_path), str(stat.st_size), str(stat.st_mtime_ns))
\ No newline at end of file
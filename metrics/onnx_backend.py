@@ -0,0 +1,305 @@
+"""
+ONNX Runtime backends for the metrics models, with optional int8 dynamic quantization.
+
+The backend is chosen with METRICS_BACKEND: "torch" (default), "onnx" or "onnx-int8". Models
+are exported on first use into METRICS_ONNX_DIR (storage/models/onnx) and reused afterwards.
+
+Usage:
+    python -m metrics.onnx_backend export --backend onnx-int8
+    python -m metrics.onnx_backend check --backend onnx-int8 [--images storage/data/<uuid>]
+
+`check` compares the ONNX backend against PyTorch on the same inputs and exits with status 1
+if CLIP embeddings, YOLO detections or NER entities drift beyond the thresholds.
+"""
+
+import argparse
+import json
+import logging
+import os
+import re
+import shutil
+import sys
+from typing import Dict, List, Optional
+
+import numpy as np
+import torch
+
+logger = logging.getLogger(__name__)
+
+BACKENDS = ("torch", "onnx", "onnx-int8")
+NER_MODEL = "dbmdz/bert-large-cased-finetuned-conll03-english"
+OPSET = 17
+
+
+def get_backend(backend: Optional[str] = None) -> str:
+    """
+    Return the requested backend, defaulting to METRICS_BACKEND (torch).
+
+    Raises:
+        ValueError: If the backend is unknown.
+    """
+    backend = (backend or os.getenv("METRICS_BACKEND", "torch")).lower()
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown METRICS_BACKEND: {backend}")
+    return backend
+
+
+def onnx_dir() -> str:
+    return os.getenv("METRICS_ONNX_DIR", os.path.join("storage", "models", "onnx"))
+
+
+def _slug(name: str) -> str:
+    return re.sub(r"[^A-Za-z0-9_.-]+", "_", name)
+
+
+def _session(path: str):
+    import onnxruntime as ort
+
+    options = ort.SessionOptions()
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    threads = int(os.getenv("METRICS_ONNX_THREADS", 0))
+    if threads:
+        options.intra_op_num_threads = threads
+    return ort.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+
+
+def _quantize(source: str, target: str) -> None:
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    quantize_dynamic(source, target, weight_type=QuantType.QInt8)
+
+
+class _VisionTower(torch.nn.Module):
+    def __init__(self, model):
+        super().__init__()
+        self.vision_model = model.vision_model
+        self.visual_projection = model.visual_projection
+
+    def forward(self, pixel_values):
+        return self.visual_projection(self.vision_model(pixel_values=pixel_values).pooler_output)
+
+
+class _TextTower(torch.nn.Module):
+    def __init__(self, model):
+        super().__init__()
+        self.text_model = model.text_model
+        self.text_projection = model.text_projection
+
+    def forward(self, input_ids, attention_mask):
+        return self.text_projection(self.text_model(input_ids=input_ids, attention_mask=attention_mask).pooler_output)
+
+
+def export_clip(model_name: str, quantize: bool, output_dir: Optional[str] = None) -> str:
+    """
+    Export CLIP's image and text encoders (with their projections) to ONNX.
+
+    Args:
+        model_name (str): HuggingFace CLIP checkpoint.
+        quantize (bool): Quantize weights to int8.
+        output_dir (str, optional): Export root. Defaults to METRICS_ONNX_DIR.
+
+    Returns:
+        str: Directory with `vision.onnx`, `text.onnx` and `meta.json`; reused if it exists.
+    """
+    from transformers import CLIPModel
+
+    target = os.path.join(output_dir or onnx_dir(), _slug(model_name) + ("-int8" if quantize else ""))
+    if os.path.exists(os.path.join(target, "meta.json")):
+        return target
+    os.makedirs(target, exist_ok=True)
+    model = CLIPModel.from_pretrained(model_name).eval()
+    image_size = model.config.vision_config.image_size
+    towers = {
+        "vision": (_VisionTower(model), (torch.zeros(1, 3, image_size, image_size),), ["pixel_values"],
+                   {"pixel_values": {0: "batch"}, "embeds": {0: "batch"}}),
+        "text": (_TextTower(model), (torch.ones(1, 8, dtype=torch.long), torch.ones(1, 8, dtype=torch.long)),
+                 ["input_ids", "attention_mask"],
+                 {"input_ids": {0: "batch", 1: "sequence"}, "attention_mask": {0: "batch", 1: "sequence"},
+                  "embeds": {0: "batch"}}),
+    }
+    for name, (tower, args, input_names, dynamic_axes) in towers.items():
+        path = os.path.join(target, f"{name}.onnx")
+        export_path = f"{path}.fp32" if quantize else path
+        torch.onnx.export(tower, args, export_path, input_names=input_names, output_names=["embeds"],
+                          dynamic_axes=dynamic_axes, opset_version=OPSET, dynamo=False)
+        if quantize:
+            _quantize(export_path, path)
+            os.remove(export_path)
+    with open(os.path.join(target, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump({
+            "model_name": model_name,
+            "logit_scale": model.logit_scale.exp().item(),
+            "projection_dim": model.config.projection_dim,
+            "max_position_embeddings": model.config.text_config.max_position_embeddings,
+        }, f)
+    return target
+
+
+class OnnxClipEncoder:
+    """Runs CLIP's exported image and text encoders with ONNX Runtime."""
+
+    def __init__(self, directory: str):
+        with open(os.path.join(directory, "meta.json"), "r", encoding="utf-8") as f:
+            self.meta = json.load(f)
+        self.vision = _session(os.path.join(directory, "vision.onnx"))
+        self.text = _session(os.path.join(directory, "text.onnx"))
+
+    def encode_images(self, pixel_values: np.ndarray) -> np.ndarray:
+        return self.vision.run(None, {"pixel_values": pixel_values.astype(np.float32)})[0]
+
+    def encode_texts(self, input_ids: np.ndarray, attention_mask: np.ndarray) -> np.ndarray:
+        return self.text.run(None, {"input_ids": input_ids.astype(np.int64),
+                                    "attention_mask": attention_mask.astype(np.int64)})[0]
+
+
+def export_yolo(model_path: str, imgsz: int, quantize: bool, output_dir: Optional[str] = None) -> str:
+    """
+    Export a YOLO detector to ONNX with a dynamic batch dimension.
+
+    Args:
+        model_path (str): YOLO weights, e.g. "yolov8s.pt".
+        imgsz (int): Inference image size baked into the export.
+        quantize (bool): Quantize weights to int8.
+        output_dir (str, optional): Export root. Defaults to METRICS_ONNX_DIR.
+
+    Returns:
+        str: Path of the ONNX model, which `YOLO(path, task="detect")` loads; reused if it exists.
+    """
+    from ultralytics import YOLO
+
+    directory = output_dir or onnx_dir()
+    stem = os.path.splitext(os.path.basename(model_path))[0]
+    target = os.path.join(directory, f"{stem}-{imgsz}{'-int8' if quantize else ''}.onnx")
+    if os.path.exists(target):
+        return target
+    os.makedirs(directory, exist_ok=True)
+    exported = YOLO(model_path).export(format="onnx", imgsz=imgsz, dynamic=True, simplify=False, opset=OPSET)
+    if quantize:
+        _quantize(exported, target)
+    else:
+        shutil.copyfile(exported, target)
+    return target
+
+
+def build_ner_pipeline(backend: str):
+    """
+    Build the token-classification pipeline used for text-object extraction.
+
+    The ONNX variants need `optimum[onnxruntime]`.
+    """
+    from transformers import AutoTokenizer, pipeline
+
+    if backend == "torch":
+        return pipeline("ner")
+    from optimum.onnxruntime import ORTModelForTokenClassification, ORTQuantizer
+    from optimum.onnxruntime.configuration import AutoQuantizationConfig
+
+    target = os.path.join(onnx_dir(), _slug(NER_MODEL))
+    if not os.path.exists(os.path.join(target, "model.onnx")):
+        ORTModelForTokenClassification.from_pretrained(NER_MODEL, export=True).save_pretrained(target)
+        AutoTokenizer.from_pretrained(NER_MODEL).save_pretrained(target)
+    file_name = "model.onnx"
+    if backend == "onnx-int8":
+        file_name = "model_quantized.onnx"
+        if not os.path.exists(os.path.join(target, file_name)):
+            ORTQuantizer.from_pretrained(target).quantize(
+                save_dir=target, quantization_config=AutoQuantizationConfig.avx2(is_static=False, per_channel=False))
+    model = ORTModelForTokenClassification.from_pretrained(target, file_name=file_name)
+    return pipeline("ner", model=model, tokenizer=AutoTokenizer.from_pretrained(target))
+
+
+def _sample_images(directory: Optional[str], count: int = 8) -> List[str]:
+    """Return images from a directory, or draw synthetic sketches into a temporary one."""
+    if directory:
+        paths = [os.path.join(root, name) for root, _, names in os.walk(directory) for name in sorted(names)
+                 if name.lower().endswith((".png", ".jpg", ".jpeg"))]
+        return paths[:count]
+    import tempfile
+    from PIL import Image, ImageDraw
+
+    rng = np.random.default_rng(0)
+    target = tempfile.mkdtemp(prefix="parity-")
+    paths = []
+    for index in range(count):
+        image = Image.new("RGB", (512, 512), "white")
+        draw = ImageDraw.Draw(image)
+        for _ in range(12):
+            draw.line(tuple(rng.integers(0, 512, 4).tolist()), fill=tuple(rng.integers(0, 255, 3).tolist()), width=4)
+        paths.append(os.path.join(target, f"{index}.png"))
+        image.save(paths[-1])
+    return paths
+
+
+SAMPLE_TEXTS = [
+    "A red car parked next to a tree in Paris.",
+    "A cat sitting on a wooden chair by the window.",
+    "Two people walking a dog along the beach at sunset.",
+    "A bowl of fruit with apples and bananas on a kitchen table.",
+]
+
+
+def check_parity(backend: str, images: List[str], texts: List[str]) -> Dict[str, Dict[str, float]]:
+    """
+    Compare a backend against PyTorch on the same inputs.
+
+    Returns:
+        Dict[str, Dict[str, float]]: Per model: the minimum cosine similarity of CLIP embeddings,
+            and the mean Jaccard agreement of YOLO detections and NER entities.
+    """
+    from .clip_embedder import ClipEmbedder
+    from .object_detection_matching import ObjectDetectionMatching
+
+    report = {}
+    reference = ClipEmbedder(backend="torch", store=None, cache_size=1)
+    candidate = ClipEmbedder(backend=backend, store=None, cache_size=1)
+    report["clip"] = {
+        "image_min_cosine": float(np.min(np.sum(reference.embed_images(images) * candidate.embed_images(images), 1))),
+        "text_min_cosine": float(np.min(np.sum(reference.embed_texts(texts) * candidate.embed_texts(texts), 1))),
+    }
+    del reference, candidate
+
+    reference = ObjectDetectionMatching(backend="torch", cache_size=1)
+    candidate = ObjectDetectionMatching(backend=backend, cache_size=1)
+    report["yolo"] = {"mean_jaccard": _mean_jaccard(reference.detect_objects_in_images(images),
+                                                    candidate.detect_objects_in_images(images))}
+    report["ner"] = {"mean_jaccard": _mean_jaccard(reference.extract_objects_from_texts(texts),
+                                                   candidate.extract_objects_from_texts(texts))}
+    return report
+
+
+def _mean_jaccard(expected: List[set], actual: List[set]) -> float:
+    scores = [len(a & b) / len(a | b) if a | b else 1.0 for a, b in zip(expected, actual)]
+    return float(np.mean(scores)) if scores else 1.0
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Export ONNX metrics models and check them against PyTorch.")
+    parser.add_argument("command", choices=("export", "check"))
+    parser.add_argument("--backend", default="onnx-int8", choices=BACKENDS[1:])
+    parser.add_argument("--images", help="Directory with images for the parity check (default: synthetic sketches).")
+    parser.add_argument("--min-cosine", type=float, default=0.99, help="CLIP embedding threshold (default: 0.99).")
+    parser.add_argument("--min-jaccard", type=float, default=0.8, help="YOLO/NER agreement threshold (default: 0.8).")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO").upper(),
+                        format="%(asctime)s %(levelname)s %(name)s %(message)s")
+
+    if args.command == "export":
+        from .clip_embedder import ClipEmbedder
+        from .object_detection_matching import ObjectDetectionMatching
+
+        ClipEmbedder(backend=args.backend, store=None)
+        ObjectDetectionMatching(backend=args.backend)
+        logger.info("Exported %s models to %s", args.backend, onnx_dir())
+        return
+
+    report = check_parity(args.backend, _sample_images(args.images), SAMPLE_TEXTS)
+    print(json.dumps(report, indent=2))
+    passed = (report["clip"]["image_min_cosine"] >= args.min_cosine
+              and report["clip"]["text_min_cosine"] >= args.min_cosine
+              and report["yolo"]["mean_jaccard"] >= args.min_jaccard
+              and report["ner"]["mean_jaccard"] >= args.min_jaccard)
+    sys.exit(0 if passed else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,293 @@
+"""
+A resident scoring service that keeps the metric models loaded and micro-batches requests.
+
+Usage:
+    python -m metrics.scoring_server --port 8765 --metrics clip,yolo,ssim
+
+The web process posts `{"uuid": "..."}` to `/score` once a generation is archived (see
+`service.scoring_client`). Requests that arrive within `--max-wait-ms` of each other, up to
+`--max-batch`, are scored together: CLIP, YOLO and the NER pipeline each run one batched
+forward pass for the whole batch. Generations are read from the local archive (`--data-dir`),
+or downloaded from S3 when `--s3-prefix` is given and the folder is not local.
+"""
+
+import argparse
+import json
+import logging
+import os
+import queue
+import threading
+import time
+import uuid as uuid_lib
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, Generic, List, Optional, Tuple, TypeVar
+
+from .metrics_collector import MetricsCollector, build_calculators
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+class MicroBatcher(Generic[T, R]):
+    """
+    Collects concurrently submitted items into batches for one handler call.
+
+    A batch is dispatched when it holds `max_batch` items or `max_wait` seconds after its
+    first item arrived, whichever comes first. The handler returns one result per item; an
+    Exception instance in its place fails only that item's future. Items whose future was
+    cancelled while they waited (their caller gave up) are dropped.
+    """
+
+    def __init__(self, handler: Callable[[List[T]], List[Any]], max_batch: int, max_wait: float):
+        self.handler = handler
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self._queue: "queue.Queue[Optional[Tuple[T, Future]]]" = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="scoring-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, item: T) -> "Future[R]":
+        future: "Future[R]" = Future()
+        self._queue.put((item, future))
+        return future
+
+    def close(self, timeout: Optional[float] = None) -> None:
+        """Finish the queued items and stop the batching thread."""
+        self._queue.put(None)
+        self._thread.join(timeout)
+
+    def _run(self) -> None:
+        while True:
+            first = self._queue.get()
+            if first is None:
+                return
+            batch = [first]
+            deadline = time.monotonic() + self.max_wait
+            stop = False
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    entry = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if entry is None:
+                    stop = True
+                    break
+                batch.append(entry)
+            self._dispatch(batch)
+            if stop:
+                return
+
+    def _dispatch(self, batch: List[Tuple[T, Future]]) -> None:
+        batch = [(item, future) for item, future in batch if future.set_running_or_notify_cancel()]
+        if not batch:
+            return
+        try:
+            results = self.handler([item for item, _ in batch])
+        except Exception as e:
+            logger.exception("Scoring batch of %d failed", len(batch))
+            results = [e] * len(batch)
+        for (_, future), result in zip(batch, results):
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+
+class ScoringService:
+    """Scores archived generations with models loaded once, micro-batching concurrent requests."""
+
+    def __init__(self, metrics: Optional[str] = None, data_dir: str = os.path.join("storage", "data"),
+                 s3_prefix: Optional[str] = None, max_batch: Optional[int] = None,
+                 max_wait: Optional[float] = None):
+        """
+        Initialize the ScoringService and load the selected metric models.
+
+        Args:
+            metrics (str, optional): Comma-separated metric names or aliases; all by default.
+            data_dir (str): Local archive with one folder per UUID.
+            s3_prefix (str, optional): S3 prefix to download generations from when not local.
+            max_batch (int, optional): Most requests scored together (SCORER_MAX_BATCH, 16).
+            max_wait (float, optional): Seconds to wait for more requests after the first one
+                (SCORER_MAX_WAIT_MS / 1000, 0.02).
+        """
+        self.data_dir = data_dir
+        self.calculators_im_desc, self.calculators_im_im = build_calculators(metrics)
+        self.source = None
+        if s3_prefix:
+            from .batch_evaluate import S3Source
+
+            self.source = S3Source(s3_prefix)
+        self.batches = 0
+        self.scored = 0
+        self.batcher: MicroBatcher[str, Dict[str, Any]] = MicroBatcher(
+            self._score_batch,
+            max_batch or int(os.getenv("SCORER_MAX_BATCH", 16)),
+            max_wait if max_wait is not None else float(os.getenv("SCORER_MAX_WAIT_MS", 20)) / 1000,
+        )
+
+    @property
+    def metric_names(self) -> List[str]:
+        return [*self.calculators_im_desc, *self.calculators_im_im]
+
+    def score(self, uuid: str, timeout: Optional[float] = None) -> Dict[str, Any]:
+        """
+        Score one generation, batched with any concurrent requests.
+
+        Raises:
+            ValueError: If `uuid` is not a UUID.
+            FileNotFoundError: If the generation is not in the archive.
+            TimeoutError: If scoring takes longer than `timeout` seconds.
+        """
+        uuid = str(uuid_lib.UUID(uuid))
+        future = self.batcher.submit(uuid)
+        try:
+            return future.result(timeout)
+        except FutureTimeoutError:
+            future.cancel()  # drops it unless its batch has already started
+            raise TimeoutError(f"Scoring {uuid} took longer than {timeout}s") from None
+
+    def _score_batch(self, uuids: List[str]) -> List[Any]:
+        """Score a micro-batch; a generation that cannot be fetched or scored fails only its own request."""
+        started = time.perf_counter()
+        collectors: Dict[str, Any] = {}
+        cleanups = []
+        items = []
+        try:
+            for uuid in dict.fromkeys(uuids):
+                try:
+                    data_dir = self.data_dir
+                    if self.source is not None and not os.path.isdir(os.path.join(data_dir, uuid)):
+                        data_dir, tmp = self.source.fetch(uuid)
+                        cleanups.append(tmp)
+                    collectors[uuid] = MetricsCollector(uuid, self.calculators_im_desc, self.calculators_im_im,
+                                                        data_dir=data_dir)
+                except FileNotFoundError as e:
+                    collectors[uuid] = FileNotFoundError(f"Generation {uuid} not found: {e}")
+                except Exception as e:
+                    logger.warning("Failed to load generation %s: %s", uuid, e)
+                    collectors[uuid] = e
+
+            items = [(uuid, collector.image_paths, collector.description)
+                     for uuid, collector in collectors.items() if isinstance(collector, MetricsCollector)]
+            for name, calculator in [*self.calculators_im_desc.items(), *self.calculators_im_im.items()]:
+                try:
+                    with calculator.lock:
+                        calculator.prepare_batch(items)
+                except Exception as e:
+                    logger.error("Error preparing metric %s for a batch: %s", name, e)
+
+            # the models ran once for the whole batch above; collecting is mostly cache hits
+            results = {}
+            for uuid, collector in collectors.items():
+                if isinstance(collector, Exception):
+                    results[uuid] = collector
+                    continue
+                try:
+                    result = collector.collect()
+                except Exception as e:
+                    logger.warning("Failed to score %s: %s", uuid, e)
+                    results[uuid] = e
+                    continue
+                results[uuid] = {"uuid": uuid, "metrics": result.metrics, "latency": result.latency,
+                                 "errors": result.errors, "batch_size": len(collectors)}
+        finally:
+            for tmp in cleanups:
+                tmp.cleanup()
+        self.batches += 1
+        self.scored += len(items)
+        logger.info("Scored a batch of %d in %.3fs", len(collectors), time.perf_counter() - started)
+        return [results[uuid] for uuid in uuids]
+
+
+class ScoringRequestHandler(BaseHTTPRequestHandler):
+    """JSON API: `POST /score` with {"uuid": ...}, and `GET /healthz`."""
+
+    service: ScoringService
+    timeout_seconds: float = 60.0
+
+    def do_GET(self) -> None:
+        if self.path != "/healthz":
+            self._send(404, {"error": "Not found"})
+            return
+        self._send(200, {"status": "ok", "metrics": self.service.metric_names,
+                         "batches": self.service.batches, "scored": self.service.scored})
+
+    def do_POST(self) -> None:
+        if self.path != "/score":
+            self._send(404, {"error": "Not found"})
+            return
+        try:
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            result = self.service.score(str(body.get("uuid", "")), self.timeout_seconds)
+        except (ValueError, AttributeError) as e:
+            self._send(400, {"error": f"Invalid request: {e}"})
+        except FileNotFoundError as e:
+            self._send(404, {"error": str(e)})
+        except TimeoutError:
+            self._send(504, {"error": f"Scoring took longer than {self.timeout_seconds:.0f}s"})
+        except Exception as e:
+            logger.exception("Scoring failed")
+            self._send(500, {"error": str(e)})
+        else:
+            self._send(200, result)
+
+    def log_message(self, format: str, *args) -> None:
+        logger.debug("%s %s", self.address_string(), format % args)
+
+    def _send(self, status: int, body: Dict[str, Any]) -> None:
+        payload = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+
+def make_server(service: ScoringService, host: str, port: int, timeout: float = 60.0) -> ThreadingHTTPServer:
+    """Bind a threaded HTTP server for the service; each request waits on its batch in its own thread."""
+    handler = type("BoundScoringRequestHandler", (ScoringRequestHandler,),
+                   {"service": service, "timeout_seconds": timeout})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Resident metrics scoring service.")
+    parser.add_argument("--host", default=os.getenv("SCORER_HOST", "127.0.0.1"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("SCORER_PORT", 8765)))
+    parser.add_argument("--metrics", help="Comma-separated metrics to compute, e.g. clip,yolo,ssim (default: all).")
+    parser.add_argument("--data-dir", default=os.path.join("storage", "data"),
+                        help="Local archive with one folder per UUID (default: storage/data).")
+    parser.add_argument("--s3-prefix", help="Download generations missing locally from this S3 prefix.")
+    parser.add_argument("--max-batch", type=int, help="Most requests scored together (SCORER_MAX_BATCH, 16).")
+    parser.add_argument("--max-wait-ms", type=float,
+                        help="Wait for more requests after the first one (SCORER_MAX_WAIT_MS, 20).")
+    parser.add_argument("--timeout", type=float, default=60.0, help="Seconds a request may wait (default: 60).")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO").upper(),
+                        format="%(asctime)s %(levelname)s %(name)s %(message)s")
+    started = time.perf_counter()
+    service = ScoringService(args.metrics, args.data_dir, args.s3_prefix, args.max_batch,
+                             args.max_wait_ms / 1000 if args.max_wait_ms is not None else None)
+    server = make_server(service, args.host, args.port, args.timeout)
+    logger.info("Loaded %s in %.1fs; listening on http://%s:%d", ", ".join(service.metric_names),
+                time.perf_counter() - started, args.host, args.port)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.batcher.close(args.timeout)
+
+
+if __name__ == "__main__":
+    main()
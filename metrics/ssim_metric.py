@@ -1,9 +1,17 @@
 """Module for computing Structural Similarity Index (SSIM) between images."""
 
-from typing import Tuple
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from typing import List, Optional, Sequence, Tuple, Union
 import cv2
 import numpy as np
-from skimage.metrics import structural_similarity as ssim
+
+from .image_cache import decoded_images
+
+# Wang et al., "Multi-scale structural similarity for image quality assessment" (2003)
+MS_SSIM_WEIGHTS = (0.0448, 0.2856, 0.3001, 0.2363, 0.1333)
+K1, K2 = 0.01, 0.03
 
 
 class SSIMMetric:
@@ -18,11 +26,22 @@ class SSIMMetric:
       - **0.5–0.8**: Помітні структурні відмінності, але частково схожі.
       - **< 0.5**: Значна різниця в структурі зображень.
     """
-    
-    def __init__(self):
+
+    def __init__(self, eval_size: Optional[int] = None, window: Optional[str] = None):
         """
-        Initialize SSIMMetric with paths to two images.
+        Initialize SSIMMetric.
+
+        Args:
+            eval_size (int, optional): Longer side, in pixels, both images are resized to before
+                scoring (SSIM_EVAL_SIZE); 0 or unset keeps the original image's resolution.
+            window (str, optional): Local statistics window (SSIM_WINDOW): "uniform" (7x7 box,
+                the scikit-image default, so scores match earlier results) or "gaussian" (11x11,
+                sigma 1.5, as in the SSIM paper). MS-SSIM always uses the Gaussian window.
         """
+        self.eval_size = eval_size if eval_size is not None else int(os.getenv("SSIM_EVAL_SIZE", 0))
+        self.window = (window or os.getenv("SSIM_WINDOW", "uniform")).lower()
+        if self.window not in ("uniform", "gaussian"):
+            raise ValueError(f"Unknown SSIM window: {self.window}")
 
     @staticmethod
     def load_and_preprocess_image(image_path: str) -> np.ndarray:
@@ -35,7 +54,7 @@ class SSIMMetric:
         Returns:
             np.ndarray: Grayscale image as a numpy array.
         """
-        return cv2.imread(image_path, cv2.IMREAD_GRAYSCALE)
+        return decoded_images.gray(image_path)
 
     @staticmethod
     def ensure_same_dimensions(image1: np.ndarray, image2: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
@@ -53,17 +72,120 @@ class SSIMMetric:
             image2 = cv2.resize(image2, (image1.shape[1], image1.shape[0]))
         return image1, image2
 
-    def compute_ssim(self, image1_path: str, image2_path: str) -> float:
+    def prepare_pair(self, image1_path: str, image2_path: str) -> Tuple[np.ndarray, np.ndarray]:
+        """Load both images as float32 in [0, 1], at the evaluation resolution and the same size."""
+        image1 = self.load_and_preprocess_image(image1_path)
+        image2 = self.load_and_preprocess_image(image2_path)
+        if self.eval_size:
+            scale = self.eval_size / max(image1.shape)
+            size = (max(1, round(image1.shape[1] * scale)), max(1, round(image1.shape[0] * scale)))
+            image1 = cv2.resize(image1, size, interpolation=cv2.INTER_AREA if scale < 1 else cv2.INTER_LINEAR)
+            image2 = cv2.resize(image2, size, interpolation=cv2.INTER_AREA)
+        image1, image2 = self.ensure_same_dimensions(image1, image2)
+        return image1.astype(np.float32) / 255, image2.astype(np.float32) / 255
+
+    def compute_ssim(self, image1_path: str, image2_path: str,
+                     full: bool = False) -> Union[float, Tuple[float, np.ndarray]]:
         """
         Compute the Structural Similarity Index (SSIM) between two images.
 
+        Args:
+            image1_path (str): Path to the reference (original) image.
+            image2_path (str): Path to the compared (generated) image.
+            full (bool): Also return the per-pixel SSIM map, cropped by half the window size
+                on each side (the region the score averages over).
+
         Returns:
-            float: SSIM score between the two images.
+            float: SSIM score between the two images, or (score, map) if `full`.
         """
-        image1 = self.load_and_preprocess_image(image1_path)
-        image2 = self.load_and_preprocess_image(image2_path)
+        image1, image2 = self.prepare_pair(image1_path, image2_path)
+        ssim_map, _ = self._ssim_maps(image1, image2, self.window)
+        score = float(ssim_map.mean())
+        return (score, ssim_map) if full else score
+
+    def compute_ms_ssim(self, image1_path: str, image2_path: str) -> float:
+        """
+        Compute multi-scale SSIM: contrast-structure terms over successive 2x downsamplings,
+        with the full SSIM at the coarsest scale. Scales that would get smaller than the
+        window are dropped and the remaining weights renormalized.
+
+        Returns:
+            float: MS-SSIM score between the two images.
+        """
+        image1, image2 = self.prepare_pair(image1_path, image2_path)
+        levels = 1
+        while levels < len(MS_SSIM_WEIGHTS) and min(image1.shape) >> levels >= 11:
+            levels += 1
+        weights = np.array(MS_SSIM_WEIGHTS[:levels])
+        weights /= weights.sum()
+
+        score = 1.0
+        for level, weight in enumerate(weights):
+            ssim_map, cs_map = self._ssim_maps(image1, image2, "gaussian")
+            value = ssim_map.mean() if level == levels - 1 else cs_map.mean()
+            score *= max(float(value), 0.0) ** weight
+            if level < levels - 1:
+                size = (image1.shape[1] // 2, image1.shape[0] // 2)
+                image1 = cv2.resize(image1, size, interpolation=cv2.INTER_AREA)
+                image2 = cv2.resize(image2, size, interpolation=cv2.INTER_AREA)
+        return score
+
+    def compute_ssim_batch(self, pairs: Sequence[Tuple[str, str]], multiscale: bool = False,
+                           workers: Optional[int] = None) -> List[float]:
+        """
+        Score many (original, generated) image pairs in a pool of processes.
+
+        Args:
+            pairs (Sequence[Tuple[str, str]]): Image path pairs.
+            multiscale (bool): Compute MS-SSIM instead of SSIM.
+            workers (int, optional): Processes (SSIM_WORKERS, CPU count); 1 scores in-process.
+
+        Returns:
+            List[float]: Scores in input order; NaN for pairs that could not be read.
+        """
+        workers = workers or int(os.getenv("SSIM_WORKERS", 0)) or os.cpu_count() or 1
+        score = partial(_score_pair, self, multiscale)
+        if workers == 1 or len(pairs) < 2:
+            return [score(pair) for pair in pairs]
+        chunksize = max(1, len(pairs) // (workers * 4))
+        with ProcessPoolExecutor(max_workers=min(workers, len(pairs)), initializer=cv2.setNumThreads,
+                                 initargs=(1,)) as executor:
+            return list(executor.map(score, pairs, chunksize=chunksize))
+
+    @staticmethod
+    def _ssim_maps(image1: np.ndarray, image2: np.ndarray, window: str) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Return the SSIM and contrast-structure maps, cropped to where the window fits.
+
+        Local moments come from separable OpenCV filters (a box filter for the uniform
+        window, a Gaussian blur otherwise) over the [0, 1] images.
+        """
+        if window == "uniform":
+            size = 7
+            def blur(image):
+                return cv2.boxFilter(image, -1, (size, size), borderType=cv2.BORDER_REFLECT)
+            cov_norm = size * size / (size * size - 1)  # sample covariance, as scikit-image
+        else:
+            size = 11
+            def blur(image):
+                return cv2.GaussianBlur(image, (size, size), 1.5, borderType=cv2.BORDER_REFLECT)
+            cov_norm = 1.0
+        c1, c2 = K1 ** 2, K2 ** 2
+        mu1, mu2 = blur(image1), blur(image2)
+        mu1_sq, mu2_sq, mu12 = mu1 * mu1, mu2 * mu2, mu1 * mu2
+        sigma1_sq = cov_norm * (blur(image1 * image1) - mu1_sq)
+        sigma2_sq = cov_norm * (blur(image2 * image2) - mu2_sq)
+        sigma12 = cov_norm * (blur(image1 * image2) - mu12)
+
+        cs_map = (2 * sigma12 + c2) / (sigma1_sq + sigma2_sq + c2)
+        ssim_map = (2 * mu12 + c1) / (mu1_sq + mu2_sq + c1) * cs_map
+        pad = (size - 1) // 2
+        crop = (slice(pad, -pad or None), slice(pad, -pad or None))
+        return ssim_map[crop], cs_map[crop]
 
-        image1, image2 = self.ensure_same_dimensions(image1, image2)
 
-        score, _ = ssim(image1, image2, full=True)
-        return float(score)
\ No newline at end of file
+def _score_pair(metric: SSIMMetric, multiscale: bool, pair: Tuple[str, str]) -> float:
+    try:
+        return metric.compute_ms_ssim(*pair) if multiscale else metric.compute_ssim(*pair)
+    except Exception:
+        return float("nan")
@@ -1,3 +1,4 @@
+import json
 from typing import Dict, Any
 from flask import Request
 
@@ -5,19 +6,29 @@ from flask import Request
 class FileHandler:
     """Handles file-related operations for the application."""
 
-    def get_image_data(self, request: Request) -> str:
+    RAW_IMAGE_TYPES = ("image/png", "application/octet-stream")
+
+    def get_image_data(self, request: Request) -> str | bytes:
         """
         Extract and validate image data from the request.
 
+        JSON bodies carry a base64 string in the "image" field. Multipart uploads
+        (an "image" file part) and raw `image/png` bodies are returned as bytes, so
+        they never go through base64 at all.
+
         Args:
             request (Request): The Flask request object.
 
         Returns:
-            str: The image data.
+            str | bytes: The base64 image data or the raw image bytes.
 
         Raises:
             ValueError: If the image data is missing or empty.
         """
+        if request.mimetype == "multipart/form-data":
+            return self._get_uploaded_file(request)
+        if request.mimetype in self.RAW_IMAGE_TYPES:
+            return self._get_raw_body(request)
         data = self._get_json_data(request)
         self._validate_image_data(data)
         return data["image"]
@@ -26,6 +37,9 @@ class FileHandler:
         """
         Extract JSON data from the request.
 
+        The body is parsed without caching the raw bytes on the request, so only the
+        parsed string stays in memory.
+
         Args:
             request (Request): The Flask request object.
 
@@ -35,11 +49,53 @@ class FileHandler:
         Raises:
             ValueError: If the request does not contain valid JSON data.
         """
-        data = request.get_json()
-        if not data:
+        try:
+            data = json.loads(request.get_data(cache=False))
+        except ValueError:
+            data = None
+        if not data or not isinstance(data, dict):
             raise ValueError("Invalid JSON data in request")
         return data
 
+    def _get_uploaded_file(self, request: Request) -> bytes:
+        """
+        Read the "image" part of a multipart/form-data request.
+
+        Args:
+            request (Request): The Flask request object.
+
+        Returns:
+            bytes: The uploaded image.
+
+        Raises:
+            ValueError: If the image part is missing or empty.
+        """
+        upload = request.files.get("image")
+        if upload is None:
+            raise ValueError("No image data in request")
+        image_bytes = upload.read()
+        if not image_bytes:
+            raise ValueError("Empty image data")
+        return image_bytes
+
+    def _get_raw_body(self, request: Request) -> bytes:
+        """
+        Read a raw binary image body.
+
+        Args:
+            request (Request): The Flask request object.
+
+        Returns:
+            bytes: The image bytes.
+
+        Raises:
+            ValueError: If the body is empty.
+        """
+        image_bytes = request.get_data(cache=False)
+        if not image_bytes:
+            raise ValueError("Empty image data")
+        return image_bytes
+
     def _validate_image_data(self, data: Dict[str, Any]) -> None:
         """
         Validate the presence and content of image data.
@@ -53,4 +109,6 @@ class FileHandler:
         if "image" not in data:
             raise ValueError("No image data in request")
         if not data["image"]:
-            raise ValueError("Empty image data")
\ No newline at end of file
+            raise ValueError("Empty image data")
+        if not isinstance(data["image"], str):
+            raise ValueError("Image data must be a base64 string")
@@ -0,0 +1,178 @@
+import os
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Dict, Optional, Tuple
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import MaxRetryError, NewConnectionError
+
+from .telemetry import UPSTREAM_DURATION, UPSTREAM_RESPONSES
+
+
+class HttpClient:
+    """A pooled HTTP client with timeouts, retries and per-host concurrency limits."""
+
+    RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+    IDEMPOTENT_METHODS = frozenset({"GET", "HEAD", "OPTIONS", "PUT", "DELETE", "TRACE"})
+    MAX_RETRY_AFTER = 60
+
+    def __init__(
+        self,
+        pool_size: Optional[int] = None,
+        connect_timeout: Optional[float] = None,
+        read_timeout: Optional[float] = None,
+        max_retries: Optional[int] = None,
+        backoff_factor: Optional[float] = None,
+        max_per_host: Optional[int] = None,
+    ):
+        """
+        Initialize the HttpClient.
+
+        Every option falls back to an environment variable and then to a default.
+
+        Args:
+            pool_size (int, optional): Keep-alive connections per host (HTTP_POOL_SIZE, 10).
+            connect_timeout (float, optional): Connect timeout in seconds (HTTP_CONNECT_TIMEOUT, 5).
+            read_timeout (float, optional): Read timeout in seconds (HTTP_READ_TIMEOUT, 120).
+            max_retries (int, optional): Retries per request (HTTP_MAX_RETRIES, 2); see `request`.
+            backoff_factor (float, optional): Base backoff in seconds (HTTP_BACKOFF_FACTOR, 0.5).
+            max_per_host (int, optional): Concurrent requests per host (HTTP_MAX_PER_HOST, 8).
+        """
+        self.pool_size = pool_size or int(os.getenv("HTTP_POOL_SIZE", 10))
+        self.connect_timeout = connect_timeout or float(os.getenv("HTTP_CONNECT_TIMEOUT", 5))
+        self.read_timeout = read_timeout or float(os.getenv("HTTP_READ_TIMEOUT", 120))
+        self.max_retries = max_retries if max_retries is not None else int(os.getenv("HTTP_MAX_RETRIES", 2))
+        self.backoff_factor = backoff_factor or float(os.getenv("HTTP_BACKOFF_FACTOR", 0.5))
+        self.max_per_host = max_per_host or int(os.getenv("HTTP_MAX_PER_HOST", 8))
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=self.pool_size, pool_maxsize=self.pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+        self._host_limits: Dict[str, threading.BoundedSemaphore] = {}
+        self._lock = threading.Lock()
+
+    def request(self, method: str, url: str, timeout: Optional[Tuple[float, float]] = None,
+                **kwargs) -> requests.Response:
+        """
+        Send a request, retrying failures that are safe to repeat.
+
+        Idempotent methods are retried on connection errors, timeouts, 429 and 5xx responses.
+        Other methods, such as the billed WorqHat POSTs, are retried only when the server did not
+        process the request: the connection could not be established, or the response is a 429
+        or a 503 with Retry-After. Any other failure may come after the server has already acted
+        on the request. Retries wait at least as long as Retry-After asks.
+
+        Request bodies must be replayable (bytes or dicts, not open files) so that
+        retries resend the same payload.
+
+        Args:
+            method (str): HTTP method.
+            url (str): Request URL.
+            timeout (Tuple[float, float], optional): (connect, read) timeout override.
+            **kwargs: Passed through to `requests.Session.request`.
+
+        Returns:
+            requests.Response: The last response received.
+
+        Raises:
+            RequestException: If the request still fails after all retries.
+        """
+        timeout = timeout or (self.connect_timeout, self.read_timeout)
+        host = urlsplit(url).netloc
+        limit = self._host_limit(host)
+        idempotent = method.upper() in self.IDEMPOTENT_METHODS
+        attempt = 0
+        while True:
+            start = time.perf_counter()
+            delay = self._backoff(attempt)
+            try:
+                with limit:
+                    response = self.session.request(method, url, timeout=timeout, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                UPSTREAM_RESPONSES.inc(host=host, status=type(e).__name__)
+                if attempt >= self.max_retries or not (idempotent or _not_sent(e)):
+                    raise
+            else:
+                UPSTREAM_DURATION.observe(time.perf_counter() - start, host=host)
+                UPSTREAM_RESPONSES.inc(host=host, status=response.status_code)
+                retry_after = _retry_after(response) if response.status_code in (429, 503) else None
+                # a 429, or a 503 with Retry-After, means the request was turned away unprocessed
+                rejected = response.status_code == 429 or retry_after is not None
+                if response.status_code not in self.RETRY_STATUSES or not (idempotent or rejected) \
+                        or attempt >= self.max_retries:
+                    return response
+                if retry_after is not None:
+                    if retry_after > self.MAX_RETRY_AFTER:
+                        return response
+                    delay = max(delay, retry_after)
+                response.close()
+            time.sleep(delay)
+            attempt += 1
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        return self.request("POST", url, **kwargs)
+
+    def _backoff(self, attempt: int) -> float:
+        """Full-jitter exponential backoff."""
+        return random.uniform(0, self.backoff_factor * (2 ** attempt))
+
+    def _host_limit(self, host: str) -> threading.BoundedSemaphore:
+        with self._lock:
+            if host not in self._host_limits:
+                self._host_limits[host] = threading.BoundedSemaphore(self.max_per_host)
+            return self._host_limits[host]
+
+
+def _not_sent(error: requests.RequestException) -> bool:
+    """Tell whether the request failed before a connection was made, so the server never saw it."""
+    if isinstance(error, requests.ConnectTimeout):
+        return True
+    reason = error.args[0] if error.args else None
+    return isinstance(reason, MaxRetryError) and isinstance(reason.reason, NewConnectionError)
+
+
+def _retry_after(response: requests.Response) -> Optional[float]:
+    """Return the delay a Retry-After header asks for, in seconds, or None if there is none."""
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+_client: Optional[HttpClient] = None
+_client_lock = threading.Lock()
+
+
+def get_http_client() -> HttpClient:
+    """Return the process-wide shared HttpClient, creating it on first use."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = HttpClient()
+        return _client
+
+
+def _reset_after_fork() -> None:
+    """Drop the parent's client in a forked child; pooled sockets must not be shared."""
+    global _client, _client_lock
+    _client = None
+    _client_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
@@ -1,11 +1,17 @@
+import json
+import logging
 import os
-import requests
-from typing import Optional
+from typing import Callable, Iterator, List, Optional
+from .http_client import HttpClient, get_http_client
+from .telemetry import PAYLOAD_BYTES, stage
+
+logger = logging.getLogger(__name__)
 
 class ImageDescriber:
     """A class to describe images using Worqhat's image analysis API."""
 
     API_URL = "https://api.worqhat.com/api/ai/content/v4"
+    MODEL = "aicon-v4-nano-160824"
 
     TRAINING_DATA = """
         You are analyzing a hand-drawn sketch that needs to be transformed into a realistic image. Give me JUST a prompt to generate realistic images by my sketch.
@@ -40,18 +46,26 @@ class ImageDescriber:
     Remember to translate the sketch's simple elements into their realistic counterparts, providing enough detail for accurate image generation.
     """
 
-    def __init__(self, api_key: Optional[str] = None):
+    def __init__(self, api_key: Optional[str] = None, http_client: Optional[HttpClient] = None):
         self.api_key = api_key or os.getenv("WORQHAT_API_KEY")
         if not self.api_key:
             raise ValueError(
                 "Worqhat API key is required. Set it as an environment variable or pass it to the constructor.")
+        self.http = http_client or get_http_client()
+
+    @property
+    def cache_version(self) -> str:
+        """A string identifying the model and prompts, used as part of result cache keys."""
+        return f"{self.MODEL}\n{self.TRAINING_DATA}\n{self.PROMPT}"
 
-    def get_description(self, image_path: str) -> str:
+    def get_description(self, image: str | bytes, on_token: Optional[Callable[[str], None]] = None) -> str:
         """
-        Get a description of the image at the given path.
+        Get a description of an image.
 
         Args:
-            image_path (str): The path to the image file.
+            image (str | bytes): The path to the image file or the PNG bytes.
+            on_token (Callable[[str], None], optional): If given, the description is
+                streamed and each chunk is passed to this callback as it arrives.
 
         Returns:
             str: The description of the image.
@@ -60,38 +74,112 @@ class ImageDescriber:
             ValueError: If the image processing fails.
         """
         try:
-            return self._get_ai_description(image_path)
+            with stage("describe"):
+                if on_token is None:
+                    return self._get_ai_description(image)
+                chunks = []
+                for chunk in self._stream_ai_description(image):
+                    chunks.append(chunk)
+                    on_token(chunk)
+                return "".join(chunks)
         except Exception as e:
             raise ValueError(f"Failed to process image: {str(e)}")
 
-    def _get_ai_description(self, image_path: str) -> str:
+    def _get_ai_description(self, image: str | bytes) -> str:
+        response = self._post_image(image, stream=False)
+
+        result = response.json()
+        if 'content' in result:
+            return result['content']
+        else:
+            raise ValueError(f"Unexpected API response: {result}")
+
+    def _stream_ai_description(self, image: str | bytes) -> Iterator[str]:
+        """
+        Yield description chunks from a streamed response (Server-Sent Events or JSON lines).
+
+        Event data is kept as sent: only the single optional space after `data:` is removed and
+        the lines of a multi-line event are joined with "\n", so spaces and line breaks at chunk
+        boundaries survive.
+        """
+        response = self._post_image(image, stream=True)
+        response.encoding = response.encoding or 'utf-8'
+        with response:
+            data = []
+            for line in self._lines(response):
+                if not line:
+                    if data:
+                        content = self._event_content("\n".join(data))
+                        data = []
+                        if content is None:
+                            break
+                        yield from content
+                    continue
+                field, sep, value = line.partition(':')
+                if field == 'data' and sep:
+                    data.append(value[1:] if value.startswith(' ') else value)
+                elif field in ('', 'event', 'id', 'retry') and sep:
+                    continue  # a comment or a field without content
+                else:
+                    # not an SSE stream: every line is an event of its own
+                    content = self._event_content(line)
+                    if content is None:
+                        break
+                    yield from content
+            if data:
+                yield from self._event_content("\n".join(data)) or ()
+
+    @staticmethod
+    def _lines(response) -> Iterator[str]:
+        """Split a streamed body into lines at "\n" (or "\r\n"), keeping every other character."""
+        pending = ''
+        for piece in response.iter_content(chunk_size=None, decode_unicode=True):
+            *lines, pending = (pending + piece).split('\n')
+            for line in lines:
+                yield line[:-1] if line.endswith('\r') else line
+        if pending:
+            yield pending
+
+    @staticmethod
+    def _event_content(data: str) -> Optional[List[str]]:
+        """Return the text carried by one event's data, or None at the end-of-stream marker."""
+        if data.strip() == '[DONE]':
+            return None
+        try:
+            event = json.loads(data)
+        except ValueError:
+            return [data]
+        if not isinstance(event, dict):
+            return [data]  # plain text that happens to parse, e.g. a number
+        return [event['content']] if event.get('content') else []
+
+    def _post_image(self, image: str | bytes, stream: bool):
         url = self.API_URL
         payload = {
             'question': self.PROMPT,
-            'model': 'aicon-v4-nano-160824',
+            'model': self.MODEL,
             'training_data': self.TRAINING_DATA,
-            'stream_data': 'false',
+            'stream_data': 'true' if stream else 'false',
             'response_type': 'text'
         }
         
-        with open(image_path, 'rb') as image_file:
-            files = [
-                ('files', ('sketch.png', image_file, 'image/png'))
-            ]
-        
-            headers = {
-                'Authorization': f'Bearer {self.api_key}',
-            }
-
-            response = requests.request("POST", url, headers=headers, data=payload, files=files)
-
-            if response.status_code != 200:
-                print(f"Error response: {response.status_code}")
-                print(f"Response content: {response.text}")
-                response.raise_for_status()
-
-            result = response.json()
-            if 'content' in result:
-                return result['content']
-            else:
-                raise ValueError(f"Unexpected API response: {result}")
\ No newline at end of file
+        if isinstance(image, str):
+            with open(image, 'rb') as image_file:
+                image = image_file.read()
+
+        PAYLOAD_BYTES.observe(len(image), kind="describe_upload")
+        files = [
+            ('files', ('sketch.png', image, 'image/png'))
+        ]
+
+        headers = {
+            'Authorization': f'Bearer {self.api_key}',
+        }
+
+        response = self.http.post(url, headers=headers, data=payload, files=files, stream=stream)
+
+        if response.status_code != 200:
+            logger.error("Description request failed with status %s: %s", response.status_code, response.text)
+            response.raise_for_status()
+
+        return response
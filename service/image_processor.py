@@ -1,31 +1,49 @@
-import base64
+import binascii
 import os
+import threading
 from datetime import datetime
-from typing import Tuple
+from typing import List, Optional, Tuple
 from PIL import Image
-import requests
 from io import BytesIO, StringIO
 import uuid
-import shutil
 from markdown import Markdown
 from .s3_uploader import S3Uploader
+from .upload_stage import UploadItem, UploadStage
+from .http_client import HttpClient, get_http_client
+from .sketch_index import dhash
+from .telemetry import PAYLOAD_BYTES, stage
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
 
 
 class ImageProcessor:
     """A class to process and manipulate images."""
 
-    def __init__(self, upload_dir: str = "storage/uploads", generated_dir: str = "storage/generated"):
+    def __init__(self, upload_dir: str = "storage/uploads", generated_dir: str = "storage/generated",
+                 http_client: HttpClient | None = None, local_mirror: bool | None = None):
         """
         Initialize the ImageProcessor.
 
         Args:
             upload_dir (str): Directory to store uploaded images.
             generated_dir (str): Directory to store generated images.
+            http_client (HttpClient, optional): HTTP client used to fetch remote images.
+            local_mirror (bool, optional): Keep a local copy of every artifact under `storage/`.
+                Defaults to the STORAGE_LOCAL_MIRROR environment variable (true).
         """
         self.upload_dir = upload_dir
         self.generated_dir = generated_dir
-        self._md = self._setup_markdown_converter()
+        self.local_mirror = local_mirror if local_mirror is not None \
+            else os.getenv("STORAGE_LOCAL_MIRROR", "true").lower() == "true"
+        self.http = http_client or get_http_client()
+        self._md_local = threading.local()
         self.s3u = S3Uploader()
+        self.uploads = UploadStage(self.s3u)
+
+    def warm_up(self) -> None:
+        """Create the S3 client and the Markdown converter ahead of the first request."""
+        self.s3u.s3_client
+        self._markdown()
 
     def process_base64_image(self, image_data: str) -> str:
         """
@@ -40,42 +58,155 @@ class ImageProcessor:
         Raises:
             ValueError: If the base64 string is invalid.
         """
-        image_bytes = self._decode_base64(self._strip_base64_header(image_data))
+        return self.save_uploaded_image(self.decode_base64_image(image_data))
+
+    def decode_base64_image(self, image_data: str) -> bytes:
+        """
+        Decode a base64 encoded image, with or without a data URL header.
+
+        Args:
+            image_data (str): Base64 encoded image data.
+
+        Returns:
+            bytes: The decoded image bytes.
+
+        Raises:
+            ValueError: If the base64 string is invalid.
+        """
+        return self._decode_base64(self._strip_base64_header(image_data))
+
+    def load_image_data(self, image_data: str | bytes) -> bytes:
+        """
+        Return the image bytes for data extracted by `FileHandler.get_image_data`.
+
+        Args:
+            image_data (str | bytes): Base64 encoded image data or raw image bytes.
+
+        Returns:
+            bytes: The decoded image bytes.
+
+        Raises:
+            ValueError: If the base64 string is invalid.
+        """
+        if isinstance(image_data, str):
+            with stage("decode"):
+                return self.decode_base64_image(image_data)
+        return image_data
+
+    def save_uploaded_image(self, image_bytes: bytes) -> str:
+        """
+        Save decoded image bytes to the upload directory when the local mirror is enabled.
+
+        Args:
+            image_bytes (bytes): The decoded image.
+
+        Returns:
+            str: The filename of the image.
+        """
         filename = self._generate_filename("uploaded_image")
-        filepath = self._get_filepath(self.upload_dir, filename)
-        self._save_file(filepath, image_bytes, "wb")
+        if self.local_mirror:
+            filepath = self._get_filepath(self.upload_dir, filename)
+            self._save_file(filepath, image_bytes, "wb")
         return filename
 
-    def save_generated_image(self, image_path: str, url: str) -> str:
+    @staticmethod
+    def compute_perceptual_hash(image_bytes: bytes) -> int:
+        """
+        Compute the perceptual hash used for near-duplicate sketch lookups.
+
+        Args:
+            image_bytes (bytes): The decoded image.
+
+        Returns:
+            int: A 64-bit difference hash.
+
+        Raises:
+            ValueError: If the bytes are not a readable image.
+        """
+        try:
+            with stage("phash"):
+                return dhash(image_bytes)
+        except OSError as e:
+            raise ValueError("Invalid image data") from e
+
+    def load_archived_file(self, data_uuid: str, filename: str) -> Optional[bytes]:
+        """
+        Read a file saved by `save_image_data`, from the local mirror or from S3.
+
+        Args:
+            data_uuid (str): UUID of the archived entry.
+            filename (str): Name of the file within the entry.
+
+        Returns:
+            Optional[bytes]: The file contents, or None if it cannot be found.
+        """
+        try:
+            with open(os.path.join("storage", "data", data_uuid, filename), "rb") as f:
+                return f.read()
+        except OSError:
+            return self.s3u.download(f"data/{data_uuid}", filename)
+
+    def archived_file_url(self, data_uuid: str, filename: str) -> str:
+        """Return the public S3 URL of a file saved by `save_image_data`."""
+        return self.s3u.public_url(f"data/{data_uuid}", filename)
+
+    def fetch_generated_image(self, url: str) -> bytes:
         """
-        Combine a local image with a remote image and save the result.
+        Download a generated image once so it can be reused by every later step.
 
         Args:
-            image_path (str): Path to the local image.
             url (str): URL of the remote image.
 
+        Returns:
+            bytes: The raw image bytes.
+        """
+        return self._fetch_remote_bytes(url)
+
+    def save_results(self, original_image: bytes, generated_image: bytes, description: str) -> Tuple[str, str]:
+        """
+        Save the side-by-side composite and the archived data, uploading everything in one batch.
+
+        Args:
+            original_image (bytes): The decoded original sketch.
+            generated_image (bytes): Raw bytes of the generated image.
+            description (str): Description of the image.
+
+        Returns:
+            Tuple[str, str]: The filename of the combined image and the UUID of the saved data.
+
+        Raises:
+            ValueError: If any of the files cannot be saved.
+        """
+        filename, generated_uploads = self._write_generated_image(original_image, generated_image)
+        data_uuid, data_uploads = self._write_image_data(original_image, generated_image, description)
+        try:
+            self.uploads.upload_batch(generated_uploads + data_uploads)
+        except Exception as e:
+            raise ValueError(f"Failed to save image data: {str(e)}")
+        return filename, data_uuid
+
+    def save_generated_image(self, original_image: str | bytes, generated_image: bytes) -> str:
+        """
+        Combine the original image with the generated image and save the result.
+
+        Args:
+            original_image (str | bytes): Path to the local image or its bytes.
+            generated_image (bytes): Raw bytes of the generated image.
+
         Returns:
             str: The filename of the saved combined image.
         """
-        local_image = Image.open(image_path)
-        remote_image = self._fetch_remote_image(url)
-        
-        local_image, remote_image = self._resize_images_to_same_height(local_image, remote_image)
-        combined_image = self._combine_images(local_image, remote_image)
-        
-        filename = self._generate_filename("generated_image")
-        filepath = self._get_filepath(self.generated_dir, filename)
-        combined_image.save(filepath)
-        self.s3u.upload(filepath, 'generated', filename)
+        filename, uploads = self._write_generated_image(self._read_source(original_image), generated_image)
+        self.uploads.upload_batch(uploads)
         return filename
 
-    def save_image_data(self, original_path: str, generated_url: str, description: str) -> str:
+    def save_image_data(self, original_image: str | bytes, generated_image: bytes, description: str) -> str:
         """
         Save original image, generated image, and description using a UUID.
 
         Args:
-            original_path (str): Path to the original image.
-            generated_url (str): Path to the generated image.
+            original_image (str | bytes): Path to the original image or its bytes.
+            generated_image (bytes): Raw bytes of the generated image.
             description (str): Description of the image.
 
         Returns:
@@ -84,45 +215,70 @@ class ImageProcessor:
         Raises:
             ValueError: If any of the files cannot be saved.
         """
+        data_uuid, uploads = self._write_image_data(self._read_source(original_image), generated_image, description)
+        try:
+            self.uploads.upload_batch(uploads)
+        except Exception as e:
+            raise ValueError(f"Failed to save image data: {str(e)}")
+        return data_uuid
+
+    def _write_generated_image(self, original_image: bytes, generated_image: bytes) -> Tuple[str, List[UploadItem]]:
+        """Render the side-by-side composite and return its filename and pending upload."""
+        local_image = Image.open(BytesIO(original_image))
+        remote_image = Image.open(BytesIO(generated_image))
+
+        with stage("combine"):
+            local_image, remote_image = self._resize_images_to_same_height(local_image, remote_image)
+            combined_image = self._combine_images(local_image, remote_image)
+
+            buffer = BytesIO()
+            combined_image.save(buffer, format="PNG")
+        filename = self._generate_filename("generated_image")
+        return filename, [self._store(buffer.getvalue(), self.generated_dir, 'generated', filename)]
+
+    def _write_image_data(self, original_image: bytes, generated_image: bytes,
+                          description: str) -> Tuple[str, List[UploadItem]]:
+        """Prepare the archived files for a new UUID and return it with the pending uploads."""
         data_uuid = str(uuid.uuid4())
         base_path = os.path.join("storage", "data", data_uuid)
-        os.makedirs(base_path, exist_ok=True)
 
         try:
             base_s3_path = base_path.replace('storage/', '')
 
-            self._save_and_upload_image(original_path, base_path, base_s3_path, "original.png", copy=True)
-            self._save_and_upload_image(generated_url, base_path, base_s3_path, "generated.png", remote=True)
-            self._save_and_upload_description(description, base_path, base_s3_path)
-
-            return data_uuid
+            return data_uuid, [
+                self._store(original_image, base_path, base_s3_path, "original.png"),
+                self._store(self._ensure_png(generated_image), base_path, base_s3_path, "generated.png"),
+                self._store(description.encode("utf-8"), base_path, base_s3_path, "description.md"),
+                self._store(self._strip_markdown(description).encode("utf-8"), base_path, base_s3_path,
+                            "description.txt"),
+            ]
         except Exception as e:
             raise ValueError(f"Failed to save image data: {str(e)}")
 
-    def _save_and_upload_image(self, source: str, base_path: str, base_s3_path: str, filename: str, copy: bool = False, remote: bool = False):
-        """Save and upload an image file."""
-        local_path = os.path.join(base_path, filename)
-        if copy:
-            shutil.copy2(source, local_path)
-        elif remote:
-            remote_image = self._fetch_remote_image(source)
-            remote_image.save(local_path)
-        self.s3u.upload(local_path, base_s3_path, filename)
-
-    def _save_and_upload_description(self, description: str, base_path: str, base_s3_path: str):
-        """Save and upload description in Markdown and plain text formats."""
-        md_path = os.path.join(base_path, "description.md")
-        txt_path = os.path.join(base_path, "description.txt")
+    def _store(self, content: bytes, local_dir: str, s3_dir: str, filename: str) -> UploadItem:
+        """Mirror content to local storage if enabled and return its pending upload."""
+        if self.local_mirror:
+            self._save_file(self._get_filepath(local_dir, filename), content, "wb")
+        return content, s3_dir, filename
 
-        self._save_file(md_path, description)
-        self._save_file(txt_path, self._strip_markdown(description))
-
-        self.s3u.upload(md_path, base_s3_path, "description.md")
-        self.s3u.upload(txt_path, base_s3_path, "description.txt")
+    @staticmethod
+    def _read_source(source: str | bytes) -> bytes:
+        """Return the bytes of a path or pass bytes through."""
+        if isinstance(source, str):
+            with open(source, "rb") as f:
+                return f.read()
+        return source
 
     def _strip_markdown(self, text: str) -> str:
         """Strip Markdown formatting from text."""
-        return self._md.convert(text)
+        return self._markdown().convert(text)
+
+    def _markdown(self) -> Markdown:
+        """Return this thread's Markdown converter, building it on first use; converters are not thread-safe."""
+        md = getattr(self._md_local, "md", None)
+        if md is None:
+            md = self._md_local.md = self._setup_markdown_converter()
+        return md
 
     @staticmethod
     def _setup_markdown_converter():
@@ -143,23 +299,35 @@ class ImageProcessor:
         return md
 
     @staticmethod
-    def _strip_base64_header(image_data: str) -> str:
-        """Remove the base64 header if present."""
-        return image_data.replace("data:image/png;base64,", "")
+    def _strip_base64_header(image_data: str) -> str | memoryview:
+        """
+        Remove a `data:<mime>;base64,` header if present without copying the payload.
+
+        Slicing a str copies it, so a payload behind a header is encoded to ASCII once and
+        returned as a memoryview that starts after the header.
+        """
+        if image_data.startswith("data:"):
+            comma = image_data.find(",", 0, 256)
+            if comma != -1:
+                try:
+                    return memoryview(image_data.encode("ascii"))[comma + 1:]
+                except UnicodeEncodeError as e:
+                    raise ValueError("Invalid base64 string") from e
+        return image_data
 
     @staticmethod
-    def _decode_base64(image_data: str) -> bytes:
-        """Decode base64 string to bytes."""
+    def _decode_base64(image_data: str | memoryview) -> bytes:
+        """Decode base64 string to bytes without an intermediate ASCII copy."""
         try:
-            return base64.b64decode(image_data)
+            return binascii.a2b_base64(image_data)
         except Exception as e:
             raise ValueError("Invalid base64 string") from e
 
     @staticmethod
     def _generate_filename(prefix: str) -> str:
-        """Generate a unique filename with timestamp."""
+        """Generate a unique filename with timestamp; the random suffix keeps concurrent requests apart."""
         timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
-        return f"{prefix}_{timestamp}.png"
+        return f"{prefix}_{timestamp}_{uuid.uuid4().hex}.png"
 
     @staticmethod
     def _get_filepath(directory: str, filename: str) -> str:
@@ -174,11 +342,23 @@ class ImageProcessor:
         with open(filepath, mode, encoding="utf-8" if mode == "w" else None) as f:
             f.write(content)
 
+    def _fetch_remote_bytes(self, url: str) -> bytes:
+        """Fetch the raw bytes of a remote file."""
+        with stage("fetch_remote"):
+            response = self.http.get(url)
+            response.raise_for_status()
+            content = response.content
+        PAYLOAD_BYTES.observe(len(content), kind="fetch_remote")
+        return content
+
     @staticmethod
-    def _fetch_remote_image(url: str) -> Image.Image:
-        """Fetch a remote image from a URL."""
-        response = requests.get(url)
-        return Image.open(BytesIO(response.content))
+    def _ensure_png(image_bytes: bytes) -> bytes:
+        """Return PNG bytes as-is and re-encode any other image format to PNG."""
+        if image_bytes.startswith(PNG_SIGNATURE):
+            return image_bytes
+        buffer = BytesIO()
+        Image.open(BytesIO(image_bytes)).save(buffer, format="PNG")
+        return buffer.getvalue()
 
     @staticmethod
     def _resize_images_to_same_height(img1: Image.Image, img2: Image.Image) -> Tuple[Image.Image, Image.Image]:
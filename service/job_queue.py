@@ -0,0 +1,186 @@
+import contextvars
+import logging
+import os
+import queue
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, Optional, Tuple
+
+
+logger = logging.getLogger(__name__)
+
+
+class QueueFullError(Exception):
+    """Raised when a job is submitted while the job queue is at capacity."""
+
+
+class Job:
+    """A single unit of work tracked by the JobQueue."""
+
+    PENDING = "pending"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+
+    def __init__(self, func: Callable[..., Tuple[Dict[str, Any], int]], args: tuple):
+        self.id = str(uuid.uuid4())
+        self.func = func
+        self.args = args
+        self.context = contextvars.copy_context()
+        self.status = self.PENDING
+        self.result: Optional[Dict[str, Any]] = None
+        self.status_code: Optional[int] = None
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self._done = threading.Event()
+
+    @property
+    def finished(self) -> bool:
+        return self._done.is_set()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Block until the job is finished or the timeout expires."""
+        return self._done.wait(timeout)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Return a JSON-serializable summary of the job state."""
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class JobQueue:
+    """A bounded worker pool that runs pipeline jobs in the background."""
+
+    def __init__(self, workers: Optional[int] = None, max_queue_size: Optional[int] = None,
+                 result_ttl: Optional[float] = None):
+        """
+        Initialize the JobQueue.
+
+        Args:
+            workers (int, optional): Number of worker threads. Defaults to JOB_WORKERS or 4.
+            max_queue_size (int, optional): Maximum number of pending jobs. Defaults to JOB_QUEUE_SIZE or 32.
+            result_ttl (float, optional): Seconds to keep finished jobs around. Defaults to JOB_RESULT_TTL or 3600.
+        """
+        self.workers = workers or int(os.getenv("JOB_WORKERS", 4))
+        self.max_queue_size = max_queue_size or int(os.getenv("JOB_QUEUE_SIZE", 32))
+        self.result_ttl = result_ttl or float(os.getenv("JOB_RESULT_TTL", 3600))
+        self._queue: "queue.Queue[Optional[Job]]" = queue.Queue(maxsize=self.max_queue_size)
+        self._jobs: Dict[str, Job] = {}
+        self._lock = threading.Lock()
+        self._threads = []
+        self._started = False
+        self._closed = False
+
+    def start(self) -> None:
+        """Start the worker threads if they are not running yet."""
+        with self._lock:
+            if self._started:
+                return
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._worker, name=f"job-worker-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+            self._started = True
+
+    def submit(self, func: Callable[..., Tuple[Dict[str, Any], int]], *args) -> Job:
+        """
+        Queue a job for background execution.
+
+        Args:
+            func (Callable): A callable returning a (result, status_code) tuple.
+            *args: Positional arguments passed to the callable.
+
+        Returns:
+            Job: The queued job.
+
+        Raises:
+            QueueFullError: If the queue is at capacity or shutting down.
+        """
+        if self._closed:
+            raise QueueFullError("Job queue is shutting down, try again later")
+        self.start()
+        self._evict_expired()
+        job = Job(func, args)
+        with self._lock:
+            self._jobs[job.id] = job
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            with self._lock:
+                self._jobs.pop(job.id, None)
+            raise QueueFullError("Job queue is full, try again later")
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        """Return the job with the given ID, or None if it is unknown or expired."""
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def depth(self) -> int:
+        """Return the number of jobs waiting for a worker."""
+        return self._queue.qsize()
+
+    def shutdown(self, timeout: Optional[float] = None) -> bool:
+        """
+        Stop accepting jobs and wait for queued and running jobs to finish.
+
+        Args:
+            timeout (float, optional): Maximum seconds to wait. Waits indefinitely if None.
+
+        Returns:
+            bool: True if every job finished within the timeout.
+        """
+        with self._lock:
+            self._closed = True
+            threads = list(self._threads)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for _ in threads:
+            try:
+                self._queue.put(None, timeout=self._remaining(deadline))
+            except queue.Full:
+                return False
+        for thread in threads:
+            thread.join(self._remaining(deadline))
+        return not any(thread.is_alive() for thread in threads)
+
+    @staticmethod
+    def _remaining(deadline: Optional[float]) -> Optional[float]:
+        return None if deadline is None else max(deadline - time.monotonic(), 0)
+
+    def _worker(self) -> None:
+        while True:
+            job = self._queue.get()
+            try:
+                if job is None:
+                    return
+                self._run(job)
+            finally:
+                self._queue.task_done()
+
+    @staticmethod
+    def _run(job: Job) -> None:
+        job.status = Job.RUNNING
+        job.started_at = time.time()
+        try:
+            job.result, job.status_code = job.context.run(job.func, *job.args)
+        except Exception as e:
+            logger.exception("Job %s failed", job.id)
+            job.result, job.status_code = {"error": str(e)}, 500
+        job.status = Job.DONE if job.status_code < 400 else Job.FAILED
+        job.finished_at = time.time()
+        job._done.set()
+
+    def _evict_expired(self) -> None:
+        cutoff = time.time() - self.result_ttl
+        with self._lock:
+            expired = [job_id for job_id, job in self._jobs.items()
+                       if job.finished and job.finished_at < cutoff]
+            for job_id in expired:
+                del self._jobs[job_id]
@@ -0,0 +1,217 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional
+
+from .telemetry import CACHE_REQUESTS
+
+logger = logging.getLogger(__name__)
+
+
+class CacheBackend(ABC):
+    """Storage interface for ResultCache."""
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[Any]:
+        """Return the cached value, or None if it is missing or expired."""
+
+    @abstractmethod
+    def set(self, key: str, value: Any) -> None:
+        """Store a JSON-serializable value."""
+
+
+class MemoryCache(CacheBackend):
+    """An in-process LRU cache with a TTL."""
+
+    def __init__(self, max_entries: int = 1024, ttl: float = 86400):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            stored_at, value = entry
+            if time.time() - stored_at > self.ttl:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any) -> None:
+        with self._lock:
+            self._entries[key] = (time.time(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+class DiskCache(CacheBackend):
+    """A JSON-file cache on local disk, evicting the least recently used entries."""
+
+    def __init__(self, directory: str = "storage/cache", max_entries: int = 10000, ttl: float = 86400):
+        self.directory = directory
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._count = sum(len(files) for _, _, files in os.walk(directory))
+
+    def get(self, key: str) -> Optional[Any]:
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if time.time() - entry["stored_at"] > self.ttl:
+            self._remove(path)
+            return None
+        os.utime(path)
+        return entry["value"]
+
+    def set(self, key: str, value: Any) -> None:
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"stored_at": time.time(), "value": value}, f)
+        existed = os.path.exists(path)
+        os.replace(tmp_path, path)
+        with self._lock:
+            if not existed:
+                self._count += 1
+            if self._count > self.max_entries:
+                self._evict()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], f"{key}.json")
+
+    def _remove(self, path: str) -> None:
+        try:
+            os.remove(path)
+        except OSError:
+            return
+        with self._lock:
+            self._count -= 1
+
+    @staticmethod
+    def _mtime(path: str) -> float:
+        try:
+            return os.path.getmtime(path)
+        except OSError:
+            return 0.0
+
+    def _evict(self) -> None:
+        """Drop the oldest entries until the cache is 10% below its limit."""
+        paths = [os.path.join(root, name) for root, _, files in os.walk(self.directory) for name in files]
+        paths.sort(key=self._mtime)
+        excess = len(paths) - int(self.max_entries * 0.9)
+        for path in paths[:max(excess, 0)]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        self._count = len(paths) - max(excess, 0)
+
+
+class ResultCache:
+    """A content-addressed cache for upstream API results with hit/miss counters."""
+
+    def __init__(self, backend: Optional[CacheBackend]):
+        """
+        Initialize the ResultCache.
+
+        Args:
+            backend (CacheBackend, optional): Storage backend. None disables caching.
+        """
+        self.backend = backend
+        self._stats: Dict[str, Dict[str, int]] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "ResultCache":
+        """
+        Build a cache from RESULT_CACHE_BACKEND (memory, disk or none), RESULT_CACHE_TTL,
+        RESULT_CACHE_MAX_ENTRIES and RESULT_CACHE_DIR.
+        """
+        backend_name = os.getenv("RESULT_CACHE_BACKEND", "memory").lower()
+        ttl = float(os.getenv("RESULT_CACHE_TTL", 86400))
+        max_entries = int(os.getenv("RESULT_CACHE_MAX_ENTRIES", 1024))
+        if backend_name == "memory":
+            return cls(MemoryCache(max_entries=max_entries, ttl=ttl))
+        if backend_name == "disk":
+            directory = os.getenv("RESULT_CACHE_DIR", os.path.join("storage", "cache"))
+            return cls(DiskCache(directory=directory, max_entries=max_entries, ttl=ttl))
+        if backend_name == "none":
+            return cls(None)
+        raise ValueError(f"Unknown RESULT_CACHE_BACKEND: {backend_name}")
+
+    @staticmethod
+    def make_key(namespace: str, image_bytes: bytes, *parts: str) -> str:
+        """Hash the namespace, image bytes and any extra key parts (model, prompt, description)."""
+        digest = hashlib.sha256(namespace.encode("utf-8"))
+        digest.update(hashlib.sha256(image_bytes).digest())
+        for part in parts:
+            digest.update(hashlib.sha256(part.encode("utf-8")).digest())
+        return digest.hexdigest()
+
+    def get_or_compute(self, namespace: str, image_bytes: bytes, compute: Callable[[], Any], *parts: str,
+                       load: Optional[Callable[[Any], Any]] = None) -> Any:
+        """
+        Return the cached result for the image, computing and storing it on a miss.
+
+        Args:
+            namespace (str): Name of the cached operation, e.g. "description".
+            image_bytes (bytes): The decoded image the result depends on.
+            compute (Callable): Produces the result on a cache miss.
+            *parts (str): Additional key material such as model and prompt versions.
+            load (Callable, optional): Turns the stored value into what is returned, e.g. downloads
+                a cached URL. If it fails for a cached value, the entry is treated as a miss and
+                replaced with a freshly computed one.
+
+        Returns:
+            Any: The cached or freshly computed result, passed through `load` if given.
+        """
+        load = load or (lambda value: value)
+        if self.backend is None:
+            return load(compute())
+        key = self.make_key(namespace, image_bytes, *parts)
+        value = self.backend.get(key)
+        if value is not None:
+            try:
+                result = load(value)
+            except Exception as e:
+                logger.info("Cached %s result is no longer usable, recomputing: %s", namespace, e)
+            else:
+                self._count(namespace, "hits")
+                return result
+        self._count(namespace, "misses")
+        value = compute()
+        self.backend.set(key, value)
+        return load(value)
+
+    def contains(self, namespace: str, image_bytes: bytes, *parts: str) -> bool:
+        """Check for a cached result without touching the hit/miss counters."""
+        if self.backend is None:
+            return False
+        return self.backend.get(self.make_key(namespace, image_bytes, *parts)) is not None
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        """Return hit/miss counters per namespace."""
+        with self._lock:
+            return {namespace: dict(counters) for namespace, counters in self._stats.items()}
+
+    def _count(self, namespace: str, counter: str) -> None:
+        CACHE_REQUESTS.inc(namespace=namespace, result=counter)
+        with self._lock:
+            counters = self._stats.setdefault(namespace, {"hits": 0, "misses": 0})
+            counters[counter] += 1
@@ -1,6 +1,12 @@
 import os
+import threading
+from io import BytesIO
 import boto3
-from botocore.exceptions import ClientError
+from boto3.s3.transfer import TransferConfig
+from botocore.exceptions import BotoCoreError, ClientError
+from .telemetry import PAYLOAD_BYTES, stage
+
+MB = 1024 * 1024
 
 class S3Uploader:
     """A class to handle uploading files to Amazon S3."""
@@ -10,20 +16,44 @@ class S3Uploader:
         Initialize the S3Uploader.
 
         """
-        self.s3_client = boto3.client(
-            's3',
-            aws_access_key_id=os.environ.get('AWS_ACCESS_KEY_ID'),
-            aws_secret_access_key=os.environ.get('AWS_SECRET_ACCESS_KEY'),
-            region_name=os.environ.get('AWS_REGION_NAME'),
-        )
+        self._s3_client = None
+        self._client_pid = None
+        self._client_lock = threading.Lock()
         self.bucket_name = os.environ.get('S3_BUCKET_NAME')
+        self.transfer_config = TransferConfig(
+            multipart_threshold=int(float(os.environ.get('S3_MULTIPART_THRESHOLD_MB', 8)) * MB),
+            multipart_chunksize=int(float(os.environ.get('S3_MULTIPART_CHUNKSIZE_MB', 8)) * MB),
+            max_concurrency=int(os.environ.get('S3_TRANSFER_CONCURRENCY', 4)),
+        )
+
+    @property
+    def s3_client(self):
+        """
+        The boto3 S3 client, created on first use.
+
+        boto3 clients are not safe to share across a fork, so a process that inherited
+        the uploader from its parent builds its own client.
+        """
+        pid = os.getpid()
+        if self._s3_client is None or self._client_pid != pid:
+            with self._client_lock:
+                if self._s3_client is None or self._client_pid != pid:
+                    self._s3_client = boto3.client(
+                        's3',
+                        aws_access_key_id=os.environ.get('AWS_ACCESS_KEY_ID'),
+                        aws_secret_access_key=os.environ.get('AWS_SECRET_ACCESS_KEY'),
+                        region_name=os.environ.get('AWS_REGION_NAME'),
+                    )
+                    self._client_pid = pid
+        return self._s3_client
 
-    def upload(self, local_file_path, s3_directory_path, file_name):
+    def upload(self, source, s3_directory_path, file_name):
         """
-        Upload a file to S3, creating the directory path if it doesn't exist.
+        Upload a file, bytes or a file-like object to S3.
 
         Args:
-            local_file_path (str): Path to the local file to upload.
+            source (str | bytes | BinaryIO): Path to a local file, the raw content, or a
+                readable binary file-like object.
             s3_directory_path (str): Path to the directory in S3 where the file should be uploaded.
             file_name (str): Name to give the file in S3.
 
@@ -31,26 +61,83 @@ class S3Uploader:
             str: The public URL of the uploaded file in S3.
 
         Raises:
-            FileNotFoundError: If the local file does not exist.
+            FileNotFoundError: If a local file path does not exist.
             Exception: If there's an error during the upload process.
         """
-        if not os.path.exists(local_file_path):
-            raise FileNotFoundError(f"The file {local_file_path} does not exist.")
+        if isinstance(source, str) and not os.path.exists(source):
+            raise FileNotFoundError(f"The file {source} does not exist.")
 
         try:
             # Construct the full S3 key (path + filename)
-            s3_key = os.path.join(s3_directory_path.strip('/'), file_name)
+            s3_key = self._s3_key(s3_directory_path, file_name)
 
             # Upload the file
-            self.s3_client.upload_file(local_file_path, self.bucket_name, s3_key)
+            with stage("s3_upload"):
+                if isinstance(source, str):
+                    PAYLOAD_BYTES.observe(os.path.getsize(source), kind="s3_upload")
+                    self.s3_client.upload_file(source, self.bucket_name, s3_key, Config=self.transfer_config)
+                else:
+                    if isinstance(source, (bytes, bytearray, memoryview)):
+                        PAYLOAD_BYTES.observe(len(source), kind="s3_upload")
+                    fileobj = BytesIO(source) if isinstance(source, (bytes, bytearray, memoryview)) else source
+                    self.s3_client.upload_fileobj(fileobj, self.bucket_name, s3_key, Config=self.transfer_config)
 
             # Generate the public URL
-            public_url = f"https://{self.bucket_name}.s3.amazonaws.com/{s3_key}"
-            return public_url
+            return self.public_url(s3_directory_path, file_name)
 
         except ClientError as e:
             raise Exception(f"An error occurred while uploading the file: {str(e)}")
 
+    def download(self, s3_directory_path, file_name):
+        """
+        Download an object from S3 into memory.
+
+        Args:
+            s3_directory_path (str): Path to the directory in S3.
+            file_name (str): Name of the file in S3.
+
+        Returns:
+            bytes | None: The object content, or None if it does not exist or cannot be fetched.
+        """
+        try:
+            response = self.s3_client.get_object(Bucket=self.bucket_name, Key=self._s3_key(s3_directory_path, file_name))
+            return response['Body'].read()
+        except (ClientError, BotoCoreError):
+            return None
+
+    def list_directories(self, s3_directory_path):
+        """
+        Iterate over the names of the "subdirectories" directly under a prefix.
+
+        Args:
+            s3_directory_path (str): Path to the directory in S3, e.g. "data".
+
+        Yields:
+            str: The name of each subdirectory, without the prefix or trailing slash.
+        """
+        prefix = s3_directory_path.strip('/') + '/'
+        paginator = self.s3_client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucket_name, Prefix=prefix, Delimiter='/'):
+            for common_prefix in page.get('CommonPrefixes', []):
+                yield common_prefix['Prefix'][len(prefix):].rstrip('/')
+
+    def public_url(self, s3_directory_path, file_name):
+        """
+        Build the public URL of an object in the bucket.
+
+        Args:
+            s3_directory_path (str): Path to the directory in S3.
+            file_name (str): Name of the file in S3.
+
+        Returns:
+            str: The public URL of the object.
+        """
+        return f"https://{self.bucket_name}.s3.amazonaws.com/{self._s3_key(s3_directory_path, file_name)}"
+
+    @staticmethod
+    def _s3_key(s3_directory_path, file_name):
+        return os.path.join(s3_directory_path.strip('/'), file_name)
+
     def _ensure_directory_exists(self, directory_path):
         """
         Ensure that a directory exists in S3.
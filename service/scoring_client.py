@@ -0,0 +1,89 @@
+import contextvars
+import logging
+import os
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, Optional
+
+from requests import RequestException
+
+from .http_client import HttpClient
+from .telemetry import stage
+
+logger = logging.getLogger(__name__)
+
+
+class ScoringClient:
+    """Asks the resident scoring service (`python -m metrics.scoring_server`) for quality scores."""
+
+    def __init__(self, url: Optional[str] = None, timeout: Optional[float] = None,
+                 http_client: Optional[HttpClient] = None, workers: Optional[int] = None):
+        """
+        Initialize the ScoringClient.
+
+        Args:
+            url (str, optional): Base URL of the scoring service (METRICS_SCORER_URL), e.g.
+                http://127.0.0.1:8765. Scoring is disabled when unset.
+            timeout (float, optional): Seconds to wait for the scores of one generation
+                (METRICS_SCORER_TIMEOUT, 60), including retries while it is not archived yet.
+            http_client (HttpClient, optional): Client to use. Defaults to one without retries;
+                `score` retries on its own within `timeout`.
+            workers (int, optional): Threads scoring in the background (METRICS_SCORER_WORKERS, 4).
+        """
+        self.url = (url or os.getenv("METRICS_SCORER_URL") or "").rstrip("/")
+        self.timeout = timeout or float(os.getenv("METRICS_SCORER_TIMEOUT", 60))
+        self.http = http_client or HttpClient(max_retries=0)
+        self._executor = ThreadPoolExecutor(max_workers=workers or int(os.getenv("METRICS_SCORER_WORKERS", 4)),
+                                            thread_name_prefix="scoring")
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.url)
+
+    def score_later(self, uuid: str, callback: Callable[[Optional[Dict[str, float]]], None]) -> Optional[Future]:
+        """
+        Score an archived generation in the background.
+
+        Args:
+            uuid (str): The generation to score.
+            callback (Callable): Receives the result of `score` (None on failure) when it is ready.
+
+        Returns:
+            Future | None: The background task, or None if scoring is disabled.
+        """
+        if not self.enabled:
+            return None
+        return self._executor.submit(contextvars.copy_context().run, lambda: callback(self.score(uuid)))
+
+    def score(self, uuid: str) -> Optional[Dict[str, float]]:
+        """
+        Score an archived generation.
+
+        A 404 is retried with backoff until `timeout`: with asynchronous uploads and no local
+        mirror, the generation reaches S3 only some time after the pipeline finishes.
+
+        Returns:
+            Dict[str, float] | None: Metric values by name, or None if scoring is disabled,
+                failed or took longer than the timeout.
+        """
+        if not self.enabled:
+            return None
+        deadline = time.monotonic() + self.timeout
+        delay = 1.0
+        try:
+            while True:
+                remaining = deadline - time.monotonic()
+                with stage("score"):
+                    response = self.http.post(f"{self.url}/score", json={"uuid": uuid},
+                                              timeout=(min(remaining, self.http.connect_timeout), remaining))
+                if response.status_code == 404 and deadline - time.monotonic() > delay:
+                    time.sleep(delay)
+                    delay = min(delay * 2, 10)
+                    continue
+                if response.status_code != 200:
+                    logger.warning("Scoring %s failed with status %s: %s", uuid, response.status_code, response.text)
+                    return None
+                return response.json()["metrics"]
+        except (RequestException, ValueError, KeyError) as e:
+            logger.warning("Scoring %s failed: %s", uuid, e)
+            return None
@@ -2,6 +2,8 @@ import os
 from typing import Optional
 import requests
 from requests.exceptions import RequestException
+from .http_client import HttpClient, get_http_client
+from .telemetry import PAYLOAD_BYTES, stage
 
 
 class SketchConverter:
@@ -9,13 +11,14 @@ class SketchConverter:
 
     API_URL = "https://api.worqhat.com/api/ai/images/modify/v3/sketch-image"
 
-    def __init__(self, api_key: Optional[str] = None):
+    def __init__(self, api_key: Optional[str] = None, http_client: Optional[HttpClient] = None):
         """
         Initialize the SketchConverter.
 
         Args:
             api_key (str, optional): The API key for WorqHat. If not provided,
                                      it will be fetched from environment variables.
+            http_client (HttpClient, optional): HTTP client to use. Defaults to the shared client.
 
         Raises:
             ValueError: If the API key is not provided and not found in environment variables.
@@ -23,13 +26,19 @@ class SketchConverter:
         self.api_key = api_key or os.getenv("WORQHAT_API_KEY")
         if not self.api_key:
             raise ValueError("API key is required. Set WORQHAT_API_KEY environment variable or pass it to the constructor.")
+        self.http = http_client or get_http_client()
 
-    def convert_sketch(self, image_path: str, description: str) -> str:
+    @property
+    def cache_version(self) -> str:
+        """A string identifying the conversion endpoint, used as part of result cache keys."""
+        return self.API_URL
+
+    def convert_sketch(self, image: str | bytes, description: str) -> str:
         """
         Convert a sketch to an image using the WorqHat API.
 
         Args:
-            image_path (str): The path to the sketch image file.
+            image (str | bytes): The path to the sketch image file or the PNG bytes.
             description (str): A description of the desired output image.
 
         Returns:
@@ -39,17 +48,18 @@ class SketchConverter:
             ValueError: If the sketch conversion fails.
         """
         try:
-            response = self._make_api_request(image_path, description)
-            return self._extract_image_url(response)
+            with stage("convert"):
+                response = self._make_api_request(image, description)
+                return self._extract_image_url(response)
         except RequestException as e:
             raise ValueError(f"Failed to convert sketch: {str(e)}") from e
 
-    def _make_api_request(self, image_path: str, description: str) -> requests.Response:
+    def _make_api_request(self, image: str | bytes, description: str) -> requests.Response:
         """
         Make the API request to convert the sketch.
 
         Args:
-            image_path (str): The path to the sketch image file.
+            image (str | bytes): The path to the sketch image file or the PNG bytes.
             description (str): A description of the desired output image.
 
         Returns:
@@ -58,19 +68,24 @@ class SketchConverter:
         Raises:
             RequestException: If the API request fails.
         """
-        with open(image_path, "rb") as image_file:
-            files = {"existing_image": image_file}
-            data = {"output_type": "url", "description": description}
-            headers = {"Authorization": f"Bearer {self.api_key}"}
-
-            response = requests.post(
-                self.API_URL,
-                files=files,
-                data=data,
-                headers=headers
-            )
-            response.raise_for_status()
-            return response
+        if isinstance(image, str):
+            with open(image, "rb") as image_file:
+                files = {"existing_image": (os.path.basename(image), image_file.read())}
+        else:
+            files = {"existing_image": ("sketch.png", image)}
+        PAYLOAD_BYTES.observe(len(files["existing_image"][1]), kind="convert_upload")
+
+        data = {"output_type": "url", "description": description}
+        headers = {"Authorization": f"Bearer {self.api_key}"}
+
+        response = self.http.post(
+            self.API_URL,
+            files=files,
+            data=data,
+            headers=headers
+        )
+        response.raise_for_status()
+        return response
 
     @staticmethod
     def _extract_image_url(response: requests.Response) -> str:
@@ -0,0 +1,198 @@
+import json
+import os
+import threading
+from io import BytesIO
+from itertools import combinations
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from PIL import Image, ImageOps
+
+HASH_BITS = 64
+CHUNK_BITS = 16
+CHUNK_COUNT = HASH_BITS // CHUNK_BITS
+CHUNK_MASK = (1 << CHUNK_BITS) - 1
+
+
+def dhash(image_bytes: bytes) -> int:
+    """
+    Compute a 64-bit difference hash of a sketch.
+
+    Transparent pixels are flattened onto white and the drawing is cropped to its
+    content box first, so the hash ignores canvas size and empty margins.
+
+    Args:
+        image_bytes (bytes): Encoded image data.
+
+    Returns:
+        int: The 64-bit perceptual hash.
+    """
+    image = Image.open(BytesIO(image_bytes))
+    if image.mode in ("RGBA", "LA", "P"):
+        image = image.convert("RGBA")
+    image.thumbnail((128, 128), Image.Resampling.BOX)
+    if image.mode == "RGBA":
+        background = Image.new("RGBA", image.size, (255, 255, 255, 255))
+        image = Image.alpha_composite(background, image)
+    gray = image.convert("L")
+    bbox = _ink_bbox(ImageOps.invert(gray))
+    if bbox:
+        gray = gray.crop(bbox)
+    pixels = list(gray.resize((9, 8), Image.Resampling.LANCZOS).getdata())
+    value = 0
+    for row in range(8):
+        for col in range(8):
+            left = pixels[row * 9 + col]
+            right = pixels[row * 9 + col + 1]
+            value = (value << 1) | (left > right)
+    return value
+
+
+def _ink_bbox(ink: Image.Image, trim: float = 0.01) -> Optional[Tuple[int, int, int, int]]:
+    """
+    Bounding box of the drawn content, trimming `trim` of the ink mass on each side
+    so that stray specks far from the drawing do not stretch the box.
+    """
+    width, height = ink.size
+    data = ink.getdata()
+    rows = [0] * height
+    cols = [0] * width
+    for i, value in enumerate(data):
+        if value:
+            rows[i // width] += value
+            cols[i % width] += value
+    total = sum(rows)
+    if not total:
+        return None
+    top, bottom = _trimmed_span(rows, total * trim)
+    left, right = _trimmed_span(cols, total * trim)
+    return left, top, right + 1, bottom + 1
+
+
+def _trimmed_span(mass: List[int], cut: float) -> Tuple[int, int]:
+    start, acc = 0, 0
+    while acc + mass[start] <= cut:
+        acc += mass[start]
+        start += 1
+    end, acc = len(mass) - 1, 0
+    while acc + mass[end] <= cut:
+        acc += mass[end]
+        end -= 1
+    return start, max(start, end)
+
+
+class SketchIndex:
+    """
+    A multi-index hash table for Hamming-distance lookups over sketch hashes.
+
+    Each 64-bit hash is split into four 16-bit chunks with one table per chunk. If two
+    hashes are within distance r, at least one chunk differs by at most r // 4 bits, so a
+    lookup only probes chunk values in that small neighbourhood instead of scanning
+    every entry.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        """
+        Initialize the SketchIndex and load any persisted entries.
+
+        Args:
+            path (str, optional): Append-only JSONL file backing the index. None keeps it in memory.
+        """
+        self.path = path
+        self._tables: List[Dict[int, List[int]]] = [{} for _ in range(CHUNK_COUNT)]
+        self._entries: Dict[int, List[str]] = {}
+        self._lock = threading.Lock()
+        if path and os.path.exists(path):
+            self._load()
+
+    def __len__(self) -> int:
+        return sum(len(uuids) for uuids in self._entries.values())
+
+    def add(self, phash: int, data_uuid: str) -> None:
+        """Add a hash for an archived entry and persist it."""
+        with self._lock:
+            self._insert(phash, data_uuid)
+            if self.path:
+                os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps({"uuid": data_uuid, "hash": f"{phash:016x}"}) + "\n")
+
+    def nearest(self, phash: int, max_distance: int) -> Optional[Tuple[str, int]]:
+        """
+        Find the closest archived entry within a Hamming distance.
+
+        Args:
+            phash (int): Hash of the query sketch.
+            max_distance (int): Maximum Hamming distance to accept.
+
+        Returns:
+            Optional[Tuple[str, int]]: The (uuid, distance) of the closest entry, or None.
+        """
+        chunk_radius = max_distance // CHUNK_COUNT
+        best: Optional[Tuple[str, int]] = None
+        seen = set()
+        with self._lock:
+            for i, chunk in enumerate(self._chunks(phash)):
+                table = self._tables[i]
+                for probe in self._neighbours(chunk, chunk_radius):
+                    for candidate in table.get(probe, ()):
+                        if candidate in seen:
+                            continue
+                        seen.add(candidate)
+                        distance = (candidate ^ phash).bit_count()
+                        if distance <= max_distance and (best is None or distance < best[1]):
+                            best = (self._entries[candidate][-1], distance)
+                            if distance == 0:
+                                return best
+        return best
+
+    def rebuild(self, data_dir: str = os.path.join("storage", "data")) -> int:
+        """
+        Re-index every original.png under the data directory, replacing the index file.
+
+        Args:
+            data_dir (str): Directory holding one sub-directory per archived UUID.
+
+        Returns:
+            int: The number of indexed entries.
+        """
+        with self._lock:
+            self._tables = [{} for _ in range(CHUNK_COUNT)]
+            self._entries = {}
+            if self.path and os.path.exists(self.path):
+                os.remove(self.path)
+        for data_uuid in sorted(os.listdir(data_dir)):
+            original_path = os.path.join(data_dir, data_uuid, "original.png")
+            if os.path.isfile(original_path):
+                with open(original_path, "rb") as f:
+                    self.add(dhash(f.read()), data_uuid)
+        return len(self)
+
+    def _insert(self, phash: int, data_uuid: str) -> None:
+        if phash not in self._entries:
+            self._entries[phash] = []
+            for i, chunk in enumerate(self._chunks(phash)):
+                self._tables[i].setdefault(chunk, []).append(phash)
+        self._entries[phash].append(data_uuid)
+
+    def _load(self) -> None:
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    record = json.loads(line)
+                    self._insert(int(record["hash"], 16), record["uuid"])
+
+    @staticmethod
+    def _chunks(phash: int) -> Iterator[int]:
+        for i in range(CHUNK_COUNT):
+            yield (phash >> (i * CHUNK_BITS)) & CHUNK_MASK
+
+    @staticmethod
+    def _neighbours(chunk: int, radius: int) -> Iterator[int]:
+        """Yield every chunk value within the given Hamming radius."""
+        yield chunk
+        for r in range(1, radius + 1):
+            for bits in combinations(range(CHUNK_BITS), r):
+                mask = 0
+                for bit in bits:
+                    mask |= 1 << bit
+                yield chunk ^ mask
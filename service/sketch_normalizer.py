@@ -0,0 +1,109 @@
+import os
+from io import BytesIO
+from typing import Optional
+
+from PIL import Image
+
+from .telemetry import stage
+
+
+class SketchNormalizer:
+    """Shrinks sketches before they are uploaded to the WorqHat APIs."""
+
+    COLOR_MODES = ("grayscale", "1bit", "keep")
+
+    def __init__(self, enabled: Optional[bool] = None, max_edge: Optional[int] = None,
+                 color_mode: Optional[str] = None, margin: Optional[int] = None):
+        """
+        Initialize the SketchNormalizer.
+
+        Args:
+            enabled (bool, optional): Apply normalization (SKETCH_NORMALIZE, true).
+            max_edge (int, optional): Longest edge after downscaling (SKETCH_MAX_EDGE, 1024).
+            color_mode (str, optional): "grayscale", "1bit" or "keep" (SKETCH_COLOR_MODE, grayscale).
+            margin (int, optional): Padding kept around the cropped drawing (SKETCH_CROP_MARGIN, 16).
+
+        Raises:
+            ValueError: If the color mode is unknown.
+        """
+        self.enabled = enabled if enabled is not None \
+            else os.getenv("SKETCH_NORMALIZE", "true").lower() == "true"
+        self.max_edge = max_edge or int(os.getenv("SKETCH_MAX_EDGE", 1024))
+        self.color_mode = color_mode or os.getenv("SKETCH_COLOR_MODE", "grayscale").lower()
+        self.margin = margin if margin is not None else int(os.getenv("SKETCH_CROP_MARGIN", 16))
+        if self.color_mode not in self.COLOR_MODES:
+            raise ValueError(f"Unknown SKETCH_COLOR_MODE: {self.color_mode}")
+
+    def normalize(self, image_bytes: bytes) -> bytes:
+        """
+        Crop empty margins, downscale, reduce colors and re-encode an optimized PNG.
+
+        Args:
+            image_bytes (bytes): The decoded sketch.
+
+        Returns:
+            bytes: The normalized PNG, or the input if normalization is disabled or
+                would not make it smaller.
+
+        Raises:
+            ValueError: If the bytes are not a readable image.
+        """
+        if not self.enabled:
+            return image_bytes
+        with stage("normalize"):
+            return self._normalize(image_bytes)
+
+    def _normalize(self, image_bytes: bytes) -> bytes:
+        try:
+            image = Image.open(BytesIO(image_bytes))
+            image.load()
+        except OSError as e:
+            raise ValueError("Invalid image data") from e
+
+        image = self._flatten(image, grayscale=self.color_mode != "keep")
+        image = self._crop(image)
+        image.thumbnail((self.max_edge, self.max_edge), Image.Resampling.LANCZOS)
+        image = self._reduce_colors(image)
+
+        buffer = BytesIO()
+        if image.mode == "P":
+            image.save(buffer, format="PNG", optimize=True, bits=4)
+        else:
+            image.save(buffer, format="PNG", optimize=True)
+        normalized = buffer.getvalue()
+        return normalized if len(normalized) < len(image_bytes) else image_bytes
+
+    @staticmethod
+    def _flatten(image: Image.Image, grayscale: bool) -> Image.Image:
+        """Composite transparent canvases onto white, converting to grayscale early when possible."""
+        mode = "L" if grayscale else "RGB"
+        if image.mode in ("RGBA", "LA", "P"):
+            image = image.convert("RGBA")
+            background = Image.new(mode, image.size, 255 if grayscale else (255, 255, 255))
+            background.paste(image.convert(mode), mask=image.getchannel("A"))
+            return background
+        return image.convert(mode)
+
+    def _crop(self, image: Image.Image) -> Image.Image:
+        """Crop to the drawn content plus a margin."""
+        ink = image.convert("L").point(lambda value: 255 if value < 247 else 0)
+        bbox = ink.getbbox()
+        if not bbox:
+            return image
+        left, top, right, bottom = bbox
+        return image.crop((
+            max(left - self.margin, 0),
+            max(top - self.margin, 0),
+            min(right + self.margin, image.width),
+            min(bottom + self.margin, image.height),
+        ))
+
+    def _reduce_colors(self, image: Image.Image) -> Image.Image:
+        """Reduce line art to 16 gray levels (4-bit PNG) or to 1-bit black and white."""
+        if self.color_mode == "grayscale":
+            image = image.point(lambda value: value >> 4).convert("P")
+            image.putpalette([level * 17 for level in range(16) for _ in range(3)])
+            return image
+        if self.color_mode == "1bit":
+            return image.point(lambda value: 255 if value >= 128 else 0).convert("1", dither=Image.Dither.NONE)
+        return image
@@ -0,0 +1,143 @@
+import contextvars
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Optional, Set, Tuple, TypeVar
+
+T = TypeVar("T")
+
+# words that say nothing about what a sketch shows
+STOPWORDS = frozenset("""
+a an and are as at be by for from has in is it its of on or that the this to with
+image picture sketch drawing shows showing depicts depicting there which while
+""".split())
+
+
+class SpeculationBudget:
+    """
+    A token bucket capping extra conversion calls.
+
+    Every pipeline run earns `max_extra_ratio` tokens (up to `burst`), every speculative
+    draft costs one token, and drafts that are kept are refunded, so wasted drafts stay
+    below `max_extra_ratio` conversions per run on average.
+    """
+
+    def __init__(self, max_extra_ratio: float, burst: float):
+        self.max_extra_ratio = max_extra_ratio
+        self.burst = burst
+        self._tokens = burst
+        self._lock = threading.Lock()
+
+    def record_run(self) -> None:
+        with self._lock:
+            self._tokens = min(self.burst, self._tokens + self.max_extra_ratio)
+
+    def try_acquire(self) -> bool:
+        with self._lock:
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+    def refund(self) -> None:
+        with self._lock:
+            self._tokens = min(self.burst, self._tokens + 1)
+
+
+class SpeculativeConverter:
+    """Runs a draft conversion in parallel with the description call."""
+
+    def __init__(self, enabled: Optional[bool] = None, match_threshold: Optional[float] = None,
+                 max_extra_ratio: Optional[float] = None, burst: Optional[float] = None,
+                 workers: Optional[int] = None):
+        """
+        Initialize the SpeculativeConverter.
+
+        Args:
+            enabled (bool, optional): Speculate at all (SPECULATIVE_MODE, false).
+            match_threshold (float, optional): Minimum share of the key words of the shorter text
+                (the draft prompt or the final description) found in the other one to keep the
+                draft (SPECULATIVE_MATCH_THRESHOLD, 0.6).
+            max_extra_ratio (float, optional): Wasted drafts allowed per pipeline run
+                (SPECULATIVE_MAX_EXTRA_RATIO, 0.25).
+            burst (float, optional): Wasted drafts allowed in a burst (SPECULATIVE_BURST, 5).
+            workers (int, optional): Threads running draft conversions (SPECULATIVE_WORKERS, 4).
+        """
+        self.enabled = enabled if enabled is not None \
+            else os.getenv("SPECULATIVE_MODE", "false").lower() == "true"
+        self.match_threshold = match_threshold or float(os.getenv("SPECULATIVE_MATCH_THRESHOLD", 0.6))
+        self.budget = SpeculationBudget(
+            max_extra_ratio or float(os.getenv("SPECULATIVE_MAX_EXTRA_RATIO", 0.25)),
+            burst or float(os.getenv("SPECULATIVE_BURST", 5)),
+        )
+        self._executor = ThreadPoolExecutor(
+            max_workers=workers or int(os.getenv("SPECULATIVE_WORKERS", 4)),
+            thread_name_prefix="speculative",
+        )
+        self._stats = {"drafts": 0, "kept": 0, "wasted": 0, "skipped": 0}
+        self._lock = threading.Lock()
+
+    def run(self, describe: Callable[[], str], convert: Callable[[str], T],
+            draft_prompt: Optional[str]) -> Tuple[str, T]:
+        """
+        Describe and convert a sketch, speculatively converting with `draft_prompt` meanwhile.
+
+        Args:
+            describe (Callable[[], str]): Produces the final description.
+            convert (Callable[[str], T]): Converts the sketch with a description, e.g. returning the image URL.
+            draft_prompt (str, optional): Prompt for the draft, e.g. the description of a similar sketch.
+
+        Returns:
+            Tuple[str, T]: The final description and the conversion.
+        """
+        self.budget.record_run()
+        if not self.enabled or not draft_prompt:
+            description = describe()
+            return description, convert(description)
+        if not self.budget.try_acquire():
+            self._count("skipped")
+            description = describe()
+            return description, convert(description)
+
+        self._count("drafts")
+        draft = self._executor.submit(contextvars.copy_context().run, convert, draft_prompt)
+        description = describe()
+        if self.matches(description, draft_prompt):
+            try:
+                conversion = draft.result()
+            except Exception:
+                pass
+            else:
+                self.budget.refund()
+                self._count("kept")
+                return description, conversion
+        self._count("wasted")
+        return description, convert(description)
+
+    def matches(self, description: str, draft_prompt: str) -> bool:
+        """
+        Tell whether a draft made from `draft_prompt` fits `description`.
+
+        Compares the key words (stopwords removed) of both texts by the share of the smaller set
+        found in the larger one, so a short baseline prompt whose subjects all appear in a
+        paragraph-long description matches it, which Jaccard similarity never allows.
+        """
+        words_a = self._key_words(description)
+        words_b = self._key_words(draft_prompt)
+        if not words_a or not words_b:
+            return False
+        return len(words_a & words_b) / min(len(words_a), len(words_b)) >= self.match_threshold
+
+    @staticmethod
+    def _key_words(text: str) -> Set[str]:
+        return {word for word in re.findall(r"\w+", text.lower()) if word not in STOPWORDS and len(word) > 1}
+
+    def stats(self) -> Dict[str, int]:
+        """Return counters of drafts issued, kept, wasted and skipped for budget."""
+        with self._lock:
+            return dict(self._stats)
+
+    def _count(self, counter: str) -> None:
+        with self._lock:
+            self._stats[counter] += 1
@@ -0,0 +1,216 @@
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple, Union
+
+from .s3_uploader import S3Uploader
+
+UploadItem = Tuple[Union[str, bytes], str, str]
+
+logger = logging.getLogger(__name__)
+
+
+class UploadStage:
+    """
+    Uploads pipeline artifacts to S3 concurrently.
+
+    In synchronous mode `upload_batch` waits for every upload and raises on failure. In
+    asynchronous mode each upload is first recorded in a durable outbox directory (in-memory
+    content is written there alongside the record) and the call returns immediately;
+    failed uploads stay in the outbox and are retried with backoff, including after a
+    restart. Several processes may share one outbox: a record is claimed by renaming it
+    before it is uploaded, so only one of them uploads it. Records that still fail after
+    `max_attempts` tries are moved to the `failed/` subdirectory.
+    """
+
+    def __init__(self, uploader: S3Uploader, concurrency: Optional[int] = None,
+                 async_mode: Optional[bool] = None, outbox_dir: Optional[str] = None):
+        """
+        Initialize the UploadStage.
+
+        Args:
+            uploader (S3Uploader): The uploader used for every transfer.
+            concurrency (int, optional): Parallel uploads (S3_UPLOAD_CONCURRENCY, 5).
+            async_mode (bool, optional): Return before uploads finish (S3_UPLOAD_ASYNC, false).
+            outbox_dir (str, optional): Directory for pending uploads (S3_OUTBOX_DIR, storage/outbox).
+        """
+        self.uploader = uploader
+        self.concurrency = concurrency or int(os.getenv("S3_UPLOAD_CONCURRENCY", 5))
+        self.async_mode = async_mode if async_mode is not None \
+            else os.getenv("S3_UPLOAD_ASYNC", "false").lower() == "true"
+        self.outbox_dir = outbox_dir or os.getenv("S3_OUTBOX_DIR", os.path.join("storage", "outbox"))
+        self.retry_interval = float(os.getenv("S3_OUTBOX_RETRY_INTERVAL", 10))
+        self.max_backoff = float(os.getenv("S3_OUTBOX_MAX_BACKOFF", 600))
+        self.max_attempts = int(os.getenv("S3_OUTBOX_MAX_ATTEMPTS", 20))
+        self.failed_dir = os.path.join(self.outbox_dir, "failed")
+        self._executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="s3-upload")
+        self._in_flight = set()
+        self._lock = threading.Lock()
+        if self.async_mode:
+            os.makedirs(self.outbox_dir, exist_ok=True)
+            # claims under this process's PID are left over from an earlier process that had it
+            self._release_stale_claims(include_own=True)
+            threading.Thread(target=self._retry_loop, name="s3-outbox", daemon=True).start()
+
+    def upload_batch(self, items: List[UploadItem]) -> List[str]:
+        """
+        Upload several files concurrently.
+
+        Args:
+            items (List[UploadItem]): (source, s3_directory_path, file_name) tuples, where source
+                is a local file path or the raw content.
+
+        Returns:
+            List[str]: The public URLs of the uploaded files, in input order.
+
+        Raises:
+            Exception: In synchronous mode, the first upload error.
+        """
+        if self.async_mode:
+            for item in items:
+                self._dispatch(self._write_record(item))
+            return [self.uploader.public_url(s3_dir, filename) for _, s3_dir, filename in items]
+
+        futures = [self._executor.submit(contextvars.copy_context().run, self.uploader.upload, *item)
+                   for item in items]
+        return [future.result() for future in futures]
+
+    def pending(self) -> int:
+        """Return the number of uploads waiting in the outbox, including those being uploaded."""
+        if not self.async_mode:
+            return 0
+        return sum(1 for name in os.listdir(self.outbox_dir) if name.endswith(".json") or ".json.claimed." in name)
+
+    def _write_record(self, item: UploadItem) -> str:
+        source, s3_dir, filename = item
+        record_id = str(uuid.uuid4())
+        record = {"local_path": source, "s3_dir": s3_dir, "filename": filename,
+                  "owned": False, "attempts": 0, "next_attempt_at": 0}
+        if not isinstance(source, str):
+            payload_path = os.path.join(self.outbox_dir, f"{record_id}.bin")
+            with open(payload_path, "wb") as f:
+                f.write(source)
+            record.update(local_path=payload_path, owned=True)
+        record_path = os.path.join(self.outbox_dir, f"{record_id}.json")
+        self._save_record(record_path, record)
+        return record_path
+
+    def _dispatch(self, record_path: str) -> None:
+        with self._lock:
+            if record_path in self._in_flight:
+                return
+            self._in_flight.add(record_path)
+        self._executor.submit(self._process, record_path)
+
+    def _process(self, record_path: str) -> None:
+        try:
+            claimed_path = self._claim(record_path)
+            if claimed_path is None:
+                return
+            record = self._load_record(claimed_path)
+            if record is None:
+                return
+            try:
+                self.uploader.upload(record["local_path"], record["s3_dir"], record["filename"])
+            except FileNotFoundError as e:
+                logger.warning("Dropping outbox upload %s: %s", record_path, e)
+                self._remove_record(claimed_path, record)
+            except Exception as e:
+                record["attempts"] += 1
+                record["next_attempt_at"] = time.time() + min(self.max_backoff, 2 ** record["attempts"])
+                record["last_error"] = str(e)
+                if record["attempts"] >= self.max_attempts:
+                    logger.error("Giving up on outbox upload %s after %d attempts: %s",
+                                 record_path, record["attempts"], e)
+                    self._dead_letter(claimed_path, record)
+                else:
+                    self._save_record(claimed_path, record)
+                    os.rename(claimed_path, record_path)
+            else:
+                self._remove_record(claimed_path, record)
+        finally:
+            with self._lock:
+                self._in_flight.discard(record_path)
+
+    @staticmethod
+    def _claim(record_path: str) -> Optional[str]:
+        """Take a record for this process, or return None if another process got it first."""
+        claimed_path = f"{record_path}.claimed.{os.getpid()}"
+        try:
+            os.rename(record_path, claimed_path)
+        except FileNotFoundError:
+            return None
+        return claimed_path
+
+    def _release_stale_claims(self, include_own: bool = False) -> None:
+        """Put back records claimed by processes that died before finishing them."""
+        for name in os.listdir(self.outbox_dir):
+            record_name, _, pid = name.partition(".claimed.")
+            if not pid.isdigit():
+                continue
+            try:
+                if int(pid) == os.getpid():
+                    if not include_own:
+                        continue
+                else:
+                    os.kill(int(pid), 0)
+                    continue
+            except ProcessLookupError:
+                pass
+            except PermissionError:
+                continue  # alive, owned by another user
+            try:
+                os.rename(os.path.join(self.outbox_dir, name), os.path.join(self.outbox_dir, record_name))
+            except FileNotFoundError:
+                pass  # another process put it back first
+
+    def _dead_letter(self, claimed_path: str, record: Dict) -> None:
+        os.makedirs(self.failed_dir, exist_ok=True)
+        record_name = os.path.basename(claimed_path).partition(".claimed.")[0]
+        if record.get("owned") and os.path.exists(record["local_path"]):
+            payload_path = os.path.join(self.failed_dir, os.path.basename(record["local_path"]))
+            os.replace(record["local_path"], payload_path)
+            record["local_path"] = payload_path
+        self._save_record(os.path.join(self.failed_dir, record_name), record)
+        os.remove(claimed_path)
+
+    def _retry_loop(self) -> None:
+        while True:
+            now = time.time()
+            self._release_stale_claims()
+            for name in os.listdir(self.outbox_dir):
+                if not name.endswith(".json"):
+                    continue
+                record_path = os.path.join(self.outbox_dir, name)
+                record = self._load_record(record_path)
+                if record is not None and record["next_attempt_at"] <= now:
+                    self._dispatch(record_path)
+            time.sleep(self.retry_interval)
+
+    @staticmethod
+    def _remove_record(record_path: str, record: Dict) -> None:
+        for path in ([record["local_path"]] if record.get("owned") else []) + [record_path]:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    @staticmethod
+    def _load_record(record_path: str) -> Optional[Dict]:
+        try:
+            with open(record_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    @staticmethod
+    def _save_record(record_path: str, record: Dict) -> None:
+        tmp_path = f"{record_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(record, f)
+        os.replace(tmp_path, record_path)
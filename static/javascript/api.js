@@ -1,20 +1,15 @@
 const API_ENDPOINT = '/magic';
+const STREAM_ENDPOINT = '/magic/stream';
 
 /**
  * Sends an image to the server for processing.
- * @param {string} image - Base64 encoded image data.
+ * @param {Blob|string} image - PNG blob (sent as multipart/form-data) or base64 encoded image data.
  * @returns {Promise<Object>} The processed image data.
  * @throws {Error} If the network response is not ok.
  */
 async function magic(image) {
   try {
-    const response = await fetch(API_ENDPOINT, {
-      method: 'POST',
-      headers: {
-        'Content-Type': 'application/json',
-      },
-      body: JSON.stringify({ image }),
-    });
+    const response = await fetch(API_ENDPOINT, buildRequest(image));
 
     if (!response.ok) {
       throw new Error(`HTTP error! status: ${response.status}`);
@@ -27,3 +22,80 @@ async function magic(image) {
   }
 }
 
+/**
+ * Sends an image for processing and reports pipeline stages as they complete.
+ * @param {Blob|string} image - PNG blob or base64 encoded image data.
+ * @param {function(string, Object): void} onEvent - Called with each event name and its data.
+ * @returns {Promise<Object>} The final processed image data.
+ * @throws {Error} If the network response is not ok or the pipeline fails.
+ */
+async function magicStream(image, onEvent) {
+  const response = await fetch(STREAM_ENDPOINT, buildRequest(image));
+
+  if (!response.ok) {
+    throw new Error(`HTTP error! status: ${response.status}`);
+  }
+
+  const reader = response.body.pipeThrough(new TextDecoderStream()).getReader();
+  let buffer = '';
+  for (;;) {
+    const { value, done } = await reader.read();
+    if (done) {
+      break;
+    }
+    buffer += value;
+    let boundary;
+    while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+      const { event, data } = parseEvent(buffer.slice(0, boundary));
+      buffer = buffer.slice(boundary + 2);
+      if (event === 'result') {
+        // release the connection; the server may still hold it open for a 'scored' event
+        reader.cancel();
+        return data;
+      }
+      if (event === 'error') {
+        throw new Error(data.error);
+      }
+      onEvent(event, data);
+    }
+  }
+  throw new Error('Stream ended without a result');
+}
+
+/**
+ * Parses a single Server-Sent Events block.
+ * @param {string} block - The raw event text.
+ * @returns {{event: string, data: Object}} The event name and decoded data.
+ */
+function parseEvent(block) {
+  let event = 'message';
+  let data = '';
+  for (const line of block.split('\n')) {
+    if (line.startsWith('event:')) {
+      event = line.slice(6).trim();
+    } else if (line.startsWith('data:')) {
+      data += line.slice(5).trim();
+    }
+  }
+  return { event, data: data ? JSON.parse(data) : {} };
+}
+
+/**
+ * Builds fetch options for an image payload.
+ * @param {Blob|string} image - PNG blob or base64 encoded image data.
+ * @returns {Object} The fetch options.
+ */
+function buildRequest(image) {
+  if (image instanceof Blob) {
+    const body = new FormData();
+    body.append('image', image, 'sketch.png');
+    return { method: 'POST', body };
+  }
+  return {
+    method: 'POST',
+    headers: {
+      'Content-Type': 'application/json',
+    },
+    body: JSON.stringify({ image }),
+  };
+}
@@ -28,10 +28,24 @@ document.addEventListener('DOMContentLoaded', () => {
     resetUI();
 
     const canvas = document.querySelector("#drawing-tool canvas.lower-canvas");
-    const base64image = canvas.toDataURL("image/png");
+    const image = await new Promise((resolve) => canvas.toBlob(resolve, "image/png"));
+
+    let streamedDescription = '';
+    const onEvent = (event, data) => {
+      if (event === 'description_delta') {
+        streamedDescription += data.text;
+        imageDescription.innerHTML = converter.makeHtml(streamedDescription);
+      } else if (event === 'description') {
+        imageDescription.innerHTML = converter.makeHtml(data.description);
+      } else if (event === 'converted') {
+        magicImage.src = data.image;
+        magicImage.hidden = false;
+        magicImage.classList.remove('loader');
+      }
+    };
 
     try {
-      const response = await magic(base64image);
+      const response = await magicStream(image, onEvent);
       updateUI(response);
     } catch (error) {
       console.error('Error processing image:', error);
@@ -0,0 +1,29 @@
+import unittest
+
+import numpy as np
+
+from metrics.fid_metric import FIDMetric
+
+
+class CalculateFidTest(unittest.TestCase):
+    def setUp(self):
+        # the embedder is only needed to extract features
+        self.metric = FIDMetric(embedder=object())
+        rng = np.random.default_rng(0)
+        features = rng.standard_normal((2, 512))
+        self.features = features / np.linalg.norm(features, axis=1, keepdims=True)
+
+    def test_single_sample_score_matches_archived_results(self):
+        # value of the scipy.linalg.sqrtm implementation with its 1e-6 * I regularization
+        score = self.metric.calculate_fid(self.features[:1], self.features[1:])
+
+        self.assertAlmostEqual(score, 0.8816824626117619, places=9)
+
+    def test_identical_features_score_below_zero_by_the_regularization(self):
+        score = self.metric.calculate_fid(self.features[:1], self.features[:1])
+
+        self.assertAlmostEqual(score, -2 * 512 * np.sqrt(FIDMetric.EPS), places=9)
+
+
+if __name__ == "__main__":
+    unittest.main()
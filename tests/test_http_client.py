@@ -0,0 +1,60 @@
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from service.http_client import HttpClient
+
+
+class ScriptedHandler(BaseHTTPRequestHandler):
+    """Answers each request with the next (status, headers) of the server's script."""
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self.server.requests.append(time.monotonic())
+        status, headers = self.server.script.pop(0) if self.server.script else (200, {})
+        self.send_response(status)
+        for name, value in {**headers, "Content-Length": "0"}.items():
+            self.send_header(name, value)
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+class HttpClientRetryTest(unittest.TestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), ScriptedHandler)
+        self.server.script, self.server.requests = [], []
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f"http://127.0.0.1:{self.server.server_port}/"
+        self.client = HttpClient(max_retries=2, backoff_factor=0.01)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_post_is_retried_after_429_honoring_retry_after(self):
+        self.server.script = [(429, {"Retry-After": "1"}), (200, {})]
+
+        response = self.client.post(self.url, json={"prompt": "cat"})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(self.server.requests), 2)
+        self.assertGreaterEqual(self.server.requests[1] - self.server.requests[0], 1)
+
+    def test_post_is_retried_after_503_with_retry_after(self):
+        self.server.script = [(503, {"Retry-After": "0"}), (200, {})]
+
+        self.assertEqual(self.client.post(self.url, json={}).status_code, 200)
+        self.assertEqual(len(self.server.requests), 2)
+
+    def test_post_is_not_retried_after_plain_5xx(self):
+        self.server.script = [(502, {}), (200, {})]
+
+        self.assertEqual(self.client.post(self.url, json={}).status_code, 502)
+        self.assertEqual(len(self.server.requests), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,61 @@
+import io
+import unittest
+
+import requests
+
+from service.image_describer import ImageDescriber
+
+
+class FakeClient:
+    """Returns a streamed 200 response with the given body, delivered in the given pieces."""
+
+    def __init__(self, pieces):
+        self.pieces = pieces
+
+    def post(self, url, **kwargs):
+        response = requests.Response()
+        response.status_code = 200
+        response.encoding = "utf-8"
+        response.raw = io.BytesIO()
+        response.iter_content = lambda chunk_size=1, decode_unicode=False: iter(
+            piece if decode_unicode else piece.encode("utf-8") for piece in self.pieces)
+        return response
+
+
+def describe(pieces):
+    chunks = []
+    description = ImageDescriber(api_key="test", http_client=FakeClient(pieces)).get_description(
+        b"png", chunks.append)
+    return description, chunks
+
+
+class StreamedDescriptionTest(unittest.TestCase):
+    def test_spaces_at_chunk_boundaries_are_kept(self):
+        description, chunks = describe([
+            "data: A cat\n\n",
+            "data:  sitting on\n\n",
+            "data:  a chair.\n\ndata: [DONE]\n\n",
+        ])
+
+        self.assertEqual(chunks, ["A cat", " sitting on", " a chair."])
+        self.assertEqual(description, "A cat sitting on a chair.")
+
+    def test_multi_line_data_is_joined_with_newlines(self):
+        description, _ = describe(["data: First line\r\ndata:\r\n", "data: Third line\r\n\r\n"])
+
+        self.assertEqual(description, "First line\n\nThird line")
+
+    def test_events_split_across_network_reads(self):
+        description, _ = describe(["data: A c", "at\n", "\nda", "ta:  runs\n\n"])
+
+        self.assertEqual(description, "A cat runs")
+
+    def test_json_events_and_comments(self):
+        description, _ = describe([": keep-alive\n\n", 'data: {"content": "A dog "}\n\n',
+                                   'data: {"content": "barks"}\n\n', "data: [DONE]\n\n"])
+
+        self.assertEqual(description, "A dog barks")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,42 @@
+import unittest
+
+from service.speculative_converter import SpeculativeConverter
+
+BASELINE_PROMPT = "A cat sitting on a wooden chair"
+DESCRIPTION = (
+    "The sketch shows a small cat sitting on a wooden chair next to a window. The cat has "
+    "pointed ears and a long curled tail, and the chair has four straight legs and a tall "
+    "back. Light lines suggest curtains on both sides of the window."
+)
+
+
+class SpeculativeConverterTest(unittest.TestCase):
+    def setUp(self):
+        self.converter = SpeculativeConverter(enabled=True, workers=1)
+        self.converted = []
+
+    def convert(self, prompt):
+        self.converted.append(prompt)
+        return f"converted:{prompt}"
+
+    def test_baseline_draft_is_kept_for_a_long_matching_description(self):
+        description, conversion = self.converter.run(lambda: DESCRIPTION, self.convert, BASELINE_PROMPT)
+
+        self.assertEqual(description, DESCRIPTION)
+        self.assertEqual(conversion, f"converted:{BASELINE_PROMPT}")
+        self.assertEqual(self.converted, [BASELINE_PROMPT])
+        self.assertEqual(self.converter.stats()["kept"], 1)
+
+    def test_draft_is_converted_again_for_another_subject(self):
+        description = "A red sports car parked in front of a tall glass building at night."
+        _, conversion = self.converter.run(lambda: description, self.convert, BASELINE_PROMPT)
+
+        self.assertEqual(conversion, f"converted:{description}")
+        self.assertEqual(self.converter.stats()["wasted"], 1)
+
+    def test_stopwords_alone_do_not_match(self):
+        self.assertFalse(self.converter.matches(DESCRIPTION, "A sketch of the image"))
+
+
+if __name__ == "__main__":
+    unittest.main()
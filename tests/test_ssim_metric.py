@@ -0,0 +1,51 @@
+import os
+import tempfile
+import unittest
+
+import cv2
+import numpy as np
+
+from metrics.ssim_metric import SSIMMetric
+
+try:
+    from skimage.metrics import structural_similarity
+except ImportError:
+    structural_similarity = None
+
+
+def baseline_ssim(image1_path: str, image2_path: str) -> float:
+    """The scikit-image implementation SSIMMetric replaced."""
+    image1 = cv2.imread(image1_path, cv2.IMREAD_GRAYSCALE)
+    image2 = cv2.imread(image2_path, cv2.IMREAD_GRAYSCALE)
+    if image1.shape != image2.shape:
+        image2 = cv2.resize(image2, (image1.shape[1], image1.shape[0]))
+    score, _ = structural_similarity(image1, image2, full=True)
+    return float(score)
+
+
+@unittest.skipIf(structural_similarity is None, "scikit-image is not installed")
+class SSIMParityTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        rng = np.random.default_rng(0)
+        original = cv2.GaussianBlur(rng.integers(0, 256, (96, 128, 3), dtype=np.uint8), (7, 7), 2)
+        noisy = np.clip(original.astype(int) + rng.integers(-40, 40, original.shape), 0, 255).astype(np.uint8)
+        self.paths = {}
+        for name, image in (("original", original), ("noisy", noisy), ("resized", cv2.resize(noisy, (100, 75)))):
+            self.paths[name] = os.path.join(self.tmp.name, f"{name}.png")
+            cv2.imwrite(self.paths[name], image)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_scores_match_the_scikit_image_implementation(self):
+        metric = SSIMMetric(eval_size=0, window="uniform")
+        for name in ("noisy", "resized"):
+            with self.subTest(name):
+                expected = baseline_ssim(self.paths["original"], self.paths[name])
+                score = metric.compute_ssim(self.paths["original"], self.paths[name])
+                self.assertAlmostEqual(score, expected, delta=1e-6)
+
+
+if __name__ == "__main__":
+    unittest.main()